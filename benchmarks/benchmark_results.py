@@ -0,0 +1,86 @@
+"""
+Saving benchmark results, and comparing them against the results of a previous
+run, so that performance regressions are found before a release.
+"""
+import datetime
+import json
+import os
+import platform
+import subprocess
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def get_version():
+    try:
+        return subprocess.check_output(
+            ['git', 'describe', '--tags', '--always', '--dirty'],
+            stderr=subprocess.DEVNULL).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def new_results(**arguments):
+    """
+    Returns the results of a new run, with the version of the code and the
+    arguments that it was run with
+    """
+    results = {
+        'version': get_version(),
+        'date': datetime.datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'scenarios': {},
+    }
+    results.update(arguments)
+    return results
+
+
+def save(results, path):
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(results, baseline, threshold, metrics=(('p50', True),)):
+    """
+    Prints the change in each of `metrics` for each scenario against
+    `baseline`, and returns the scenarios that are more than `threshold`
+    worse. `metrics` is a list of (name, whether higher is worse).
+    """
+    regressions = []
+    print("\nCompared to {} ({}):".format(
+        baseline.get('version'), baseline.get('date')))
+    for name, result in sorted(results['scenarios'].items()):
+        previous = baseline['scenarios'].get(name)
+        if previous is None:
+            print("{:<60} new".format(name))
+            continue
+        changes = []
+        regressed = False
+        for metric, higher_is_worse in metrics:
+            if not previous.get(metric):
+                continue
+            if result.get(metric) is None:
+                regressed = True
+                changes.append("{} missing".format(metric))
+                continue
+            change = result[metric] / previous[metric] - 1
+            if (change if higher_is_worse else -change) > threshold:
+                regressed = True
+            changes.append("{} {:+7.1%}".format(metric, change))
+        if regressed:
+            regressions.append(name)
+        print("{:<60} {}{}".format(
+            name, "  ".join(changes), "  REGRESSION" if regressed else ""))
+    return regressions
@@ -0,0 +1,101 @@
+"""
+Measures how long it takes to start up the hub for management commands and
+Celery workers.
+
+Each scenario is run in a new Python process, so that nothing is already
+imported, and the wall clock time of the whole process is measured. The
+scenarios are run --repeat times, and the fastest and median times are
+reported, eg.
+
+    python benchmarks/import_time.py --repeat 10
+
+Run it before and after a change to compare. To see which imports are the
+slowest for a scenario, use --importtime, which runs the scenario once with
+python -X importtime, and prints the slowest cumulative imports.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SETUP = (
+    "import os; "
+    "os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ndoh_hub.settings'); "
+    "import django; django.setup(); ")
+
+SCENARIOS = [
+    ('django.setup', ['-c', SETUP]),
+    ('import ndoh_hub.utils', ['-c', SETUP + "import ndoh_hub.utils"]),
+    ('import tasks', [
+        '-c', SETUP + "import registrations.tasks, changes.tasks"]),
+    ('import urls', ['-c', SETUP + "import ndoh_hub.urls"]),
+    ('manage.py help', ['manage.py', 'help']),
+    ('manage.py check', ['manage.py', 'check']),
+    # What a Celery worker imports before it starts consuming tasks
+    ('worker boot', [
+        '-c', "from ndoh_hub.celery import app; "
+              "app.loader.import_default_modules()"]),
+]
+
+
+def run(args, extra=()):
+    env = dict(os.environ)
+    env.setdefault('DJANGO_SETTINGS_MODULE', 'ndoh_hub.settings')
+    start = time.time()
+    result = subprocess.run(
+        [sys.executable] + list(extra) + args, cwd=ROOT, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    elapsed = time.time() - start
+    if result.returncode != 0:
+        raise RuntimeError("{} failed:\n{}".format(
+            ' '.join(args), result.stderr.decode()))
+    return elapsed, result.stderr.decode()
+
+
+def print_importtime(stderr, count):
+    """
+    Prints the `count` imports with the highest cumulative time from the
+    output of python -X importtime
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        try:
+            _, cumulative, name = line[len('import time:'):].split('|')
+            imports.append((int(cumulative), name.strip()))
+        except ValueError:
+            continue
+    for cumulative, name in sorted(imports, reverse=True)[:count]:
+        print("  {:>8.1f}ms  {}".format(cumulative / 1000, name))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument(
+        '--scenario', action='append',
+        choices=[name for name, _ in SCENARIOS],
+        help="Only run the given scenarios. Can be repeated.")
+    parser.add_argument(
+        '--importtime', type=int, metavar='COUNT', default=0,
+        help="Print the COUNT slowest imports for each scenario")
+    args = parser.parse_args()
+
+    for name, scenario in SCENARIOS:
+        if args.scenario and name not in args.scenario:
+            continue
+        times = [run(scenario)[0] for _ in range(args.repeat)]
+        print("{:<24} min {:>7.1f}ms  median {:>7.1f}ms".format(
+            name, min(times) * 1000, statistics.median(times) * 1000))
+        if args.importtime:
+            _, stderr = run(scenario, extra=['-X', 'importtime'])
+            print_importtime(stderr, args.importtime)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,320 @@
+"""
+Load tests the HTTP endpoints that other services send us data on, reporting
+the throughput, latency percentiles and error rate of each endpoint.
+
+The endpoints are RegistrationPost, JembiAppRegistration, ChangePost,
+ReceiveWhatsAppEvent and JembiHelpdeskOutgoingView, each driven in turn with
+realistic payloads by --concurrency clients for --duration seconds.
+
+Run the deployment under test, eg. the Docker image, which runs gunicorn behind
+nginx, and its Celery workers, with the upstream services replaced by
+stand-ins. Start the stand-ins, which print the environment variables to
+configure the deployment and workers with, with
+
+    python benchmarks/ingest.py standins --latency 0.05 --port 9000
+
+Then, with the token of a user that has a source, and permission to add
+changes, run the load test from another machine, so that the clients don't
+compete with the deployment for CPU, with
+
+    python benchmarks/ingest.py run --url http://hub:8000 --token TOKEN \\
+        --output benchmarks/baselines/ingest.json
+
+To compare a run against the baseline, failing if any endpoint's p95 latency
+is more than --threshold higher, or its throughput more than --threshold lower
+
+    python benchmarks/ingest.py run --url http://hub:8000 --token TOKEN \\
+        --compare benchmarks/baselines/ingest.json
+
+Only compare results from the same deployment, stand-ins and arguments. The
+Jembi app registrations and changes are validated by the Celery workers, so
+make sure that they keep up, by watching the queue lengths, when the test runs
+for long.
+"""
+import argparse
+import datetime
+import random
+import statistics
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from urllib.parse import urljoin
+
+import requests
+
+import benchmark_results
+from benchmark_results import percentile
+from standin import start_standin
+
+SA_ID_NO = '8606045069081'
+
+
+def msisdn():
+    return '+2782{:07d}'.format(random.randint(0, 9999999))
+
+
+def today(weeks=0):
+    return (
+        datetime.date.today() + datetime.timedelta(weeks=weeks)).isoformat()
+
+
+def now():
+    return datetime.datetime.utcnow().isoformat() + 'Z'
+
+
+def registration():
+    return {
+        'reg_type': 'momconnect_prebirth',
+        'registrant_id': str(uuid.uuid4()),
+        'data': {
+            'operator_id': str(uuid.uuid4()),
+            'msisdn_registrant': msisdn(),
+            'msisdn_device': msisdn(),
+            'id_type': 'sa_id',
+            'sa_id_no': SA_ID_NO,
+            'mom_dob': '1989-01-01',
+            'language': 'eng_ZA',
+            'edd': today(weeks=20),
+            'faccode': '123456',
+            'consent': True,
+        },
+    }
+
+
+def jembi_registration():
+    return {
+        'external_id': uuid.uuid4().hex,
+        'mom_msisdn': msisdn(),
+        'hcw_msisdn': msisdn(),
+        'mom_id_type': 'sa_id',
+        'mom_sa_id_no': SA_ID_NO,
+        'mom_dob': '1989-01-01',
+        'mom_lang': 'eng_ZA',
+        'mom_edd': today(weeks=20),
+        'mom_consent': True,
+        'mom_pmtct': False,
+        'mom_whatsapp': True,
+        'clinic_code': '123456',
+        'mha': 1,
+        'created': now(),
+    }
+
+
+def change():
+    return {
+        'registrant_id': str(uuid.uuid4()),
+        'action': 'momconnect_change_language',
+        'data': {'language': 'zul_ZA'},
+    }
+
+
+def whatsapp_event():
+    return [{
+        'hook': {'event': 'message.direct_outbound.status'},
+        'data': {
+            'status': 'unsent',
+            'message_metadata': {'junebug_message_id': str(uuid.uuid4())},
+        },
+    }]
+
+
+def helpdesk_outgoing():
+    return {
+        'to': msisdn(),
+        'reply_to': "How do I register?",
+        'content': "Dial *134*550#",
+        'user_id': str(uuid.uuid4()),
+        'helpdesk_operator_id': 1,
+        'label': 'Registration',
+        'inbound_created_on': now(),
+        'outbound_created_on': now(),
+        'inbound_channel_id': str(uuid.uuid4()),
+    }
+
+
+# Each endpoint's path, payload, and whether the token is sent in the query
+# string, like the WhatsApp webhooks do
+ENDPOINTS = [
+    ('registration', '/api/v1/registration/', registration, False),
+    ('jembi_registration', '/api/v1/jembiregistration/', jembi_registration,
+     False),
+    ('change', '/api/v1/change/', change, False),
+    ('whatsapp_event', '/api/v1/whatsapp/event/', whatsapp_event, True),
+    ('helpdesk_outgoing', '/api/v1/jembi/helpdesk/outgoing/',
+     helpdesk_outgoing, False),
+]
+
+
+def run_client(session, url, payload, params, start, deadline, samples):
+    """
+    Posts payloads to `url` until `deadline`, recording the (latency, status)
+    of each request that was started after `start`
+    """
+    while time.perf_counter() < deadline:
+        data = payload()
+        began = time.perf_counter()
+        try:
+            status = session.post(
+                url, json=data, params=params, timeout=30).status_code
+        except requests.RequestException as e:
+            status = type(e).__name__
+        if began >= start:
+            samples.append((time.perf_counter() - began, status))
+
+
+def run_endpoint(args, path, payload, token_in_query):
+    url = urljoin(args.url, path)
+    params = {'token': args.token} if token_in_query else None
+    start = time.perf_counter() + args.warmup
+    deadline = start + args.duration
+    samples = []
+    threads = []
+    for _ in range(args.concurrency):
+        session = requests.Session()
+        if not token_in_query:
+            session.headers['Authorization'] = 'Token {}'.format(args.token)
+        thread = threading.Thread(target=run_client, args=(
+            session, url, payload, params, start, deadline, samples))
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+
+    latencies = [latency for latency, _ in samples]
+    statuses = Counter(str(status) for _, status in samples)
+    errors = sum(
+        count for status, count in statuses.items()
+        if not status.isdigit() or int(status) >= 400)
+    if not samples:
+        return {'requests': 0, 'errors': 0, 'statuses': {}}
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'error_rate': errors / len(samples),
+        'statuses': dict(statuses),
+        'throughput': len(samples) / args.duration,
+        'mean': statistics.mean(latencies),
+        'p50': percentile(latencies, 0.5),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+    }
+
+
+def run(args):
+    results = benchmark_results.new_results(
+        url=args.url, concurrency=args.concurrency, duration=args.duration)
+    print("{:<20} {:>9} {:>9} {:>9} {:>9} {:>7}".format(
+        'endpoint', 'per s', 'p50 ms', 'p95 ms', 'p99 ms', 'errors'))
+    for name, path, payload, token_in_query in ENDPOINTS:
+        if args.endpoint and name not in args.endpoint:
+            continue
+        result = run_endpoint(args, path, payload, token_in_query)
+        results['scenarios'][name] = result
+        if not result['requests']:
+            print("{:<20} no requests completed".format(name))
+            continue
+        print("{:<20} {:9.1f} {:9.1f} {:9.1f} {:9.1f} {:6.1%}".format(
+            name, result['throughput'], result['p50'] * 1000,
+            result['p95'] * 1000, result['p99'] * 1000, result['error_rate']))
+        if result['errors']:
+            print("{:<20} statuses: {}".format('', result['statuses']))
+
+    if args.output:
+        benchmark_results.save(results, args.output)
+
+    if args.compare:
+        baseline = benchmark_results.load(args.compare)
+        if benchmark_results.compare(
+                results, baseline, args.threshold,
+                metrics=[('p95', True), ('throughput', False)]):
+            return 1
+    return 0
+
+
+def standins(args):
+    # Only needed here, the load test itself doesn't need the Django project
+    from validation import SERVICES, get_environment
+
+    services = dict(SERVICES, junebug=[
+        ('GET', '/jb/channels/', {'result': {'type': 'whatsapp'}}),
+    ])
+    servers = []
+    urls = {}
+    for port, (service, routes) in enumerate(
+            sorted(services.items()), start=args.port):
+        server = start_standin(
+            latency=args.latency, routes=routes, host=args.host, port=port)
+        servers.append(server)
+        urls[service] = server.url.replace(
+            args.host, args.advertise or args.host)
+
+    environment = dict(
+        get_environment(urls), JUNEBUG_BASE_URL=urls['junebug'],
+        JEMBI_USERNAME='benchmark', JEMBI_PASSWORD='benchmark')
+    for name, value in sorted(environment.items()):
+        print("{}={}".format(name, value))
+    sys.stdout.flush()
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for server in servers:
+            server.shutdown()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    parser_standins = subparsers.add_parser(
+        'standins', help="Serve stand-ins for the upstream services")
+    parser_standins.add_argument(
+        '--latency', type=float, default=0.05,
+        help="Seconds the stand-in services take to respond")
+    parser_standins.add_argument('--host', default='0.0.0.0')
+    parser_standins.add_argument(
+        '--port', type=int, default=9000,
+        help="The port of the first stand-in, the rest use the following "
+        "ports")
+    parser_standins.add_argument(
+        '--advertise', help="The hostname that the deployment reaches the "
+        "stand-ins at, if it isn't --host")
+    parser_standins.set_defaults(func=standins)
+
+    parser_run = subparsers.add_parser('run', help="Run the load test")
+    parser_run.add_argument(
+        '--url', required=True, help="The base URL of the deployment")
+    parser_run.add_argument('--token', required=True)
+    parser_run.add_argument(
+        '--endpoint', action='append', default=[],
+        choices=[name for name, _, _, _ in ENDPOINTS],
+        help="Only load test this endpoint. Can be repeated")
+    parser_run.add_argument('--concurrency', type=int, default=20)
+    parser_run.add_argument(
+        '--duration', type=float, default=30,
+        help="Seconds to load test each endpoint for")
+    parser_run.add_argument(
+        '--warmup', type=float, default=5,
+        help="Seconds to send requests for before measuring")
+    parser_run.add_argument('--output', help="Write the results to this file")
+    parser_run.add_argument(
+        '--compare', help="Compare the results to the results in this file")
+    parser_run.add_argument(
+        '--threshold', type=float, default=0.2,
+        help="The fraction that the p95 latency can be higher, or the "
+        "throughput lower, than in --compare, before it's considered a "
+        "regression")
+    parser_run.set_defaults(func=run)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,244 @@
+"""
+Measures the latency and throughput of reading the position of a position
+tracker, as is done for every RTHB NurseConnect subscription, from many
+concurrent registration workers, and checks that concurrent increments are
+not lost.
+
+Each reader thread stands in for a worker creating subscriptions, reading the
+position in a loop for --duration seconds, while another thread increments
+the position every --increment-every seconds. The reads are run directly
+against the database, as they were previously, and through the position
+cache. The increments are run with the previous read-modify-write save, and
+with the atomic update, from --concurrency threads at once, and the number of
+increments that were lost is recorded.
+
+A test database is created for the run, so it needs a Postgres database, like
+the tests, and the cached reads check the version in Redis at REDIS_URL, eg.
+
+    python benchmarks/position_tracker.py --concurrency 20 \\
+        --output benchmarks/baselines/position_tracker.json
+
+Compare a run against the results of a previous release, failing if any
+scenario's median latency is more than --threshold slower, with
+
+    python benchmarks/position_tracker.py \\
+        --compare benchmarks/baselines/position_tracker.json
+"""
+import argparse
+import datetime
+import os
+import statistics
+import sys
+import threading
+import time
+
+import django
+
+import benchmark_results
+from benchmark_results import percentile
+
+LABEL = 'nurseconnect_rthb'
+
+
+def run_threads(target, concurrency):
+    """
+    Runs `target` in `concurrency` threads, closing each thread's database
+    connection when it's done, and returns the results of each thread
+    """
+    from django.db import connection
+
+    results = [None] * concurrency
+
+    def run(i):
+        try:
+            results[i] = target()
+        finally:
+            connection.close()
+
+    threads = [
+        threading.Thread(target=run, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def run_reads(read, concurrency, duration, increment_every):
+    """
+    Reads the position with `read` from `concurrency` threads for `duration`
+    seconds, while incrementing it every `increment_every` seconds
+    """
+    from registrations import positions
+
+    stop = threading.Event()
+
+    def increment():
+        from django.db import connection
+        try:
+            while not stop.wait(increment_every):
+                positions.increment_position(LABEL, datetime.timedelta(0))
+        finally:
+            connection.close()
+
+    def reader():
+        timings = []
+        end = time.time() + duration
+        while time.time() < end:
+            start = time.time()
+            read()
+            timings.append(time.time() - start)
+        return timings
+
+    incrementer = threading.Thread(target=increment)
+    incrementer.start()
+    try:
+        timings = [t for ts in run_threads(reader, concurrency) for t in ts]
+    finally:
+        stop.set()
+        incrementer.join()
+
+    return {
+        'reads': len(timings),
+        'p50': statistics.median(timings) * 1000,
+        'p95': percentile(timings, 0.95) * 1000,
+        'throughput': len(timings) / duration,
+    }
+
+
+def run_increments(increment, concurrency, increments):
+    """
+    Increments the position `increments` times from each of `concurrency`
+    threads at once, and counts how many of the increments that succeeded
+    were lost
+    """
+    from registrations.models import PositionTracker
+
+    start_position = PositionTracker.objects.get(label=LABEL).position
+    barrier = threading.Barrier(concurrency)
+
+    def incrementer():
+        barrier.wait()
+        timings = []
+        succeeded = 0
+        for _ in range(increments):
+            start = time.time()
+            succeeded += increment()
+            timings.append(time.time() - start)
+        return timings, succeeded
+
+    results = run_threads(incrementer, concurrency)
+    timings = [t for ts, _ in results for t in ts]
+    succeeded = sum(s for _, s in results)
+    position = PositionTracker.objects.get(label=LABEL).position
+    return {
+        'increments': succeeded,
+        'lost': start_position + succeeded - position,
+        'p50': statistics.median(timings) * 1000,
+        'p95': percentile(timings, 0.95) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument(
+        '--concurrency', type=int, default=10,
+        help="The number of concurrent reader or incrementer threads")
+    parser.add_argument(
+        '--duration', type=float, default=10,
+        help="Seconds to read the position for, in each read scenario")
+    parser.add_argument(
+        '--increment-every', type=float, default=1,
+        help="Seconds between increments while reading")
+    parser.add_argument(
+        '--increments', type=int, default=20,
+        help="Increments from each thread, in each increment scenario")
+    parser.add_argument(
+        '--cache-ttl', type=int, default=60,
+        help="The POSITION_CACHE_TTL to use for the cached reads")
+    parser.add_argument('--output', help="Write the results to this file")
+    parser.add_argument(
+        '--compare', help="Compare the results to the results in this file")
+    parser.add_argument(
+        '--threshold', type=float, default=0.2,
+        help="The fraction slower that the median latency can be than in "
+        "--compare, before it's considered a regression")
+    parser.add_argument(
+        '--keepdb', action='store_true',
+        help="Keep the test database between runs")
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ndoh_hub.settings')
+    django.setup()
+
+    from django.conf import settings
+    from django.test.utils import setup_databases, teardown_databases
+    from registrations import positions
+    from registrations.models import PositionTracker
+
+    settings.POSITION_CACHE_TTL = args.cache_ttl
+    settings.INSTRUMENTATION_SAMPLE_RATE = 0
+
+    def read_database():
+        return PositionTracker.objects.get(label=LABEL).position
+
+    def increment_save():
+        tracker = PositionTracker.objects.get(label=LABEL)
+        tracker.position += 1
+        tracker.save(update_fields=('position',))
+        return True
+
+    def increment_atomic():
+        # Concurrent increments can see a later modified_at than their own
+        # time, and aren't applied, like a retried increment
+        return positions.increment_position(
+            LABEL, datetime.timedelta(0)) is not None
+
+    old_config = setup_databases(
+        verbosity=0, interactive=False, keepdb=args.keepdb)
+    try:
+        PositionTracker.objects.get_or_create(label=LABEL)
+        results = benchmark_results.new_results(
+            concurrency=args.concurrency, duration=args.duration,
+            increment_every=args.increment_every,
+            increments=args.increments, cache_ttl=args.cache_ttl)
+
+        print("{:<20} {:>9} {:>9} {:>11} {:>9}".format(
+            'read', 'p50 ms', 'p95 ms', 'per s', 'reads'))
+        for name, read in (
+                ('read database', read_database),
+                ('read cached', lambda: positions.get_position(LABEL))):
+            positions.clear_cache()
+            result = run_reads(
+                read, args.concurrency, args.duration, args.increment_every)
+            results['scenarios'][name] = result
+            print("{:<20} {:9.3f} {:9.3f} {:11.1f} {:>9}".format(
+                name, result['p50'], result['p95'], result['throughput'],
+                result['reads']))
+
+        print("\n{:<20} {:>9} {:>9} {:>11} {:>9}".format(
+            'increment', 'p50 ms', 'p95 ms', 'increments', 'lost'))
+        for name, increment in (
+                ('increment save', increment_save),
+                ('increment atomic', increment_atomic)):
+            result = run_increments(
+                increment, args.concurrency, args.increments)
+            results['scenarios'][name] = result
+            print("{:<20} {:9.3f} {:9.3f} {:>11} {:>9}".format(
+                name, result['p50'], result['p95'], result['increments'],
+                result['lost']))
+    finally:
+        teardown_databases(old_config, verbosity=0, keepdb=args.keepdb)
+
+    if args.output:
+        benchmark_results.save(results, args.output)
+
+    if args.compare:
+        baseline = benchmark_results.load(args.compare)
+        if benchmark_results.compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
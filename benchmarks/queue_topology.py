@@ -0,0 +1,83 @@
+"""
+Measures how quickly the running Celery workers drain a burst of I/O bound
+tasks, to compare worker setups against each other.
+
+The tasks are `http_request_with_retries` tasks against a local stand-in
+service with a fixed latency, sent to each of the I/O queues in turn, so the
+result reflects the concurrency model of the workers rather than the speed of
+the upstream services.
+
+Run it once against each worker setup, with the same arguments, eg.
+
+    # The previous setup, a single solo worker on every queue
+    CELERY_WORKER=1 ...
+    python benchmarks/queue_topology.py --tasks 500 --latency 0.2
+
+    # One worker per queue, using the worker profiles in entrypoint.sh,
+    # including the default profile for the default ndoh_hub queue
+    PROFILES=validation,identity_store,jembi,webhooks,metrics,default
+    CELERY_WORKER_PROFILES=$PROFILES ...
+    python benchmarks/queue_topology.py --tasks 500 --latency 0.2
+
+The stand-in service listens on --host, which must be reachable from the
+workers.
+"""
+import argparse
+import os
+import sys
+import time
+
+import django
+
+from standin import start_standin
+
+QUEUES = ('identity_store', 'jembi', 'webhooks')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--tasks', type=int, default=500)
+    parser.add_argument(
+        '--latency', type=float, default=0.2,
+        help="Seconds the stand-in service takes to respond")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument(
+        '--timeout', type=float, default=600,
+        help="Seconds to wait for the workers to drain the queues")
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ndoh_hub.settings')
+    django.setup()
+    from registrations.tasks import http_request_with_retries
+
+    server = start_standin(
+        latency=args.latency, host=args.host, port=args.port)
+
+    start = time.time()
+    for i in range(args.tasks):
+        http_request_with_retries.apply_async(
+            kwargs={
+                'method': 'POST', 'url': server.url, 'headers': {},
+                'payload': {'task': i},
+            },
+            queue=QUEUES[i % len(QUEUES)])
+    enqueued = time.time() - start
+
+    while server.request_count < args.tasks:
+        if time.time() - start > args.timeout:
+            sys.exit("Timed out with {} of {} tasks completed".format(
+                server.request_count, args.tasks))
+        time.sleep(0.05)
+    elapsed = time.time() - start
+    server.shutdown()
+
+    print("tasks:       {}".format(args.tasks))
+    print("latency:     {:.3f}s".format(args.latency))
+    print("enqueue:     {:.2f}s".format(enqueued))
+    print("total:       {:.2f}s".format(elapsed))
+    print("throughput:  {:.1f} tasks/s".format(args.tasks / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Compares the time taken to build Registration.status using the model fields
+directly, against running the full RegistrationSerializer for each status,
+as was done previously.
+
+No database is needed, the registrations are built in memory, eg.
+
+    python benchmarks/registration_status.py --registrations 10000
+"""
+import argparse
+import datetime
+import os
+import timeit
+import uuid
+
+import django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--registrations', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ndoh_hub.settings')
+    django.setup()
+    from django.utils import timezone
+    from registrations.models import Registration
+    from registrations.serializers import RegistrationSerializer
+
+    now = timezone.now()
+    registrations = [
+        Registration(
+            id=uuid.uuid4(), external_id='external-{}'.format(i),
+            reg_type='momconnect_prebirth', registrant_id=str(uuid.uuid4()),
+            validated=bool(i % 2), source_id=1, created_by_id=1,
+            updated_by_id=1, created_at=now,
+            updated_at=now + datetime.timedelta(seconds=i),
+            data={
+                'msisdn_registrant': '+27820000000',
+                'msisdn_device': '+27821111111',
+                'language': 'eng_ZA',
+                'edd': '2016-11-05',
+                'faccode': '123456',
+            })
+        for i in range(args.registrations)]
+
+    def serializer_status(reg):
+        data = {
+            'registration_id': str(reg.external_id or reg.id),
+            'registration_data': RegistrationSerializer(instance=reg).data,
+        }
+        data['status'] = 'succeeded' if reg.validated else 'processing'
+        return data
+
+    for reg in registrations[:10]:
+        assert (reg.status['registration_data'] ==
+                serializer_status(reg)['registration_data'])
+
+    results = {}
+    for name, func in (
+            ('serializer', lambda: [
+                serializer_status(r) for r in registrations]),
+            ('fields', lambda: [r.status for r in registrations]),
+            ('fields (bulk)', lambda: Registration.get_statuses(
+                registrations))):
+        best = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        results[name] = best
+        print("{:<15} {:8.2f}ms total  {:8.2f}us per status".format(
+            name, best * 1000, best / args.registrations * 1e6))
+
+    print("speedup:        {:.1f}x".format(
+        results['serializer'] / results['fields']))
+
+
+if __name__ == '__main__':
+    main()
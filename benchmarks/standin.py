@@ -0,0 +1,81 @@
+"""
+Local stand-in HTTP services, used by the benchmarks in place of the real
+upstream services (Stage Based Messaging, Identity Store, Jembi, Wassup, etc.)
+
+Every request is answered with a canned JSON response after a configurable
+delay, so that benchmarks measure our own throughput against upstreams with
+a known, fixed latency.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, routes=None):
+        """
+        latency: seconds to wait before responding to each request
+        routes: a list of (method, path prefix, response body) tuples. The
+                first match is used, unmatched requests get `{}`
+        """
+        super(StandInServer, self).__init__(address, StandInRequestHandler)
+        self.latency = latency
+        self.routes = routes or []
+        self.request_count = 0
+        self._count_lock = threading.Lock()
+
+    def count_request(self):
+        with self._count_lock:
+            self.request_count += 1
+
+    def get_response(self, method, path):
+        for route_method, prefix, body in self.routes:
+            if route_method == method and path.startswith(prefix):
+                return body
+        return {}
+
+    @property
+    def url(self):
+        host, port = self.server_address
+        return 'http://{}:{}'.format(host, port)
+
+
+class StandInRequestHandler(BaseHTTPRequestHandler):
+    def respond(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+
+        time.sleep(self.server.latency)
+        self.server.count_request()
+
+        body = self.server.get_response(self.command, self.path)
+        if callable(body):
+            body = body(self.path)
+        content = json.dumps(body).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = respond
+
+    def log_message(self, *args):
+        pass
+
+
+def start_standin(latency=0.0, routes=None, host='127.0.0.1', port=0):
+    """
+    Starts a stand-in server in a background thread, and returns the server.
+    Call `server.shutdown()` to stop it.
+    """
+    server = StandInServer((host, port), latency=latency, routes=routes)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
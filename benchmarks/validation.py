@@ -0,0 +1,414 @@
+"""
+Measures the end-to-end latency and throughput of registration validation and
+change implementation, for every registration type and change action.
+
+Each scenario creates a registration or change, and then runs the
+validate_subscribe, validate_subscribe_jembi_app_registration or
+validate_implement task on it, with all the tasks that it starts run eagerly,
+against local stand-in services for the Stage Based Messaging, Identity Store,
+Jembi and Wassup APIs, with a fixed latency. The time taken by the tasks and
+the number of requests made to the stand-in services are recorded.
+
+A test database is created for the run, so it needs a Postgres database, like
+the tests, but no other services, eg.
+
+    python benchmarks/validation.py --latency 0.01 \\
+        --output benchmarks/baselines/validation.json
+
+Compare a run against the results of a previous release, failing if any
+scenario's median latency is more than --threshold slower, with
+
+    python benchmarks/validation.py \\
+        --compare benchmarks/baselines/validation.json
+
+Only compare results that were run with the same arguments on the same
+machine.
+"""
+import argparse
+import datetime
+import os
+import statistics
+import sys
+import time
+import uuid
+from urllib.parse import parse_qs, urlparse
+
+import django
+
+import benchmark_results
+from benchmark_results import percentile
+from standin import start_standin
+
+SA_ID_NO = '8606045069081'
+MSISDN = '+27820000000'
+DEVICE_MSISDN = '+27821111111'
+MESSAGESETS = [
+    {'id': i, 'short_name': short_name, 'default_schedule': 1}
+    for i, short_name in enumerate((
+        'momconnect_prebirth.hw_full.1',
+        'momconnect_prebirth.hw_partial.1',
+        'momconnect_postbirth.hw_full.1',
+        'pmtct_prebirth.patient.1',
+        'pmtct_postbirth.patient.1',
+        'nurseconnect.hw_full.1',
+        'loss_miscarriage.patient.1',
+        'whatsapp_momconnect_prebirth.hw_full.1',
+    ), start=1)
+]
+SUBSCRIPTION_ID = str(uuid.UUID(int=1))
+
+
+def page(results):
+    return {'count': len(results), 'next': None, 'previous': None,
+            'results': results}
+
+
+def query(path):
+    return parse_qs(urlparse(path).query)
+
+
+def path_id(path):
+    return urlparse(path).path.rstrip('/').rsplit('/', 1)[-1]
+
+
+def messagesets(path):
+    messageset_id = path_id(path)
+    if messageset_id.isdigit():
+        return MESSAGESETS[int(messageset_id) - 1]
+    short_name = query(path).get('short_name')
+    if short_name:
+        return page([
+            ms for ms in MESSAGESETS if ms['short_name'] == short_name[0]
+        ] or [{'id': 100, 'short_name': short_name[0], 'default_schedule': 1}])
+    return page(MESSAGESETS)
+
+
+def subscription(messageset):
+    return {
+        'id': SUBSCRIPTION_ID, 'identity': str(uuid.UUID(int=2)),
+        'messageset': messageset, 'active': True, 'lang': 'eng_ZA',
+        'next_sequence_number': 1, 'schedule': 1,
+    }
+
+
+def subscriptions(path):
+    if path_id(path) == SUBSCRIPTION_ID:
+        return subscription(4)
+    # A PMTCT and a public MomConnect subscription, so that changes have
+    # subscriptions to act on, and Jembi app registrations aren't rejected as
+    # already subscribed
+    return page([subscription(4), subscription(2)])
+
+
+def identity(identity_id, msisdn=MSISDN):
+    return {
+        'id': identity_id,
+        'details': {
+            'default_addr_type': 'msisdn',
+            'addresses': {'msisdn': {msisdn: {'default': True}}},
+            'lang_code': 'eng_ZA',
+            'sa_id_no': SA_ID_NO,
+            'mom_dob': '1989-01-01',
+            'persal_no': '11114444',
+            'sanc_no': '1234567',
+            'faccode': '123456',
+        },
+    }
+
+
+def get_identity(path):
+    return identity(path_id(path))
+
+
+def search_identities(path):
+    msisdn = query(path).get('details__addresses__msisdn', [MSISDN])[0]
+    return page([identity(str(uuid.uuid5(uuid.NAMESPACE_OID, msisdn)),
+                          msisdn)])
+
+
+def create_identity(path):
+    return identity(str(uuid.uuid4()))
+
+
+def wassup_contacts(path):
+    return [{'input': MSISDN, 'status': 'valid', 'wa_id': MSISDN[1:]}]
+
+
+SERVICES = {
+    'sbm': [
+        ('GET', '/api/v1/messageset/', messagesets),
+        ('GET', '/api/v1/schedule/', {'id': 1, 'day_of_week': '1,3'}),
+        ('GET', '/api/v1/subscriptions/', subscriptions),
+    ],
+    'identity_store': [
+        ('GET', '/api/v1/identities/search/', search_identities),
+        ('GET', '/api/v1/identities/', get_identity),
+        ('POST', '/api/v1/identities/', create_identity),
+    ],
+    'jembi': [
+        ('GET', '/ws/rest/v1/facilityCheck', {'rows': [['123456', 'Test']]}),
+    ],
+    'wassup': [
+        ('POST', '/', wassup_contacts),
+    ],
+    # The message sender, service rating, metrics and callbacks
+    'other': [],
+}
+
+
+def registration_data(reg_type, today):
+    """
+    Returns valid registration data for `reg_type`
+    """
+    edd = (today + datetime.timedelta(weeks=20)).strftime('%Y-%m-%d')
+    baby_dob = (today - datetime.timedelta(weeks=2)).strftime('%Y-%m-%d')
+    data = {
+        'operator_id': str(uuid.uuid4()),
+        'msisdn_registrant': MSISDN,
+        'msisdn_device': DEVICE_MSISDN,
+        'language': 'eng_ZA',
+        'consent': True,
+        'id_type': 'sa_id',
+        'sa_id_no': SA_ID_NO,
+        'mom_dob': '1989-01-01',
+        'faccode': '123456',
+        'edd': edd,
+    }
+    if 'postbirth' in reg_type:
+        data['baby_dob'] = baby_dob
+    if reg_type == 'jembi_momconnect':
+        data.update({
+            'mom_whatsapp': True, 'mom_pmtct': True, 'mom_opt_in': False,
+            'callback_url': SERVICES_URLS['other'] + '/callback/',
+            'callback_auth_token': 'token',
+        })
+    return data
+
+
+def change_data(action):
+    """
+    Returns valid change data for `action`
+    """
+    return {
+        'pmtct_loss_switch': {'reason': 'miscarriage'},
+        'pmtct_loss_optout': {'reason': 'miscarriage'},
+        'pmtct_nonloss_optout': {'reason': 'not_useful'},
+        'nurse_update_detail': {'faccode': '234567'},
+        'nurse_change_msisdn': {
+            'msisdn_old': MSISDN, 'msisdn_new': '+27820000001',
+            'msisdn_device': '+27820000001'},
+        'nurse_optout': {'reason': 'job_change'},
+        'momconnect_loss_switch': {'reason': 'miscarriage'},
+        'momconnect_loss_optout': {'reason': 'miscarriage'},
+        'momconnect_nonloss_optout': {'reason': 'not_useful'},
+        'momconnect_change_language': {'language': 'zul_ZA'},
+        'momconnect_change_msisdn': {'msisdn': '+27820000001'},
+        'momconnect_change_identification': {
+            'id_type': 'passport', 'passport_no': '12345678',
+            'passport_origin': 'zw'},
+        'admin_change_subscription': {
+            'subscription': SUBSCRIPTION_ID,
+            'messageset': 'momconnect_prebirth.hw_full.1',
+            'language': 'zul_ZA'},
+        'switch_channel': {'channel': 'whatsapp'},
+    }.get(action, {})
+
+
+# Filled in with the URLs of the stand-in services once they've started
+SERVICES_URLS = {}
+
+
+def get_environment(urls):
+    """
+    Returns the environment variables that configure us to use the stand-in
+    services at `urls`
+    """
+    return {
+        'STAGE_BASED_MESSAGING_URL': urls['sbm'] + '/api/v1',
+        'IDENTITY_STORE_URL': urls['identity_store'] + '/api/v1',
+        'MESSAGE_SENDER_URL': urls['other'] + '/api/v1',
+        'SERVICE_RATING_URL': urls['other'] + '/api/v1',
+        'METRICS_URL': urls['other'] + '/api/v1',
+        'JEMBI_BASE_URL': urls['jembi'] + '/ws/rest/v1/',
+        'WASSUP_URL': urls['wassup'] + '/',
+    }
+
+
+def get_scenarios():
+    """
+    Returns a list of (name, create, task), where `create` creates the object
+    and returns the task's kwargs
+    """
+    from django.contrib.auth.models import User
+    from changes.models import Change
+    from changes.tasks import validate_implement
+    from registrations.models import Registration, Source
+    from registrations.tasks import (
+        validate_subscribe, validate_subscribe_jembi_app_registration)
+
+    user = User.objects.create_user('benchmark')
+    sources = {
+        authority: Source.objects.create(
+            name='benchmark-{}'.format(authority), user=user,
+            authority=authority)
+        for authority in ('hw_full', 'hw_partial', 'patient')
+    }
+    today = datetime.date.today()
+
+    def registration(reg_type, authority):
+        def create():
+            # bulk_create doesn't run the post save hooks, which would
+            # validate the registration when it's created
+            [reg] = Registration.objects.bulk_create([Registration(
+                reg_type=reg_type, source=sources[authority],
+                registrant_id=str(uuid.uuid4()), created_by=user,
+                updated_by=user, data=registration_data(reg_type, today))])
+            return {'registration_id': str(reg.pk)}
+        return create
+
+    def change(action):
+        def create():
+            [change] = Change.objects.bulk_create([Change(
+                action=action, source=sources['hw_full'],
+                registrant_id=str(uuid.uuid4()), created_by=user,
+                updated_by=user, data=change_data(action))])
+            return {'change_id': str(change.pk)}
+        return create
+
+    scenarios = []
+    for reg_type, _ in Registration.REG_TYPE_CHOICES:
+        if reg_type == 'jembi_momconnect':
+            scenarios.append((
+                'validate_subscribe_jembi_app_registration',
+                registration(reg_type, 'hw_full'),
+                validate_subscribe_jembi_app_registration))
+            continue
+        authorities = ['hw_full']
+        if reg_type in ('momconnect_prebirth', 'whatsapp_prebirth'):
+            authorities = ['hw_full', 'hw_partial', 'patient']
+        elif 'pmtct' in reg_type:
+            authorities = ['patient']
+        for authority in authorities:
+            scenarios.append((
+                'validate_subscribe {} {}'.format(reg_type, authority),
+                registration(reg_type, authority), validate_subscribe))
+    for action, _ in Change.ACTION_CHOICES:
+        scenarios.append((
+            'validate_implement {}'.format(action), change(action),
+            validate_implement))
+    return scenarios
+
+
+def run_scenario(create, task, iterations, servers):
+    latencies = []
+    failures = []
+    requests = 0
+    for _ in range(iterations):
+        kwargs = create()
+        before = sum(server.request_count for server in servers)
+        start = time.perf_counter()
+        result = task.apply(kwargs=kwargs)
+        latencies.append(time.perf_counter() - start)
+        requests += sum(
+            server.request_count for server in servers) - before
+        # Validation failures are returned as False
+        if not result.successful() or result.result is False:
+            failures.append(repr(result.result))
+    total = sum(latencies)
+    return {
+        'iterations': iterations,
+        'failures': len(failures),
+        'failure': failures[0] if failures else None,
+        'mean': statistics.mean(latencies),
+        'p50': percentile(latencies, 0.5),
+        'p95': percentile(latencies, 0.95),
+        'max': max(latencies),
+        'throughput': iterations / total,
+        'requests': requests / iterations,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument(
+        '--latency', type=float, default=0.01,
+        help="Seconds the stand-in services take to respond")
+    parser.add_argument(
+        '--scenario', action='append', default=[],
+        help="Only run the scenarios whose names contain this. Can be "
+        "repeated")
+    parser.add_argument('--output', help="Write the results to this file")
+    parser.add_argument(
+        '--compare', help="Compare the results to the results in this file")
+    parser.add_argument(
+        '--threshold', type=float, default=0.2,
+        help="The fraction slower that the median latency can be than in "
+        "--compare, before it's considered a regression")
+    parser.add_argument(
+        '--keepdb', action='store_true',
+        help="Keep the test database between runs")
+    args = parser.parse_args()
+
+    servers = []
+    for service, routes in SERVICES.items():
+        server = start_standin(latency=args.latency, routes=routes)
+        servers.append(server)
+        SERVICES_URLS[service] = server.url
+
+    os.environ.update(get_environment(SERVICES_URLS))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ndoh_hub.settings')
+    django.setup()
+
+    from celery import current_app
+    from django.conf import settings
+    from django.test.utils import setup_databases, teardown_databases
+
+    # Run the tasks that the validation starts in this process, and keep the
+    # websocket events in memory
+    current_app.conf.CELERY_ALWAYS_EAGER = True
+    current_app.conf.CELERY_EAGER_PROPAGATES_EXCEPTIONS = True
+    settings.CHANNEL_LAYERS = {
+        'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+    settings.INSTRUMENTATION_SAMPLE_RATE = 0
+
+    old_config = setup_databases(
+        verbosity=0, interactive=False, keepdb=args.keepdb)
+    try:
+        results = benchmark_results.new_results(
+            latency=args.latency, iterations=args.iterations)
+        print("{:<60} {:>9} {:>9} {:>9} {:>9} {:>6}".format(
+            'scenario', 'p50 ms', 'p95 ms', 'per s', 'requests', 'fails'))
+        for name, create, task in get_scenarios():
+            if args.scenario and not any(s in name for s in args.scenario):
+                continue
+            result = run_scenario(create, task, args.iterations, servers)
+            results['scenarios'][name] = result
+            print("{:<60} {:9.1f} {:9.1f} {:9.1f} {:9.1f} {:>6}".format(
+                name, result['p50'] * 1000, result['p95'] * 1000,
+                result['throughput'], result['requests'],
+                result['failures']))
+    finally:
+        teardown_databases(old_config, verbosity=0, keepdb=args.keepdb)
+        for server in servers:
+            server.shutdown()
+
+    failed = [
+        (name, result['failure'])
+        for name, result in sorted(results['scenarios'].items())
+        if result['failures']]
+    for name, failure in failed:
+        print("{} failed: {}".format(name, failure))
+
+    if args.output:
+        benchmark_results.save(results, args.output)
+
+    if args.compare:
+        baseline = benchmark_results.load(args.compare)
+        if benchmark_results.compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""
+Load tests the Jembi app registration websocket consumer, with many
+concurrent clients connected to a single process.
+
+Each client connects, and then sends status queries for a set of existing
+registrations, waiting for each response before sending the next query. The
+benchmark reports how many clients could connect, and the latency of the
+status queries.
+
+The consumer runs in this process against the configured database, with an
+in memory channel layer, so no server or Redis is needed. Test data is
+created before the run and deleted afterwards, eg.
+
+    python benchmarks/websocket_consumers.py --clients 500 --queries 20
+
+To compare against another consumer implementation, pass its dotted path
+with --consumer.
+"""
+import argparse
+import asyncio
+import importlib
+import os
+import sys
+import time
+
+import django
+
+
+def percentile(values, p):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+async def run_client(consumer, user, queries, reg_ids, batch, latencies):
+    from channels.testing import WebsocketCommunicator
+
+    communicator = WebsocketCommunicator(
+        consumer, '/api/v1/jembiregistration/')
+    communicator.scope['user'] = user
+    connected, _ = await communicator.connect(timeout=30)
+    if not connected:
+        return False
+
+    for i in range(queries):
+        if batch > 1:
+            ids = [
+                reg_ids[(i * batch + j) % len(reg_ids)] for j in range(batch)]
+            data = {'ids': ids}
+        else:
+            ids = [reg_ids[i % len(reg_ids)]]
+            data = {'id': ids[0]}
+        start = time.time()
+        await communicator.send_json_to({'action': 'status', 'data': data})
+        for _ in ids:
+            await communicator.receive_json_from(timeout=30)
+        latencies.append(time.time() - start)
+
+    await communicator.disconnect()
+    return True
+
+
+async def run(consumer, user, args, reg_ids):
+    latencies = []
+    start = time.time()
+    results = await asyncio.gather(*(
+        run_client(
+            consumer, user, args.queries, reg_ids, args.batch, latencies)
+        for _ in range(args.clients)), return_exceptions=True)
+    elapsed = time.time() - start
+
+    connected = sum(1 for r in results if r is True)
+    errors = [r for r in results if isinstance(r, Exception)]
+    print("clients:     {} ({} connected, {} errors)".format(
+        args.clients, connected, len(errors)))
+    if errors:
+        print("first error: {!r}".format(errors[0]))
+    print("queries:     {}".format(len(latencies)))
+    print("total:       {:.2f}s".format(elapsed))
+    if latencies:
+        print("throughput:  {:.1f} queries/s".format(
+            len(latencies) / elapsed))
+        for p in (50, 90, 99):
+            print("p{}:         {:.1f}ms".format(
+                p, percentile(latencies, p) * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument(
+        '--queries', type=int, default=10,
+        help="Status queries sent by each client")
+    parser.add_argument(
+        '--batch', type=int, default=1,
+        help="Registrations per status query, using the `ids` field")
+    parser.add_argument(
+        '--registrations', type=int, default=100,
+        help="Registrations to create to query the status of")
+    parser.add_argument(
+        '--consumer',
+        default='registrations.consumers.JembiAppRegistrationConsumer')
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ndoh_hub.settings')
+    django.setup()
+    from django.conf import settings
+    from django.contrib.auth.models import User
+    from registrations.models import Registration, Source
+
+    settings.CHANNEL_LAYERS = {
+        'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'},
+    }
+    module, name = args.consumer.rsplit('.', 1)
+    consumer = getattr(importlib.import_module(module), name)
+
+    user = User.objects.create_user('websocket-benchmark-{}'.format(
+        int(time.time())))
+    source = Source.objects.create(
+        name='websocket-benchmark', user=user, authority='hw_full')
+    # bulk_create skips the post save hooks, so no tasks are queued
+    registrations = Registration.objects.bulk_create(
+        Registration(source=source, created_by=user, data={})
+        for _ in range(args.registrations))
+    reg_ids = [str(r.id) for r in registrations]
+
+    try:
+        asyncio.get_event_loop().run_until_complete(
+            run(consumer, user, args, reg_ids))
+    finally:
+        Registration.objects.filter(source=source).delete()
+        source.delete()
+        user.delete()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.10 on 2026-10-18 11:40
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('changes', '0008_auto_20261018_0912'),
+        ('registrations', '0016_feedevent'),
+    ]
+
+    operations = [
+        # Records changes in the feed, see registrations.models.FeedEvent
+        migrations.RunSQL(
+            "CREATE TRIGGER changes_change_feed "
+            "AFTER INSERT OR UPDATE OR DELETE ON changes_change "
+            "FOR EACH ROW EXECUTE PROCEDURE "
+            "registrations_record_feed_event('change');",
+            "DROP TRIGGER IF EXISTS changes_change_feed ON changes_change;"),
+    ]
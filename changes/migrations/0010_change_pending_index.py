@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.10 on 2026-10-18 14:02
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('changes', '0009_change_feed'),
+    ]
+
+    operations = [
+        # Used to count the changes waiting to be validated for the scheduled
+        # metrics, without scanning all the validated changes
+        migrations.RunSQL(
+            "CREATE INDEX changes_change_unvalidated "
+            "ON changes_change (created_at) WHERE validated = false;",
+            "DROP INDEX changes_change_unvalidated;"),
+    ]
@@ -54,7 +54,7 @@ class Change(models.Model):
     source = models.ForeignKey(Source, related_name='changes',
                                null=False)
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     created_by = models.ForeignKey(User, related_name='changes_created',
                                    null=True)
     updated_by = models.ForeignKey(User, related_name='changes_updated',
@@ -1,7 +1,6 @@
 import datetime
 import json
 import re
-import requests
 try:
     from urlparse import urljoin
 except ImportError:
@@ -11,28 +10,22 @@ from celery import chain
 from celery.task import Task
 from celery.utils.log import get_task_logger
 from django.conf import settings
+import redis
 from requests.exceptions import HTTPError
-from seed_services_client.identity_store import IdentityStoreApiClient
-from seed_services_client.stage_based_messaging import StageBasedMessagingApiClient  # noqa
 from six import iteritems
 
 from ndoh_hub import utils
 from ndoh_hub.celery import app
+from ndoh_hub.clients import is_client, sbm_client
+from ndoh_hub.outbounds import (
+    resolve_outbound_identity, resolve_outbound_identities)
+from ndoh_hub.validation import get_messages
 from registrations.models import Registration
 from .models import Change
-from registrations.models import SubscriptionRequest, Source
+from registrations.models import SubscriptionRequest
+from registrations.sources import get_source
 from registrations.tasks import add_personally_identifiable_fields
-
-
-sbm_client = StageBasedMessagingApiClient(
-    api_url=settings.STAGE_BASED_MESSAGING_URL,
-    auth_token=settings.STAGE_BASED_MESSAGING_TOKEN
-)
-
-is_client = IdentityStoreApiClient(
-    api_url=settings.IDENTITY_STORE_URL,
-    auth_token=settings.IDENTITY_STORE_TOKEN
-)
+from .validation import schema as change_schema
 
 
 class ValidateImplement(Task):
@@ -574,202 +567,6 @@ class ValidateImplement(Task):
 
         return push_channel_switch_to_jembi.si(str(change.pk))
 
-    # Validation checks
-    def check_pmtct_loss_optout_reason(self, data_fields, change):
-        loss_reasons = ["miscarriage", "stillbirth", "babyloss"]
-        if "reason" not in data_fields:
-            return ["Optout reason is missing"]
-        elif change.data["reason"] not in loss_reasons:
-            return ["Not a valid loss reason"]
-        else:
-            return []
-
-    def check_pmtct_nonloss_optout_reason(self, data_fields, change):
-        nonloss_reasons = ["not_hiv_pos", "not_useful", "other", "unknown"]
-        if "reason" not in data_fields:
-            return ["Optout reason is missing"]
-        elif change.data["reason"] not in nonloss_reasons:
-            return ["Not a valid nonloss reason"]
-        else:
-            return []
-
-    def check_nurse_update_detail(self, data_fields, change):
-        if len(data_fields) == 0:
-            return ["No details to update"]
-
-        elif "faccode" in data_fields:
-            if len(data_fields) != 1:
-                return ["Only one detail update can be submitted per Change"]
-            elif not utils.is_valid_faccode(change.data["faccode"]):
-                return ["Faccode invalid"]
-            else:
-                return []
-
-        elif "sanc_no" in data_fields:
-            if len(data_fields) != 1:
-                return ["Only one detail update can be submitted per Change"]
-            elif not utils.is_valid_sanc_no(change.data["sanc_no"]):
-                return ["sanc_no invalid"]
-            else:
-                return []
-
-        elif "persal_no" in data_fields:
-            if len(data_fields) != 1:
-                return ["Only one detail update can be submitted per Change"]
-            elif not utils.is_valid_persal_no(change.data["persal_no"]):
-                return ["persal_no invalid"]
-            else:
-                return []
-
-        elif "id_type" in data_fields and not (
-          change.data["id_type"] in ["passport", "sa_id"]):
-            return ["ID type should be passport or sa_id"]
-
-        elif "id_type" in data_fields and change.data["id_type"] == "sa_id":
-            if len(data_fields) != 3 or set(data_fields) != set(
-              ["id_type", "sa_id_no", "dob"]):
-                return ["SA ID update requires fields id_type, sa_id_no, dob"]
-            elif not utils.is_valid_date(change.data["dob"]):
-                return ["Date of birth is invalid"]
-            elif not utils.is_valid_sa_id_no(change.data["sa_id_no"]):
-                return ["SA ID number is invalid"]
-            else:
-                return []
-
-        elif "id_type" in data_fields and change.data["id_type"] == "passport":
-            if len(data_fields) != 4 or set(data_fields) != set(
-              ["id_type", "passport_no", "passport_origin", "dob"]):
-                return ["Passport update requires fields id_type, passport_no,"
-                        " passport_origin, dob"]
-            elif not utils.is_valid_date(change.data["dob"]):
-                return ["Date of birth is invalid"]
-            elif not utils.is_valid_passport_no(change.data["passport_no"]):
-                return ["Passport number is invalid"]
-            elif not utils.is_valid_passport_origin(
-              change.data["passport_origin"]):
-                return ["Passport origin is invalid"]
-            else:
-                return []
-
-        else:
-            return ["Could not parse detail update request"]
-
-    def check_nurse_change_msisdn(self, data_fields, change):
-        if len(data_fields) != 3 or set(data_fields) != set(
-          ["msisdn_old", "msisdn_new", "msisdn_device"]):
-            return ["SA ID update requires fields msisdn_old, msisdn_new, "
-                    "msisdn_device"]
-        elif not utils.is_valid_msisdn(change.data["msisdn_old"]):
-            return ["Invalid old msisdn"]
-        elif not utils.is_valid_msisdn(change.data["msisdn_new"]):
-            return ["Invalid old msisdn"]
-        elif not (change.data["msisdn_device"] == change.data["msisdn_new"] or
-                  change.data["msisdn_device"] == change.data["msisdn_old"]):
-            return ["Device msisdn should be the same as new or old msisdn"]
-        else:
-            return []
-
-    def check_nurse_optout(self, data_fields, change):
-        valid_reasons = ["job_change", "number_owner_change", "not_useful",
-                         "other", "unknown"]
-        if "reason" not in data_fields:
-            return ["Optout reason is missing"]
-        elif change.data["reason"] not in valid_reasons:
-            return ["Not a valid optout reason"]
-        else:
-            return []
-
-    def check_momconnect_loss_optout_reason(self, data_fields, change):
-        loss_reasons = ["miscarriage", "stillbirth", "babyloss"]
-        if "reason" not in data_fields:
-            return ["Optout reason is missing"]
-        elif change.data["reason"] not in loss_reasons:
-            return ["Not a valid loss reason"]
-        else:
-            return []
-
-    def check_momconnect_nonloss_optout_reason(self, data_fields, change):
-        nonloss_reasons = ["not_useful", "other", "unknown", "sms_failure"]
-        if "reason" not in data_fields:
-            return ["Optout reason is missing"]
-        elif change.data["reason"] not in nonloss_reasons:
-            return ["Not a valid nonloss reason"]
-        else:
-            return []
-
-    def check_momconnect_change_language(self, data_fields, change):
-        """
-        Ensures that the provided language is a valid language choice.
-        """
-        if "language" not in data_fields:
-            return ["language field is missing"]
-        elif not utils.is_valid_lang(change.data['language']):
-            return ["Not a valid language choice"]
-        else:
-            return []
-
-    def check_momconnect_change_msisdn(self, data_fields, change):
-        """
-        Ensures that a new msisdn is provided, and that it is a valid msisdn.
-        """
-        if "msisdn" not in data_fields:
-            return ["msisdn field is missing"]
-        elif not utils.is_valid_msisdn(change.data['msisdn']):
-            return ["Not a valid MSISDN"]
-        else:
-            return []
-
-    def check_momconnect_change_identification(self, data_fields, change):
-        if "id_type" not in data_fields:
-            return ["ID type missing"]
-
-        if change.data["id_type"] == "sa_id":
-            if "sa_id_no" not in data_fields:
-                return ["SA ID number missing"]
-            elif not utils.is_valid_sa_id_no(change.data["sa_id_no"]):
-                return ["SA ID number invalid"]
-            else:
-                return []
-        elif change.data["id_type"] == "passport":
-            errors = []
-
-            if "passport_no" not in data_fields:
-                errors += ["Passport number missing"]
-            elif not utils.is_valid_passport_no(change.data["passport_no"]):
-                errors += ["Passport number invalid"]
-
-            if "passport_origin" not in data_fields:
-                errors += ["Passport origin missing"]
-            elif not utils.is_valid_passport_origin(
-                    change.data["passport_origin"]):
-                errors += ["Passport origin invalid"]
-
-            return errors
-        else:
-            return ["ID type should be 'sa_id' or 'passport'"]
-
-    def check_admin_change_subscription(self, data_fields, change):
-        errors = []
-        if "messageset" not in data_fields and "language" not in data_fields:
-            errors.append(
-                "One of these fields must be populated: messageset, language")
-        if "subscription" not in data_fields:
-            errors.append("Subscription field is missing")
-        return errors
-
-    def check_switch_channel(self, data_fields, change):
-        """
-        Should have the "channel" field, and channel field should be a valid
-        channel type
-        """
-        channel_types = ['whatsapp', 'sms']
-        if "channel" not in data_fields:
-            return ["'channel' is a required field"]
-        elif change.data['channel'] not in channel_types:
-            return ["'channel' must be one of {}".format(
-                sorted(channel_types))]
-        return []
-
     # Validate
     def validate(self, change):
         """ Validates that all the required info is provided for a
@@ -777,62 +574,7 @@ class ValidateImplement(Task):
         """
         self.log.info("Starting change validation")
 
-        validation_errors = []
-
-        # Check if registrant_id is a valid UUID
-        if not utils.is_valid_uuid(change.registrant_id):
-            validation_errors += ["Invalid UUID registrant_id"]
-
-        # Check that required fields are provided and valid
-        data_fields = change.data.keys()
-
-        if 'pmtct_loss' in change.action:
-            validation_errors += self.check_pmtct_loss_optout_reason(
-                data_fields, change)
-
-        elif change.action == 'pmtct_nonloss_optout':
-            validation_errors += self.check_pmtct_nonloss_optout_reason(
-                data_fields, change)
-
-        elif change.action == 'nurse_update_detail':
-            validation_errors += self.check_nurse_update_detail(
-                data_fields, change)
-
-        elif change.action == 'nurse_change_msisdn':
-            validation_errors += self.check_nurse_change_msisdn(
-                data_fields, change)
-
-        elif change.action == 'nurse_optout':
-            validation_errors += self.check_nurse_optout(
-                data_fields, change)
-
-        elif 'momconnect_loss' in change.action:
-            validation_errors += self.check_momconnect_loss_optout_reason(
-                data_fields, change)
-
-        elif change.action == 'momconnect_nonloss_optout':
-            validation_errors += self.check_momconnect_nonloss_optout_reason(
-                data_fields, change)
-
-        elif change.action == 'momconnect_change_language':
-            validation_errors += self.check_momconnect_change_language(
-                data_fields, change)
-
-        elif change.action == 'momconnect_change_msisdn':
-            validation_errors += self.check_momconnect_change_msisdn(
-                data_fields, change)
-
-        elif change.action == 'momconnect_change_identification':
-            validation_errors += self.check_momconnect_change_identification(
-                data_fields, change)
-
-        elif change.action == 'admin_change_subscription':
-            validation_errors += self.check_admin_change_subscription(
-                data_fields, change)
-
-        elif change.action == 'switch_channel':
-            validation_errors += self.check_switch_channel(
-                data_fields, change)
+        validation_errors = get_messages(change_schema.validate(change))
 
         # Evaluate if there were any problems, save and return
         if len(validation_errors) == 0:
@@ -1007,7 +749,7 @@ class BasePushOptoutToJembi(object):
         change = Change.objects.get(pk=change_id)
         json_doc = self.build_jembi_json(change)
         try:
-            result = requests.post(
+            result = utils.http_session.post(
                 self.URL,
                 headers={'Content-Type': 'application/json'},
                 data=json.dumps(json_doc),
@@ -1228,12 +970,9 @@ class ProcessWhatsAppUnsentEvent(Task):
     name = "ndoh_hub.changes.tasks.process_whatsapp_unsent_event"
 
     def run(self, vumi_message_id: str, user_id: str, **kwargs) -> None:
-        source_id: int = Source.objects.values('pk').get(user=user_id)['pk']
-        try:
-            identity_uuid: str = next(utils.ms_client.get_outbounds({
-                'vumi_message_id': vumi_message_id,
-            })['results'])['to_identity']
-        except StopIteration:
+        source_id: int = get_source(user_id).pk
+        identity_uuid: str = resolve_outbound_identity(vumi_message_id)
+        if identity_uuid is None:
             """
             Outbound with message id doesn't exist, so don't create a change
             """
@@ -1252,3 +991,109 @@ class ProcessWhatsAppUnsentEvent(Task):
 
 
 process_whatsapp_unsent_event = ProcessWhatsAppUnsentEvent()
+
+
+_redis = None
+
+
+def get_redis():
+    global _redis
+    if _redis is None:
+        _redis = redis.StrictRedis.from_url(settings.REDIS_URL)
+    return _redis
+
+
+def whatsapp_unsent_events_key(user_id):
+    return 'whatsapp_unsent_events:{}'.format(user_id)
+
+
+def buffer_whatsapp_unsent_events(
+        vumi_message_ids: list, user_id: int) -> None:
+    """
+    Adds the unsent events to the user's buffer, and schedules the buffer to
+    be processed at the end of the coalescing window if it isn't already
+    """
+    r = get_redis()
+    key = whatsapp_unsent_events_key(user_id)
+    window = settings.WHATSAPP_UNSENT_EVENT_WINDOW
+    # The buffer and the lock outlive the window, in case the scheduled task
+    # is lost, but are eventually removed if no more events are received
+    pipe = r.pipeline()
+    pipe.sadd(key, *vumi_message_ids)
+    pipe.expire(key, window * 2)
+    pipe.execute()
+    if r.set('{}:scheduled'.format(key), 1, nx=True, ex=window * 2):
+        process_whatsapp_unsent_events.apply_async(
+            args=(user_id,), countdown=window)
+
+
+def pop_whatsapp_unsent_events(user_id: int) -> list:
+    """
+    Removes and returns all the buffered message ids for the user. Any events
+    received after this will schedule a new task to process them.
+    """
+    r = get_redis()
+    key = whatsapp_unsent_events_key(user_id)
+    r.delete('{}:scheduled'.format(key))
+    pipe = r.pipeline()
+    pipe.smembers(key)
+    pipe.delete(key)
+    message_ids, _ = pipe.execute()
+    return sorted(m.decode() for m in message_ids)
+
+
+class ProcessWhatsAppUnsentEvents(Task):
+    """
+    Switches users to SMS messaging for a batch of WhatsApp unsent events,
+    creating at most one channel switch for each identity
+    """
+    name = "ndoh_hub.changes.tasks.process_whatsapp_unsent_events"
+    log = get_task_logger(__name__)
+
+    def run(self, user_id: int, **kwargs) -> None:
+        message_ids = pop_whatsapp_unsent_events(user_id)
+        if not message_ids:
+            return
+        identities = set(
+            identity for identity in
+            resolve_outbound_identities(message_ids).values()
+            if identity is not None)
+
+        # Skip identities whose latest channel switch is to SMS and is still
+        # pending, either not implemented yet, or implemented since their
+        # latest registration. A registration since then, eg. back onto
+        # WhatsApp, means that they need to be switched again.
+        latest_switches = Change.objects.filter(
+            action='switch_channel', registrant_id__in=identities,
+        ).order_by('registrant_id', '-created_at').distinct('registrant_id')\
+            .values_list('registrant_id', 'data', 'validated', 'created_at')
+        latest_registrations = dict(Registration.objects.filter(
+            registrant_id__in=identities,
+        ).order_by('registrant_id', '-created_at').distinct('registrant_id')
+            .values_list('registrant_id', 'created_at'))
+        pending = set(
+            registrant_id
+            for registrant_id, data, validated, created_at in latest_switches
+            if (data or {}).get('channel') == 'sms' and (
+                not validated or
+                registrant_id not in latest_registrations or
+                created_at > latest_registrations[registrant_id]))
+
+        source_id = get_source(user_id).pk
+        for identity_uuid in sorted(identities - pending):
+            Change.objects.create(
+                registrant_id=identity_uuid,
+                action='switch_channel',
+                data={
+                    'channel': "sms",
+                    'reason': "whatsapp_unsent_event",
+                },
+                source_id=source_id,
+                created_by_id=user_id,
+            )
+        self.log.info(
+            "Processed %d unsent events for %d identities, %d already pending",
+            len(message_ids), len(identities), len(pending))
+
+
+process_whatsapp_unsent_events = ProcessWhatsAppUnsentEvents()
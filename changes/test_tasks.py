@@ -1,18 +1,26 @@
+import datetime
+
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from unittest import mock
 import responses
 
-from registrations.models import Source
+from registrations.models import Registration, Source
 from changes.models import Change
 from changes.signals import psh_validate_implement
-from changes.tasks import process_whatsapp_unsent_event
+from ndoh_hub.outbounds import identity_cache
+from changes.tasks import (
+    process_whatsapp_unsent_event, process_whatsapp_unsent_events,
+    buffer_whatsapp_unsent_events, pop_whatsapp_unsent_events)
 
 
 class ProcessWhatsAppUnsentEventTaskTests(TestCase):
     def setUp(self):
         post_save.disconnect(
             receiver=psh_validate_implement, sender=Change)
+        identity_cache.clear()
 
     def tearDown(self):
         post_save.connect(
@@ -72,3 +80,180 @@ class ProcessWhatsAppUnsentEventTaskTests(TestCase):
         process_whatsapp_unsent_event('messageid', source.pk)
 
         self.assertEqual(Change.objects.count(), 0)
+
+
+@override_settings(WHATSAPP_UNSENT_EVENT_WINDOW=60)
+@mock.patch('changes.tasks.get_redis')
+class WhatsAppUnsentEventBufferTests(TestCase):
+    @mock.patch('changes.tasks.process_whatsapp_unsent_events.apply_async')
+    def test_buffer_schedules_once(self, task, get_redis):
+        """
+        Buffering an event should add it to the user's buffer, and only
+        schedule processing if it isn't already scheduled
+        """
+        r = get_redis.return_value
+        r.set.side_effect = [True, None]
+
+        buffer_whatsapp_unsent_events(['message1', 'message2'], 7)
+        buffer_whatsapp_unsent_events(['message3'], 7)
+
+        pipe = r.pipeline.return_value
+        self.assertEqual(pipe.sadd.call_args_list, [
+            mock.call('whatsapp_unsent_events:7', 'message1', 'message2'),
+            mock.call('whatsapp_unsent_events:7', 'message3'),
+        ])
+        pipe.expire.assert_called_with('whatsapp_unsent_events:7', 120)
+        r.set.assert_called_with(
+            'whatsapp_unsent_events:7:scheduled', 1, nx=True, ex=120)
+        task.assert_called_once_with(args=(7,), countdown=60)
+
+    def test_pop(self, get_redis):
+        """
+        Popping should clear the schedule lock and the buffer, and return
+        the buffered message ids
+        """
+        r = get_redis.return_value
+        r.pipeline.return_value.execute.return_value = [
+            {b'message2', b'message1'}, 1]
+
+        self.assertEqual(
+            pop_whatsapp_unsent_events(7), ['message1', 'message2'])
+        r.delete.assert_called_once_with(
+            'whatsapp_unsent_events:7:scheduled')
+        r.pipeline.return_value.delete.assert_called_once_with(
+            'whatsapp_unsent_events:7')
+
+
+@override_settings(WHATSAPP_UNSENT_EVENT_WINDOW=60)
+class ProcessWhatsAppUnsentEventsTaskTests(TestCase):
+    def setUp(self):
+        post_save.disconnect(
+            receiver=psh_validate_implement, sender=Change)
+        identity_cache.clear()
+
+    def tearDown(self):
+        post_save.connect(
+            receiver=psh_validate_implement, sender=Change)
+
+    def add_outbound(self, message_id, identity):
+        responses.add(
+            responses.GET,
+            'http://ms/api/v1/outbound/?vumi_message_id={}'.format(
+                message_id),
+            json={
+                'results': [{'to_identity': identity}] if identity else []
+            }, status=200, match_querystring=True)
+
+    @responses.activate
+    @mock.patch('changes.tasks.pop_whatsapp_unsent_events')
+    def test_one_change_per_identity(self, pop):
+        """
+        Multiple events for the same identity should result in a single
+        channel switch, and messages that can't be found should be skipped
+        """
+        user = User.objects.create_user('test')
+        Source.objects.create(user=user)
+        pop.return_value = ['message1', 'message2', 'message3']
+        self.add_outbound('message1', 'identity1')
+        self.add_outbound('message2', 'identity1')
+        self.add_outbound('message3', None)
+
+        process_whatsapp_unsent_events(user.pk)
+
+        [change] = Change.objects.all()
+        self.assertEqual(change.registrant_id, 'identity1')
+        self.assertEqual(change.action, 'switch_channel')
+        self.assertEqual(change.created_by, user)
+
+    @responses.activate
+    @mock.patch('changes.tasks.pop_whatsapp_unsent_events')
+    def test_existing_pending_change(self, pop):
+        """
+        If there is already a recent channel switch for the identity, another
+        one shouldn't be created
+        """
+        user = User.objects.create_user('test')
+        source = Source.objects.create(user=user)
+        Change.objects.create(
+            registrant_id='identity1', action='switch_channel',
+            data={'channel': 'sms', 'reason': 'whatsapp_unsent_event'},
+            source=source)
+        pop.return_value = ['message1']
+        self.add_outbound('message1', 'identity1')
+
+        process_whatsapp_unsent_events(user.pk)
+
+        self.assertEqual(Change.objects.count(), 1)
+
+    @responses.activate
+    @mock.patch('changes.tasks.pop_whatsapp_unsent_events')
+    def test_existing_old_change(self, pop):
+        """
+        A channel switch to SMS from before the window should still stop
+        another one being created, unless the identity has since switched
+        back to WhatsApp
+        """
+        user = User.objects.create_user('test')
+        source = Source.objects.create(user=user)
+        day_ago = timezone.now() - datetime.timedelta(days=1)
+        for identity, channel, created_at in (
+                ('identity1', 'sms', day_ago),
+                ('identity2', 'sms', day_ago),
+                ('identity2', 'whatsapp',
+                 day_ago + datetime.timedelta(hours=1))):
+            change = Change.objects.create(
+                registrant_id=identity, action='switch_channel',
+                data={'channel': channel}, source=source, validated=True)
+            Change.objects.filter(pk=change.pk).update(created_at=created_at)
+        pop.return_value = ['message1', 'message2']
+        self.add_outbound('message1', 'identity1')
+        self.add_outbound('message2', 'identity2')
+
+        process_whatsapp_unsent_events(user.pk)
+
+        [change] = Change.objects.filter(validated=False)
+        self.assertEqual(change.registrant_id, 'identity2')
+        self.assertEqual(change.data['channel'], 'sms')
+
+    @responses.activate
+    @mock.patch('changes.tasks.pop_whatsapp_unsent_events')
+    def test_registered_since_change(self, pop):
+        """
+        If the identity has registered again since their channel switch to
+        SMS was implemented, another one should be created, but not if the
+        switch is still pending
+        """
+        user = User.objects.create_user('test')
+        source = Source.objects.create(user=user)
+        day_ago = timezone.now() - datetime.timedelta(days=1)
+        for identity, validated in (
+                ('identity1', True), ('identity2', False)):
+            change = Change.objects.create(
+                registrant_id=identity, action='switch_channel',
+                data={'channel': 'sms'}, source=source, validated=validated)
+            Change.objects.filter(pk=change.pk).update(created_at=day_ago)
+        # Created without the signals, so that they aren't validated
+        Registration.objects.bulk_create([
+            Registration(
+                registrant_id=identity, reg_type='whatsapp_prebirth',
+                source=source, validated=True, data={})
+            for identity in ('identity1', 'identity2')])
+        pop.return_value = ['message1', 'message2']
+        self.add_outbound('message1', 'identity1')
+        self.add_outbound('message2', 'identity2')
+
+        process_whatsapp_unsent_events(user.pk)
+
+        [change] = Change.objects.filter(
+            created_at__gt=day_ago + datetime.timedelta(hours=1))
+        self.assertEqual(change.registrant_id, 'identity1')
+        self.assertEqual(change.data['channel'], 'sms')
+
+    @mock.patch('changes.tasks.pop_whatsapp_unsent_events')
+    def test_empty_buffer(self, pop):
+        """
+        If another task already processed the buffer, nothing should be done
+        """
+        pop.return_value = []
+        process_whatsapp_unsent_events(1)
+        self.assertEqual(Change.objects.count(), 0)
@@ -7,7 +7,7 @@ from unittest import mock
 from rest_framework.test import APITestCase
 
 
-@mock.patch('changes.views.tasks.process_whatsapp_unsent_event')
+@mock.patch('changes.views.tasks.buffer_whatsapp_unsent_events')
 class ReceiveWhatsAppEventViewTests(APITestCase):
     def test_no_auth(self, task):
         """
@@ -92,5 +92,40 @@ class ReceiveWhatsAppEventViewTests(APITestCase):
             },
         }, format='json')
         self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
-        task.delay.assert_called_once_with(
-            '41c377a47b064eba9abee5a1ea827b3d', user.pk)
+        task.assert_called_once_with(
+            ['41c377a47b064eba9abee5a1ea827b3d'], user.pk)
+
+    def test_multiple_events(self, task):
+        """
+        A list of events should be accepted, and the relevant events buffered
+        together
+        """
+        user = User.objects.create_user('test')
+        user.user_permissions.add(
+            Permission.objects.get(codename='add_change'))
+        self.client.force_authenticate(user=user)
+        url = reverse('whatsapp_event')
+
+        def event(message_id, status):
+            return {
+                'hook': {
+                    'event': 'message.direct_outbound.status',
+                },
+                'data': {
+                    'message_metadata': {
+                        'junebug_message_id': message_id,
+                    },
+                    'status': status,
+                },
+            }
+
+        response = self.client.post(url, [
+            event('41c377a47b064eba9abee5a1ea827b3d', 'unsent'),
+            event('51c377a47b064eba9abee5a1ea827b3d', 'sent'),
+            event('61c377a47b064eba9abee5a1ea827b3d', 'unsent'),
+        ], format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        task.assert_called_once_with([
+            '41c377a47b064eba9abee5a1ea827b3d',
+            '61c377a47b064eba9abee5a1ea827b3d',
+        ], user.pk)
@@ -18,11 +18,13 @@ from rest_hooks.models import model_saved
 
 from ndoh_hub import utils, utils_tests
 from .models import Change
+from .serializers import ChangeSerializer
 from .signals import psh_validate_implement
 from .tasks import (
     validate_implement, remove_personally_identifiable_fields,
     restore_personally_identifiable_fields)
 from registrations.models import Source, Registration, SubscriptionRequest
+from registrations import sources
 from registrations.signals import (psh_validate_subscribe,
                                    psh_fire_created_metric)
 
@@ -469,6 +471,7 @@ class APITestCase(TestCase):
         self.normalclient = APIClient()
         self.otherclient = APIClient()
         utils.get_today = override_get_today
+        sources.clear_cache()
 
 
 class AuthenticatedAPITestCase(APITestCase):
@@ -847,6 +850,41 @@ class TestChangeListAPI(AuthenticatedAPITestCase):
         self.assertEqual(result["id"], str(change2.id))
 
 
+class TestChangeExportAPI(AuthenticatedAPITestCase):
+
+    def get_rows(self, response):
+        content = b''.join(response.streaming_content).decode()
+        return [json.loads(line) for line in content.splitlines()]
+
+    def test_export_changes(self):
+        """
+        All the changes should be streamed as NDJSON, in order of when they
+        were last updated, with the same fields as the changes endpoint
+        """
+        change1 = self.make_change_adminuser()
+        change2 = self.make_change_normaluser()
+        change1.save()
+
+        response = self.normalclient.get('/api/v1/changes/export/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.get_rows(response), [
+            ChangeSerializer(change2).data,
+            ChangeSerializer(change1).data,
+        ])
+
+    def test_export_changes_filtered(self):
+        """
+        The same filters as the changes endpoint should apply
+        """
+        self.make_change_adminuser()
+        change2 = self.make_change_normaluser()
+
+        response = self.normalclient.get(
+            '/api/v1/changes/export/?source={}'.format(change2.source.id))
+        self.assertEqual(
+            [r['id'] for r in self.get_rows(response)], [str(change2.id)])
+
+
 class TestRegistrationCreation(AuthenticatedAPITestCase):
 
     def test_make_registration_pmtct_prebirth(self):
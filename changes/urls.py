@@ -10,6 +10,8 @@ router.register(r'changes', views.ChangeGetViewSet)
 # Wire up our API using automatic URL routing.
 # Additionally, we include login URLs for the browseable API.
 urlpatterns = [
+    url(r'^api/v1/changes/export/$', views.ChangeExport.as_view(),
+        name='changes-export'),
     url(r'^api/v1/', include(router.urls)),
     url(r'^api/v1/change/inactive/$', views.OptOutInactiveIdentity.as_view()),
     url(r'^api/v1/change/', views.ChangePost.as_view()),
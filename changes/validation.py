@@ -0,0 +1,149 @@
+"""
+The validation schema of the change data, for each action
+"""
+from ndoh_hub import utils
+from ndoh_hub.validation import (
+    AnyOf, Attribute, FieldError, Required, Schema, check, is_date, one_of)
+
+LOSS_REASONS = ["miscarriage", "stillbirth", "babyloss"]
+PMTCT_NONLOSS_REASONS = ["not_hiv_pos", "not_useful", "other", "unknown"]
+NURSE_OPTOUT_REASONS = [
+    "job_change", "number_owner_change", "not_useful", "other", "unknown"]
+MOMCONNECT_NONLOSS_REASONS = ["not_useful", "other", "unknown", "sms_failure"]
+CHANNEL_TYPES = ['whatsapp', 'sms']
+
+
+def reason(choices, message):
+    return Required(
+        'reason', "Optout reason is missing", (one_of(choices), message))
+
+
+def nurse_update_detail(change, data, today):
+    """
+    Only one detail can be updated per change, except for identification,
+    which needs all of its fields
+    """
+    fields = set(data)
+    if not fields:
+        return [FieldError(None, "No details to update")]
+
+    for field, is_valid, message in (
+            ('faccode', utils.is_valid_faccode, "Faccode invalid"),
+            ('sanc_no', utils.is_valid_sanc_no, "sanc_no invalid"),
+            ('persal_no', utils.is_valid_persal_no, "persal_no invalid")):
+        if field in fields:
+            if len(fields) != 1:
+                return [FieldError(
+                    field,
+                    "Only one detail update can be submitted per Change")]
+            if not is_valid(data[field]):
+                return [FieldError(field, message)]
+            return []
+
+    if 'id_type' not in fields:
+        return [FieldError(None, "Could not parse detail update request")]
+    if data['id_type'] == 'sa_id':
+        if fields != {'id_type', 'sa_id_no', 'dob'}:
+            return [FieldError(
+                'id_type',
+                "SA ID update requires fields id_type, sa_id_no, dob")]
+        if not is_date(data['dob'], today):
+            return [FieldError('dob', "Date of birth is invalid")]
+        if not utils.is_valid_sa_id_no(data['sa_id_no']):
+            return [FieldError('sa_id_no', "SA ID number is invalid")]
+        return []
+    if data['id_type'] == 'passport':
+        if fields != {'id_type', 'passport_no', 'passport_origin', 'dob'}:
+            return [FieldError(
+                'id_type', "Passport update requires fields id_type, "
+                "passport_no, passport_origin, dob")]
+        if not is_date(data['dob'], today):
+            return [FieldError('dob', "Date of birth is invalid")]
+        if not utils.is_valid_passport_no(data['passport_no']):
+            return [FieldError('passport_no', "Passport number is invalid")]
+        if not utils.is_valid_passport_origin(data['passport_origin']):
+            return [FieldError(
+                'passport_origin', "Passport origin is invalid")]
+        return []
+    return [FieldError('id_type', "ID type should be passport or sa_id")]
+
+
+def nurse_change_msisdn(change, data, today):
+    if set(data) != {'msisdn_old', 'msisdn_new', 'msisdn_device'}:
+        return [FieldError(
+            None, "SA ID update requires fields msisdn_old, msisdn_new, "
+            "msisdn_device")]
+    if not utils.is_valid_msisdn(data['msisdn_old']):
+        return [FieldError('msisdn_old', "Invalid old msisdn")]
+    if not utils.is_valid_msisdn(data['msisdn_new']):
+        return [FieldError('msisdn_new', "Invalid old msisdn")]
+    if data['msisdn_device'] not in (data['msisdn_new'], data['msisdn_old']):
+        return [FieldError(
+            'msisdn_device',
+            "Device msisdn should be the same as new or old msisdn")]
+    return []
+
+
+LOSS = [reason(LOSS_REASONS, "Not a valid loss reason")]
+
+schema = Schema(
+    'action',
+    common=[
+        Attribute(
+            'registrant_id', utils.is_valid_uuid,
+            "Invalid UUID registrant_id"),
+    ],
+    types={
+        'pmtct_loss_switch': LOSS,
+        'pmtct_loss_optout': LOSS,
+        'pmtct_nonloss_optout': [
+            reason(PMTCT_NONLOSS_REASONS, "Not a valid nonloss reason")],
+        'nurse_update_detail': [nurse_update_detail],
+        'nurse_change_msisdn': [nurse_change_msisdn],
+        'nurse_optout': [
+            reason(NURSE_OPTOUT_REASONS, "Not a valid optout reason")],
+        'momconnect_loss_switch': LOSS,
+        'momconnect_loss_optout': LOSS,
+        'momconnect_nonloss_optout': [
+            reason(MOMCONNECT_NONLOSS_REASONS, "Not a valid nonloss reason")],
+        'momconnect_change_language': [
+            Required(
+                'language', "language field is missing",
+                (check(utils.is_valid_lang), "Not a valid language choice"))],
+        'momconnect_change_msisdn': [
+            Required(
+                'msisdn', "msisdn field is missing",
+                (check(utils.is_valid_msisdn), "Not a valid MSISDN"))],
+        'momconnect_change_identification': [
+            Required(
+                'id_type', "ID type missing",
+                (one_of(['sa_id', 'passport']),
+                 "ID type should be 'sa_id' or 'passport'"),
+                cases={
+                    'sa_id': [
+                        Required(
+                            'sa_id_no', "SA ID number missing",
+                            (check(utils.is_valid_sa_id_no),
+                             "SA ID number invalid"))],
+                    'passport': [
+                        Required(
+                            'passport_no', "Passport number missing",
+                            (check(utils.is_valid_passport_no),
+                             "Passport number invalid")),
+                        Required(
+                            'passport_origin', "Passport origin missing",
+                            (check(utils.is_valid_passport_origin),
+                             "Passport origin invalid"))],
+                })],
+        'admin_change_subscription': [
+            AnyOf(
+                ['messageset', 'language'],
+                "One of these fields must be populated: messageset, "
+                "language"),
+            Required('subscription', "Subscription field is missing")],
+        'switch_channel': [
+            Required(
+                'channel', "'channel' is a required field",
+                (one_of(CHANNEL_TYPES), "'channel' must be one of {}".format(
+                    sorted(CHANNEL_TYPES))))],
+    })
@@ -1,7 +1,6 @@
 import django_filters
 import django_filters.rest_framework as filters
 from rest_framework import viewsets, mixins, generics, status
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.exceptions import ValidationError
 from rest_framework.pagination import CursorPagination
 from rest_framework.permissions import IsAuthenticated, DjangoModelPermissions
@@ -15,10 +14,12 @@ from .serializers import (
     ChangeSerializer, AdminOptoutSerializer, AdminChangeSerializer,
     ReceiveWhatsAppEventSerializer,
 )
-from seed_services_client.stage_based_messaging import StageBasedMessagingApiClient  # noqa
-from django.conf import settings
 
 from changes import tasks
+from registrations.sources import get_source
+from ndoh_hub.auth import CachedTokenAuthentication
+from ndoh_hub.clients import get_client
+from ndoh_hub.export import StreamingExportView
 from ndoh_hub.utils import TokenAuthQueryString
 
 
@@ -33,7 +34,7 @@ class ChangePost(mixins.CreateModelMixin, generics.GenericAPIView):
 
     def post(self, request, *args, **kwargs):
         # load the users sources - posting users should only have one source
-        source = Source.objects.get(user=self.request.user)
+        source = get_source(self.request.user.id)
         request.data["source"] = source.id
         return self.create(request, *args, **kwargs)
 
@@ -70,6 +71,16 @@ class ChangeGetViewSet(viewsets.ReadOnlyModelViewSet):
     pagination_class = CreatedAtCursorPagination
 
 
+class ChangeExport(StreamingExportView):
+    """
+    API endpoint that streams all of the Changes matching the filters, as
+    NDJSON or CSV.
+    """
+    queryset = Change.objects.all()
+    filter_class = ChangeFilter
+    export_fields = ChangeSerializer.Meta.fields
+
+
 class OptOutInactiveIdentity(APIView):
     """
     Creates an Opt-out Change for an identity we can't send messages to
@@ -86,7 +97,7 @@ class OptOutInactiveIdentity(APIView):
         if identity_id is None or identity_id == "":
             raise ValidationError(
                 '"identity_id" must be supplied')
-        source = Source.objects.get(user=request.user)
+        source = get_source(request.user.id)
         Change.objects.create(source=source, registrant_id=identity_id,
                               action='momconnect_nonloss_optout',
                               data={'reason': 'sms_failure'})
@@ -94,14 +105,17 @@ class OptOutInactiveIdentity(APIView):
 
 
 def get_or_create_source(request):
-    source, created = Source.objects.get_or_create(
-        user=request.user,
-        defaults={
-            "authority": "advisor",
-            "name": (request.user.get_full_name() or
-                     request.user.username)
-            })
-    return source
+    try:
+        return get_source(request.user.id)
+    except Source.DoesNotExist:
+        source, created = Source.objects.get_or_create(
+            user=request.user,
+            defaults={
+                "authority": "advisor",
+                "name": (request.user.get_full_name() or
+                         request.user.username)
+                })
+        return source
 
 
 class ReceiveAdminOptout(generics.GenericAPIView):
@@ -116,10 +130,7 @@ class ReceiveAdminOptout(generics.GenericAPIView):
             return Response(admin_serializer.errors,
                             status=status.HTTP_400_BAD_REQUEST)
 
-        sbm_client = StageBasedMessagingApiClient(
-            api_url=settings.STAGE_BASED_MESSAGING_URL,
-            auth_token=settings.STAGE_BASED_MESSAGING_TOKEN
-        )
+        sbm_client = get_client('stage_based_messaging')
 
         active_subs = sbm_client.get_subscriptions(
             {'identity': identity_id, 'active': True}
@@ -206,20 +217,31 @@ class ReceiveWhatsAppEvent(generics.GenericAPIView):
     permission_classes = (IsAuthenticated, DjangoModelPermissions)
     queryset = Change.objects.none()
     serializer_class = ReceiveWhatsAppEventSerializer
-    authentication_classes = (TokenAuthQueryString, TokenAuthentication)
-
-    def post(self, request: Request, *args, **kwargs) -> Response:
-        serializer: Serializer = self.get_serializer(data=request.data)
+    authentication_classes = (TokenAuthQueryString, CachedTokenAuthentication)
+
+    def get_message_id(self, event: dict) -> str:
+        """
+        Returns the message id for the event, or None if this isn't an event
+        that we care about
+        """
+        serializer: Serializer = self.get_serializer(data=event)
         if not serializer.is_valid():
-            # If this isn't an event that we care about
-            return Response(status=status.HTTP_204_NO_CONTENT)
-
+            return None
         message_uuid: UUID = serializer.validated_data[
             'data']['message_metadata']['junebug_message_id']
+        return message_uuid.hex
+
+    def post(self, request: Request, *args, **kwargs) -> Response:
+        # Accept either a single event, or a list of events
+        events = request.data
+        if not isinstance(events, list):
+            events = [events]
+
+        message_ids = [self.get_message_id(event) for event in events]
+        message_ids = [m for m in message_ids if m is not None]
+        if not message_ids:
+            return Response(status=status.HTTP_204_NO_CONTENT)
 
-        tasks.process_whatsapp_unsent_event.delay(
-            message_uuid.hex,
-            request.user.pk,
-        )
+        tasks.buffer_whatsapp_unsent_events(message_ids, request.user.pk)
 
         return Response(status=status.HTTP_202_ACCEPTED)
@@ -44,7 +44,47 @@ if not User.objects.filter(username='admin').exists():
       { echo 'If $CELERY_WORKER or $CELERY_BEAT are set then $CELERY_APP must be provided'; exit 1; }
   }
 
-  if [ -n "$CELERY_WORKER" ]; then
+  # Worker profiles, one per queue. Each profile can be started on its own
+  # by setting $CELERY_WORKER_PROFILES to a comma separated list of profile
+  # names. Include the default profile, so that the tasks on the default
+  # ndoh_hub queue are run. The concurrency of a profile can be overridden with
+  # $CELERY_CONCURRENCY_<PROFILE>, eg. $CELERY_CONCURRENCY_JEMBI=40
+  celery_worker_profile() {
+    case "$1" in
+      # Validation is CPU and database bound, so use processes
+      validation)
+        queue=validation pool=prefork
+        concurrency="${CELERY_CONCURRENCY_VALIDATION:-4}" ;;
+      # The rest spend most of their time waiting on HTTP responses
+      identity_store)
+        queue=identity_store pool=gevent
+        concurrency="${CELERY_CONCURRENCY_IDENTITY_STORE:-50}" ;;
+      jembi)
+        queue=jembi pool=gevent
+        concurrency="${CELERY_CONCURRENCY_JEMBI:-20}" ;;
+      webhooks)
+        queue=webhooks pool=gevent
+        concurrency="${CELERY_CONCURRENCY_WEBHOOKS:-50}" ;;
+      metrics)
+        queue=metrics pool=gevent
+        concurrency="${CELERY_CONCURRENCY_METRICS:-10}" ;;
+      default)
+        queue=ndoh_hub pool=prefork
+        concurrency="${CELERY_CONCURRENCY_DEFAULT:-2}" ;;
+      *)
+        echo "Unknown celery worker profile '$1'"; exit 1 ;;
+    esac
+  }
+
+  if [ -n "$CELERY_WORKER_PROFILES" ]; then
+    ensure_celery_app
+    for profile in $(echo "$CELERY_WORKER_PROFILES" | tr ',' ' '); do
+      celery_worker_profile "$profile"
+      CELERY_WORKER_POOL="$pool" celery-entrypoint.sh worker \
+        --queues="$queue" --pool="$pool" --concurrency="$concurrency" \
+        --hostname="$profile@%h" --pidfile "worker-$profile.pid" &
+    done
+  elif [ -n "$CELERY_WORKER" ]; then
     ensure_celery_app
     celery-entrypoint.sh worker --pool=solo --pidfile worker.pid &
   fi
@@ -0,0 +1 @@
+default_app_config = 'ndoh_hub.apps.NdohHubAppConfig'
@@ -0,0 +1,26 @@
+from django.apps import AppConfig
+
+from django.db.models.signals import post_save, post_delete
+
+
+class NdohHubAppConfig(AppConfig):
+
+    name = 'ndoh_hub'
+
+    def ready(self):
+        from ndoh_hub import auth
+
+        post_delete.connect(
+            auth.token_deleted,
+            sender='authtoken.Token',
+            dispatch_uid='token_cache_token_deleted')
+
+        post_save.connect(
+            auth.user_saved,
+            sender='auth.User',
+            dispatch_uid='token_cache_user_saved')
+
+        post_delete.connect(
+            auth.user_saved,
+            sender='auth.User',
+            dispatch_uid='token_cache_user_deleted')
@@ -0,0 +1,129 @@
+"""
+Cached token authentication, shared by the REST API and the websocket
+middleware.
+
+Tokens are cached in each process for settings.TOKEN_CACHE_TTL seconds, in
+an LRU cache of at most settings.TOKEN_CACHE_SIZE tokens. Each cached token is
+stored with the version in Redis that it was read at. Deleting a token or
+saving or deleting its user removes it from the cache in the process that
+made the change, and increments the version once the change is committed, so
+that every other process reads its tokens from the database again. A TTL of 0
+disables the cache.
+"""
+import copy
+
+import redis
+from django.conf import settings
+from django.db import transaction
+from django.utils.translation import ugettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from ndoh_hub.cache import LRUCache
+
+VERSION_KEY = 'token_cache_version'
+
+_redis = None
+
+
+def get_redis():
+    global _redis
+    if _redis is None:
+        _redis = redis.StrictRedis.from_url(settings.REDIS_URL)
+    return _redis
+
+
+class TokenCache(LRUCache):
+    """
+    Cache of tokens, with their users, by key
+    """
+    @property
+    def maxsize(self):
+        return settings.TOKEN_CACHE_SIZE
+
+    @property
+    def ttl(self):
+        return settings.TOKEN_CACHE_TTL
+
+    def get_token(self, key):
+        """
+        Returns the token for the given key, with its user, from the cache if
+        it was cached at the current version. Raises Token.DoesNotExist if
+        there is no such token.
+        """
+        if not self.ttl:
+            return Token.objects.select_related('user').get(key=key)
+
+        # The version is read before the token, so that a token is never
+        # cached against a version that is newer than it
+        version = get_redis().get(VERSION_KEY)
+        entry = self.get(key)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        token = Token.objects.select_related('user').get(key=key)
+        self.set(key, (version, token))
+        return token
+
+    def delete_user(self, user_id):
+        self.delete_where(lambda entry: entry[1].user_id == user_id)
+
+
+token_cache = TokenCache()
+
+
+def get_token(key):
+    """
+    Returns the token for the given key, with its user. Raises
+    Token.DoesNotExist if there is no such token.
+
+    Each caller gets its own copy of the token and user, so that things
+    cached on the user during a request, eg. permissions, aren't shared.
+    """
+    token = token_cache.get_token(key)
+    user = copy.copy(token.user)
+    token = copy.copy(token)
+    token.user = user
+    return token
+
+
+def increment_version():
+    """
+    Increments the version in Redis, so that every process reads the tokens
+    from the database on their next read
+    """
+    if settings.TOKEN_CACHE_TTL:
+        get_redis().incr(VERSION_KEY)
+
+
+def token_deleted(sender, instance, **kwargs):
+    """ Post delete hook to remove the Token from the cache in every
+    process, connected in ndoh_hub.apps
+    """
+    token_cache.delete(instance.key)
+    transaction.on_commit(increment_version)
+
+
+def user_saved(sender, instance, **kwargs):
+    """ Post save and delete hook to remove the User's tokens from the
+    cache in every process, connected in ndoh_hub.apps
+    """
+    token_cache.delete_user(instance.pk)
+    transaction.on_commit(increment_version)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication that uses the token cache
+    """
+    def authenticate_credentials(self, key):
+        try:
+            token = get_token(key)
+        except Token.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.'))
+
+        return (token.user, token)
@@ -10,6 +10,12 @@ from django.conf import settings
 os.environ.setdefault('DJANGO_SETTINGS_MODULE',
                       'ndoh_hub.settings')
 
+# Workers using the gevent pool need psycopg2 to cooperate with gevent,
+# otherwise database queries block every other greenlet in the worker
+if os.environ.get('CELERY_WORKER_POOL') == 'gevent':
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
+
 app = Celery('')
 
 # Using a string here means the worker will not have to
@@ -0,0 +1,124 @@
+"""
+Registry of the clients for the external services that we talk to.
+
+Clients are only imported and created when they're first used, and are then
+reused, along with their HTTP sessions, by everything in the process. This
+keeps importing our modules cheap for management commands and when workers
+start up.
+
+A client is created for each distinct configuration, so that clients created
+from settings follow changes to those settings, eg. override_settings in
+tests.
+"""
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+def seed_client(service, path, url_setting, token_setting):
+    """
+    Returns the (config, create) pair for a seed services API client for the
+    service `service`
+    """
+    def config():
+        return (
+            getattr(settings, url_setting), getattr(settings, token_setting))
+
+    def create(url, token):
+        from ndoh_hub.instrumentation import instrument_session
+        from ndoh_hub.ratelimit import rate_limited_client
+        client_class = import_string(path)
+        client = rate_limited_client(
+            client_class(api_url=url, auth_token=token))
+        instrument_session(client.session, service)
+        return client
+
+    return config, create
+
+
+def create_metrics_client(url, auth):
+    from seed_services_client.metrics import MetricsApiClient
+    return MetricsApiClient(url=url, auth=auth)
+
+
+def create_http_session():
+    from ndoh_hub.instrumentation import instrument_session
+    from ndoh_hub.ratelimit import rate_limited_session
+    # The service is found from the URL of each request
+    return instrument_session(rate_limited_session())
+
+
+# Each client has a function that returns its configuration from settings,
+# and a function that creates the client for that configuration
+CLIENTS = {
+    'stage_based_messaging': seed_client(
+        'stage_based_messaging',
+        'seed_services_client.stage_based_messaging.'
+        'StageBasedMessagingApiClient',
+        'STAGE_BASED_MESSAGING_URL', 'STAGE_BASED_MESSAGING_TOKEN'),
+    'identity_store': seed_client(
+        'identity_store',
+        'seed_services_client.identity_store.IdentityStoreApiClient',
+        'IDENTITY_STORE_URL', 'IDENTITY_STORE_TOKEN'),
+    'message_sender': seed_client(
+        'message_sender',
+        'seed_services_client.message_sender.MessageSenderApiClient',
+        'MESSAGE_SENDER_URL', 'MESSAGE_SENDER_TOKEN'),
+    'service_rating': seed_client(
+        'service_rating',
+        'seed_services_client.service_rating.ServiceRatingApiClient',
+        'SERVICE_RATING_URL', 'SERVICE_RATING_TOKEN'),
+    'metrics': (
+        lambda: (settings.METRICS_URL, tuple(settings.METRICS_AUTH)),
+        create_metrics_client),
+    # For outbound requests that aren't made through an API client, eg. to
+    # Jembi and Wassup. Applies the outbound rate limits.
+    'http': (lambda: (), create_http_session),
+}
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def get_client(name):
+    """
+    Returns the client with the given name, creating it if this is the first
+    use with the current configuration
+    """
+    config, create = CLIENTS[name]
+    key = (name,) + config()
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = create(*key[1:])
+    return client
+
+
+def clear():
+    with _lock:
+        _clients.clear()
+
+
+class LazyClient(object):
+    """
+    Stands in for a client from the registry, so that it can be assigned at
+    import time, but is only created when it's first used
+    """
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attr):
+        return getattr(get_client(self._name), attr)
+
+    def __repr__(self):
+        return '<LazyClient {}>'.format(self._name)
+
+
+sbm_client = LazyClient('stage_based_messaging')
+is_client = LazyClient('identity_store')
+ms_client = LazyClient('message_sender')
+sr_client = LazyClient('service_rating')
+http_session = LazyClient('http')
@@ -0,0 +1,147 @@
+"""
+Streaming exports of whole tables, for downstream systems that sync all of
+our data, eg. analytics.
+
+Rows are read from the database with a server side cursor, and each row is
+rendered and sent as it is read, so exports use constant memory, and are sent
+in a single response, however many rows there are.
+"""
+import csv
+import datetime
+import json
+import uuid
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
+from rest_framework import generics
+from rest_framework.exceptions import ValidationError
+from rest_framework.fields import DateTimeField
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+_represent_datetime = DateTimeField().to_representation
+
+
+def represent(value):
+    """
+    Returns the JSON representation of a database value, the same as our
+    model serializers would
+    """
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, datetime.datetime):
+        return _represent_datetime(value)
+    return value
+
+
+class NDJSONRenderer(JSONRenderer):
+    """
+    Renders newline delimited JSON, one object per row
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def stream(self, fields, rows):
+        for row in rows:
+            yield json.dumps(dict(zip(
+                fields, (represent(value) for value in row)))) + '\n'
+
+
+class Echo(object):
+    """
+    A file-like object that returns what is written to it, so that rows can
+    be rendered one at a time by a csv writer
+    """
+    def write(self, value):
+        return value
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    Renders CSV, with a header row of the field names. Values that aren't
+    strings or numbers are rendered as JSON.
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    @staticmethod
+    def represent(value):
+        value = represent(value)
+        if value is None:
+            return ''
+        if isinstance(value, (dict, list, bool)):
+            return json.dumps(value)
+        return value
+
+    def stream(self, fields, rows):
+        writer = csv.writer(Echo())
+        yield writer.writerow(fields)
+        for row in rows:
+            yield writer.writerow([self.represent(value) for value in row])
+
+
+class StreamingExportView(generics.GenericAPIView):
+    """
+    Streams all of the rows in the queryset that match the filters, as NDJSON
+    (the default) or CSV, selected with `?format=` or the Accept header.
+
+    `since` is an ISO 8601 timestamp, for incremental syncs. Rows are returned
+    in order of when they were last updated, so the `updated_at` of the last
+    row that was received is the `since` for the next sync. `updated_at` is
+    set before a row's transaction commits, so a row can be committed after a
+    sync with an earlier `updated_at` than rows that the sync returned. Rows
+    updated up to EXPORT_SINCE_OVERLAP seconds before `since` are returned
+    again, so that these rows aren't missed, and clients should replace the
+    rows that they already have by primary key.
+
+    Subclasses set `queryset`, `filter_class`, and `export_fields`, the names
+    of the fields to export. Foreign keys are exported as their primary keys.
+    """
+    permission_classes = (IsAuthenticated,)
+    renderer_classes = (NDJSONRenderer, CSVRenderer)
+    pagination_class = None
+    export_fields = ()
+
+    def handle_exception(self, exc):
+        # Errors are rendered as JSON, whichever format the rows are in
+        response = super(StreamingExportView, self).handle_exception(exc)
+        self.request.accepted_renderer = JSONRenderer()
+        self.request.accepted_media_type = JSONRenderer.media_type
+        return response
+
+    def get_since(self):
+        since = self.request.query_params.get('since')
+        if not since:
+            return None
+        try:
+            value = parse_datetime(since)
+        except ValueError:
+            value = None
+        if value is None:
+            raise ValidationError({
+                'since': ["Must be an ISO 8601 timestamp"]})
+        return value
+
+    def get_queryset(self):
+        queryset = super(StreamingExportView, self).get_queryset()
+        since = self.get_since()
+        if since is not None:
+            overlap = datetime.timedelta(seconds=settings.EXPORT_SINCE_OVERLAP)
+            queryset = queryset.filter(updated_at__gte=since - overlap)
+        return queryset.order_by('updated_at', 'pk')
+
+    def get(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        # iterator uses a server side cursor, and doesn't cache the results
+        rows = queryset.values_list(*self.export_fields).iterator()
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(self.export_fields, rows),
+            content_type=renderer.media_type)
+        if renderer.format == 'csv':
+            response['Content-Disposition'] = (
+                'attachment; filename="{}.csv"'.format(
+                    self.queryset.model._meta.model_name))
+        return response
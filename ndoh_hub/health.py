@@ -0,0 +1,203 @@
+"""
+Health checks of the services that we depend on.
+
+Each dependency is probed concurrently, and the whole check takes at most
+HEALTHCHECK_TIMEOUT seconds. Each probe is also limited to that long, so that
+a hung dependency doesn't hold on to a probe thread after the check has given
+up on it. A dependency is:
+
+ - healthy: if its probe succeeded within HEALTHCHECK_DEGRADED_LATENCY seconds
+ - degraded: if its probe was slower than that, or the dependency is
+   available but rejected the probe, eg. because of our credentials
+ - unhealthy: if its probe failed or timed out
+
+We are unhealthy if one of the critical dependencies, which we can't accept
+requests without, is unhealthy, otherwise degraded if any dependency isn't
+healthy. The result is cached for HEALTHCHECK_CACHE_TTL seconds, so that
+frequent polling doesn't add load to the dependencies.
+"""
+import asyncio
+import math
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from timeit import default_timer
+
+import requests
+from asgiref.sync import async_to_sync
+from celery import current_app
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import connection
+
+from ndoh_hub.cache import LRUCache
+
+HEALTHY = 'healthy'
+DEGRADED = 'degraded'
+UNHEALTHY = 'unhealthy'
+
+
+class ProbeDegraded(Exception):
+    """
+    Raised by a probe if the dependency is available, but not working as it
+    should
+    """
+
+
+def probe_database(timeout):
+    # A new connection is made for each probe, so that connecting and the
+    # query are both limited by the timeout. libpq's connect_timeout is in
+    # whole seconds.
+    params = connection.get_connection_params()
+    params['connect_timeout'] = max(1, int(math.ceil(timeout)))
+    params['options'] = '-c statement_timeout={:d}'.format(
+        max(1, int(timeout * 1000)))
+    conn = connection.get_new_connection(params)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT 1')
+    finally:
+        conn.close()
+
+
+def probe_broker(timeout):
+    with current_app.connection(connect_timeout=timeout) as conn:
+        conn.ensure_connection(max_retries=1)
+
+
+def probe_channel_layer(timeout):
+    # Sending to a group without any channels only reads from the layer
+    async def send():
+        await asyncio.wait_for(
+            get_channel_layer().group_send(
+                'healthcheck', {'type': 'healthcheck'}),
+            timeout)
+    async_to_sync(send)()
+
+
+def probe_http(url, timeout, **kwargs):
+    response = requests.get(url, timeout=timeout, **kwargs)
+    if response.status_code >= 500:
+        response.raise_for_status()
+    if response.status_code >= 400:
+        raise ProbeDegraded('HTTP {}'.format(response.status_code))
+
+
+def seed_service_probe(url_setting, token_setting):
+    """
+    Returns a probe of the API root of a seed service
+    """
+    def probe(timeout):
+        probe_http(
+            '{}/'.format(getattr(settings, url_setting).rstrip('/')), timeout,
+            headers={
+                'Authorization':
+                    'Token {}'.format(getattr(settings, token_setting)),
+            })
+    return probe
+
+
+def probe_jembi(timeout):
+    probe_http(
+        settings.JEMBI_BASE_URL, timeout,
+        auth=(settings.JEMBI_USERNAME, settings.JEMBI_PASSWORD))
+
+
+# Each dependency has its probe, and whether it is critical
+PROBES = OrderedDict((
+    ('database', (probe_database, True)),
+    ('broker', (probe_broker, True)),
+    ('channel_layer', (probe_channel_layer, False)),
+    ('stage_based_messaging', (seed_service_probe(
+        'STAGE_BASED_MESSAGING_URL', 'STAGE_BASED_MESSAGING_TOKEN'), False)),
+    ('identity_store', (seed_service_probe(
+        'IDENTITY_STORE_URL', 'IDENTITY_STORE_TOKEN'), False)),
+    ('message_sender', (seed_service_probe(
+        'MESSAGE_SENDER_URL', 'MESSAGE_SENDER_TOKEN'), False)),
+    ('jembi', (probe_jembi, False)),
+))
+
+_executor = ThreadPoolExecutor(max_workers=len(PROBES))
+
+
+def run_probe(probe, timeout):
+    """
+    Runs `probe`, returning the dependency's status and the probe's latency
+    """
+    start = default_timer()
+    try:
+        probe(timeout)
+    except ProbeDegraded as e:
+        status, error = DEGRADED, str(e)
+    except Exception as e:
+        status, error = UNHEALTHY, '{}: {}'.format(type(e).__name__, e)
+    else:
+        status, error = HEALTHY, None
+    latency = default_timer() - start
+    if status == HEALTHY and latency > settings.HEALTHCHECK_DEGRADED_LATENCY:
+        status, error = DEGRADED, 'Slow response'
+    result = {'status': status, 'latency': round(latency, 4)}
+    if error is not None:
+        result['error'] = error
+    return result
+
+
+def check_health():
+    """
+    Probes all the dependencies concurrently, and returns our health
+    """
+    timeout = settings.HEALTHCHECK_TIMEOUT
+    deadline = default_timer() + timeout
+    futures = OrderedDict(
+        (name, _executor.submit(run_probe, probe, timeout))
+        for name, (probe, _) in PROBES.items())
+
+    results = OrderedDict()
+    for name, future in futures.items():
+        try:
+            results[name] = future.result(
+                timeout=max(0, deadline - default_timer()))
+        except TimeoutError:
+            results[name] = {
+                'status': UNHEALTHY, 'latency': timeout, 'error': 'Timed out'}
+
+    statuses = set(result['status'] for result in results.values())
+    if any(results[name]['status'] == UNHEALTHY
+           for name, (_, critical) in PROBES.items() if critical):
+        status = UNHEALTHY
+    elif statuses != {HEALTHY}:
+        status = DEGRADED
+    else:
+        status = HEALTHY
+    return {'up': status != UNHEALTHY, 'status': status, 'result': results}
+
+
+class HealthCache(LRUCache):
+    """
+    Cache of the last health check
+    """
+    maxsize = 1
+
+    @property
+    def ttl(self):
+        return settings.HEALTHCHECK_CACHE_TTL
+
+
+cache = HealthCache()
+_lock = threading.Lock()
+
+
+def get_health():
+    """
+    Returns our health, from the cache if it was checked recently. Only one
+    check runs at a time, requests that arrive during a check wait for its
+    result.
+    """
+    health = cache.get('health')
+    if health is None:
+        with _lock:
+            health = cache.get('health')
+            if health is None:
+                health = check_health()
+                cache.set('health', health)
+    return health
@@ -0,0 +1,450 @@
+"""
+Instrumentation of the web requests, the Celery tasks and the requests to
+external services.
+
+A sample of INSTRUMENTATION_SAMPLE_RATE of the requests and tasks are
+recorded, in metrics kept in memory by each process:
+
+ - request_duration_seconds: the latency of each request, by view name and
+   method
+ - task_duration_seconds: the run time of each task, by task name
+ - task_db_queries: the number of database queries made by each task, by task
+   name
+ - task_retries_total: the number of retries of each task, by task name. All
+   the retries are counted.
+ - external_request_duration_seconds: the latency of each request to an
+   external service, by service and operation, eg. ("identity_store",
+   "GET /api/v1/identities/:id/")
+
+The metrics are cumulative, like Prometheus metrics. Each process pushes the
+increases since its last push to the metrics API, at most every
+INSTRUMENTATION_FLUSH_INTERVAL seconds, after a request or task finishes. The
+push is made in a background thread, so that it doesn't delay the request or
+task. Histogram bucket counts are pushed as .sum metrics, so that they're
+added up across the processes. If INSTRUMENTATION_DIRECTORY is set, each
+process also saves its metrics there at the same time, for
+ndoh_hub.prometheus to expose. The files of processes that are no longer
+running are removed, so the directory must only be shared by processes that
+can see each other's process IDs.
+"""
+import bisect
+import errno
+import json
+import logging
+import os
+import random
+import re
+import threading
+from timeit import default_timer
+
+from django.conf import settings
+from django.db import connection
+
+try:
+    from urlparse import urlparse
+except ImportError:
+    from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+INF = float('inf')
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, INF)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, INF)
+
+LABEL_NAMES = {
+    'request_duration_seconds': ('view', 'method'),
+    'task_duration_seconds': ('task',),
+    'task_db_queries': ('task',),
+    'task_retries_total': ('task',),
+    'external_request_duration_seconds': ('service', 'operation'),
+}
+
+# Path segments that are IDs, eg. UUIDs, numbers and MSISDNs, are replaced so
+# that there is one operation per endpoint
+ID_SEGMENT = re.compile(r'^(\+?\d+|[0-9a-fA-F-]{32,36})$')
+
+
+class Histogram(object):
+    """
+    Counts of observed values per bucket, where each bucket is the upper bound
+    of the values that it counts, along with the total count and sum
+    """
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative_counts(self):
+        """
+        Returns (bucket, count of values <= bucket) for each bucket
+        """
+        total = 0
+        for bucket, count in zip(self.buckets, self.counts):
+            total += count
+            yield bucket, total
+
+
+class Registry(object):
+    """
+    The histograms and counters for this process, by metric name and label
+    values
+    """
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.pushed = {}
+        self.last_push = default_timer()
+        self.lock = threading.Lock()
+
+    def observe(self, name, labels, value, buckets=DURATION_BUCKETS):
+        with self.lock:
+            histogram = self.histograms.get((name, labels))
+            if histogram is None:
+                histogram = self.histograms[(name, labels)] = Histogram(
+                    buckets)
+            histogram.observe(value)
+
+    def increment(self, name, labels, amount=1):
+        with self.lock:
+            self.counters[(name, labels)] = (
+                self.counters.get((name, labels), 0) + amount)
+
+    def collect(self):
+        """
+        Returns a list of (name, labels, histogram) for all the histograms
+        """
+        with self.lock:
+            return sorted(
+                (name, labels, histogram)
+                for (name, labels), histogram in self.histograms.items())
+
+    def collect_counters(self):
+        """
+        Returns a list of (name, labels, value) for all the counters
+        """
+        with self.lock:
+            return sorted(
+                (name, labels, value)
+                for (name, labels), value in self.counters.items())
+
+    def to_dict(self):
+        """
+        Returns all the metrics, in a form that can be encoded as JSON
+        """
+        return {
+            'histograms': [
+                [name, labels, histogram.buckets, histogram.counts,
+                 histogram.count, histogram.sum]
+                for name, labels, histogram in self.collect()],
+            'counters': self.collect_counters(),
+        }
+
+    def merge(self, data):
+        """
+        Adds the metrics from `data`, from `to_dict`, to these metrics
+        """
+        with self.lock:
+            for name, labels, buckets, counts, count, total in \
+                    data['histograms']:
+                key = (name, tuple(labels))
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = Histogram(
+                        tuple(buckets))
+                elif histogram.buckets != tuple(buckets):
+                    # The buckets were changed, and can't be added up
+                    continue
+                histogram.counts = [
+                    a + b for a, b in zip(histogram.counts, counts)]
+                histogram.count += count
+                histogram.sum += total
+            for name, labels, value in data['counters']:
+                key = (name, tuple(labels))
+                self.counters[key] = self.counters.get(key, 0) + value
+
+    def get_values(self):
+        """
+        Returns all the values, as metrics API metric names and values
+        """
+        values = {}
+        for name, labels, histogram in self.collect():
+            prefix = get_metric_prefix(name, labels)
+            for bucket, count in histogram.cumulative_counts():
+                bucket = '+Inf' if bucket == INF else str(bucket)
+                values['{}.bucket.{}.sum'.format(
+                    prefix, metric_name_part(bucket))] = count
+            values['{}.count.sum'.format(prefix)] = histogram.count
+            values['{}.{}.sum'.format(
+                prefix, 'seconds' if name.endswith('_seconds') else 'total'
+            )] = histogram.sum
+        for name, labels, value in self.collect_counters():
+            values['{}.sum'.format(get_metric_prefix(name, labels))] = value
+        return values
+
+    def get_increases(self, values):
+        """
+        Returns the increases in `values` since the values that were last
+        pushed
+        """
+        increases = {}
+        for metric, value in values.items():
+            increase = value - self.pushed.get(metric, 0)
+            if increase:
+                increases[metric] = increase
+        return increases
+
+    def clear(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.pushed = {}
+            self.last_push = default_timer()
+
+
+registry = Registry()
+
+
+def metric_name_part(value):
+    """
+    Replaces the characters in `value` that have meaning in metric names
+    """
+    return re.sub(r'[^A-Za-z0-9_:+-]', '_', value)
+
+
+def get_metric_prefix(name, labels):
+    return '.'.join(
+        (name,) + tuple(metric_name_part(label) for label in labels))
+
+
+def sampled():
+    rate = settings.INSTRUMENTATION_SAMPLE_RATE
+    return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+def get_operation(request):
+    """
+    Returns the operation of a request, its method and path with IDs removed
+    """
+    path = '/'.join(
+        ':id' if ID_SEGMENT.match(segment) else segment
+        for segment in urlparse(request.url).path.split('/'))
+    return '{} {}'.format(request.method, path)
+
+
+def get_service(url, default):
+    """
+    Returns the name of the external service for requests to `url` that
+    aren't made through a service's API client
+    """
+    host = urlparse(url).hostname
+    for service, setting in (
+            ('jembi', 'JEMBI_BASE_URL'), ('wassup', 'WASSUP_URL'),
+            ('junebug', 'JUNEBUG_BASE_URL')):
+        if urlparse(getattr(settings, setting)).hostname == host:
+            return service
+    return default or host
+
+
+def instrument_session(session, service=None):
+    """
+    Records the latency of a sample of the requests made using the requests
+    session `session`, to the service `service`, or to the service found from
+    the request URL if None
+    """
+    def record_response(response, *args, **kwargs):
+        if sampled():
+            registry.observe(
+                'external_request_duration_seconds', (
+                    service or get_service(response.request.url, None),
+                    get_operation(response.request)),
+                response.elapsed.total_seconds())
+
+    session.hooks['response'].append(record_response)
+    return session
+
+
+# Keyed by task ID, because a process can run more than one task at a time
+_running_tasks = {}
+
+
+def task_prerun(task_id=None, task=None, **kwargs):
+    if not sampled():
+        return
+    debug_cursor = connection.force_debug_cursor
+    connection.force_debug_cursor = True
+    _running_tasks[task_id] = (
+        default_timer(), len(connection.queries_log), debug_cursor)
+
+
+def task_postrun(task_id=None, task=None, **kwargs):
+    running = _running_tasks.pop(task_id, None)
+    if running is not None:
+        start, queries, debug_cursor = running
+        registry.observe(
+            'task_duration_seconds', (task.name,), default_timer() - start)
+        registry.observe(
+            'task_db_queries', (task.name,),
+            len(connection.queries_log) - queries, QUERY_BUCKETS)
+        connection.force_debug_cursor = debug_cursor
+        if not debug_cursor and not settings.DEBUG:
+            connection.queries_log.clear()
+    maybe_push()
+
+
+def task_retry(sender=None, **kwargs):
+    registry.increment('task_retries_total', (sender.name,))
+
+
+class RequestLatencyMiddleware(object):
+    """
+    Records the latency of a sample of the requests, by view
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if sampled():
+            start = default_timer()
+            response = self.get_response(request)
+            # Requests that didn't match a URL don't have a view
+            match = getattr(request, 'resolver_match', None)
+            if match is not None:
+                registry.observe(
+                    'request_duration_seconds',
+                    (match.view_name, request.method),
+                    default_timer() - start)
+        else:
+            response = self.get_response(request)
+        maybe_push()
+        return response
+
+
+def process_running(pid):
+    """
+    Returns whether there is a running process with the process ID `pid`
+    """
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        # EPERM means that it's running as another user
+        return e.errno != errno.ESRCH
+    return True
+
+
+def remove_dead_processes(directory):
+    """
+    Removes the saved metrics of the processes that are no longer running,
+    from before a restart, so that they don't pile up
+    """
+    for filename in os.listdir(directory):
+        pid = filename.split('.')[0]
+        if not filename.endswith(('.json', '.json.tmp')) or not pid.isdigit():
+            continue
+        if process_running(int(pid)):
+            continue
+        try:
+            os.remove(os.path.join(directory, filename))
+        except (IOError, OSError):
+            # Already removed by another process
+            pass
+
+
+def save():
+    """
+    Saves this process's metrics in INSTRUMENTATION_DIRECTORY, if it's set
+    """
+    directory = settings.INSTRUMENTATION_DIRECTORY
+    if not directory:
+        return
+    remove_dead_processes(directory)
+    path = os.path.join(directory, '{}.json'.format(os.getpid()))
+    # Written to a temporary file and renamed, so that readers never see a
+    # partly written file
+    with open(path + '.tmp', 'w') as f:
+        json.dump(registry.to_dict(), f)
+    os.rename(path + '.tmp', path)
+
+
+def load():
+    """
+    Returns a registry with the metrics of all the running processes that
+    have saved their metrics in INSTRUMENTATION_DIRECTORY, and the current
+    metrics of this process
+    """
+    merged = Registry()
+    directory = settings.INSTRUMENTATION_DIRECTORY
+    own = '{}.json'.format(os.getpid())
+    if directory:
+        remove_dead_processes(directory)
+        for filename in sorted(os.listdir(directory)):
+            if not filename.endswith('.json') or filename == own:
+                continue
+            try:
+                with open(os.path.join(directory, filename)) as f:
+                    merged.merge(json.load(f))
+            except (IOError, OSError, ValueError):
+                # Removed, or not a metrics file
+                logger.warning('Could not load metrics from %s', filename)
+    merged.merge(registry.to_dict())
+    return merged
+
+
+# Held while a push is running, so that only one push runs at a time
+_push_lock = threading.Lock()
+
+
+def maybe_push():
+    """
+    Starts a push in a background thread, if it has been at least
+    INSTRUMENTATION_FLUSH_INTERVAL seconds since the last push and a push
+    isn't already running. Returns the thread, or None if no push was
+    started.
+    """
+    now = default_timer()
+    if now - registry.last_push < settings.INSTRUMENTATION_FLUSH_INTERVAL:
+        return None
+    if not _push_lock.acquire(False):
+        return None
+    registry.last_push = now
+    thread = threading.Thread(
+        target=_push_in_background, name='instrumentation-push')
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+def _push_in_background():
+    try:
+        push()
+    finally:
+        _push_lock.release()
+
+
+def push():
+    """
+    Saves the metrics, and pushes the increases since the last push to the
+    metrics API
+    """
+    try:
+        save()
+    except (IOError, OSError):
+        logger.exception('Error saving the instrumentation metrics')
+    values = registry.get_values()
+    increases = registry.get_increases(values)
+    if not increases:
+        return
+    from ndoh_hub.clients import get_client
+    try:
+        get_client('metrics').fire_metrics(**increases)
+    except Exception:
+        # The increases are pushed with the next push instead
+        logger.exception('Error pushing the instrumentation metrics')
+    else:
+        registry.pushed = values
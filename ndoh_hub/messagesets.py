@@ -0,0 +1,115 @@
+"""
+A precomputed table of the subscription to create for a registration, for
+each (reg_type, authority, weeks).
+
+Each entry has the messageset's short name, which includes the batch number,
+the messageset and schedule IDs, and the starting sequence number. The table
+is built from all the messagesets and schedules in the Stage Based Messaging
+service, using get_messageset_short_name and get_sequence_number, and cached
+for MESSAGESET_TABLE_TTL seconds. A MESSAGESET_TABLE_TTL of 0 disables the
+table, and each subscription's messageset is looked up instead.
+"""
+import threading
+from collections import namedtuple
+from itertools import product
+
+from django.conf import settings
+
+from ndoh_hub import utils
+from ndoh_hub.cache import LRUCache
+from registrations import positions
+from registrations.models import Registration
+
+AUTHORITIES = ('hw_full', 'hw_partial', 'patient')
+# Weeks outside of this range aren't in the table, and are calculated when
+# they're looked up
+WEEKS = range(-1, 61)
+
+MessagesetEntry = namedtuple('MessagesetEntry', [
+    'short_name', 'messageset_id', 'schedule_id', 'next_sequence_number'])
+
+
+def build_table():
+    """
+    Returns the table, as a dict of (reg_type, authority, weeks) to
+    MessagesetEntry. Combinations whose messageset doesn't exist are left
+    out. The RTHB NurseConnect entries' sequence number is None, because it
+    comes from the position tracker when the subscription is created.
+    """
+    messagesets = {
+        messageset['short_name']: messageset
+        for messageset in utils.sbm_client.get_messagesets()['results']}
+    msgs_per_week = {}
+
+    table = {}
+    for (reg_type, _), authority, weeks in product(
+            Registration.REG_TYPE_CHOICES, AUTHORITIES, WEEKS):
+        short_name = utils.get_messageset_short_name(
+            reg_type, authority, weeks)
+        messageset = messagesets.get(short_name)
+        if messageset is None:
+            continue
+
+        schedule_id = messageset['default_schedule']
+        if 'prebirth' in short_name and schedule_id not in msgs_per_week:
+            schedule = utils.sbm_client.get_schedule(schedule_id)
+            msgs_per_week[schedule_id] = len(
+                schedule['day_of_week'].split(','))
+
+        next_sequence_number = None
+        if 'nurseconnect_rthb' not in short_name:
+            next_sequence_number = utils.get_sequence_number(
+                short_name, weeks, msgs_per_week.get(schedule_id))
+        table[(reg_type, authority, weeks)] = MessagesetEntry(
+            short_name, messageset['id'], schedule_id, next_sequence_number)
+    return table
+
+
+class MessagesetTableCache(LRUCache):
+    """
+    Cache of the messageset table
+    """
+    maxsize = 1
+
+    @property
+    def ttl(self):
+        return settings.MESSAGESET_TABLE_TTL
+
+
+cache = MessagesetTableCache()
+_lock = threading.Lock()
+
+
+def get_table():
+    """
+    Returns the table, building it if it isn't cached. Only one build runs at
+    a time.
+    """
+    table = cache.get('table')
+    if table is None:
+        with _lock:
+            table = cache.get('table')
+            if table is None:
+                table = build_table()
+                cache.set('table', table)
+    return table
+
+
+def get_messageset_schedule_sequence(reg_type, authority, weeks):
+    """
+    Returns the (messageset ID, schedule ID, next sequence number) of the
+    subscription to create for a registration, like
+    utils.get_messageset_schedule_sequence
+    """
+    entry = None
+    if settings.MESSAGESET_TABLE_TTL:
+        entry = get_table().get((reg_type, authority, weeks))
+    if entry is None:
+        short_name = utils.get_messageset_short_name(
+            reg_type, authority, weeks)
+        return utils.get_messageset_schedule_sequence(short_name, weeks)
+
+    next_sequence_number = entry.next_sequence_number
+    if next_sequence_number is None:
+        next_sequence_number = positions.get_position('nurseconnect_rthb')
+    return entry.messageset_id, entry.schedule_id, next_sequence_number
@@ -0,0 +1,76 @@
+"""
+Resolves vumi message ids to the identities that the messages were sent to,
+using the Message Sender.
+
+The Message Sender can only look up one message id at a time, so uncached
+message ids are looked up concurrently, and the results, including messages
+that couldn't be found, are cached in each process. An outbound's identity
+never changes, so the cache only needs to expire to bound its memory use.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from ndoh_hub import utils
+from ndoh_hub.cache import LRUCache
+
+
+class OutboundIdentityCache(LRUCache):
+    @property
+    def maxsize(self):
+        return settings.OUTBOUND_IDENTITY_CACHE_SIZE
+
+    @property
+    def ttl(self):
+        return settings.OUTBOUND_IDENTITY_CACHE_TTL
+
+
+identity_cache = OutboundIdentityCache()
+
+# Cached for messages that the Message Sender doesn't know about
+NOT_FOUND = ''
+
+
+def lookup_outbound_identity(vumi_message_id):
+    """
+    Returns the identity that the message was sent to from the Message
+    Sender, or None if there is no such message
+    """
+    outbounds = utils.ms_client.get_outbounds({
+        'vumi_message_id': vumi_message_id,
+    })['results']
+    outbound = next(outbounds, None)
+    return outbound and outbound['to_identity']
+
+
+def resolve_outbound_identities(vumi_message_ids):
+    """
+    Returns a dict of message id to the identity that the message was sent
+    to, or None for messages that can't be found
+    """
+    identities = {}
+    missing = []
+    for message_id in set(vumi_message_ids):
+        identity = identity_cache.get(message_id)
+        if identity is None:
+            missing.append(message_id)
+        else:
+            identities[message_id] = identity or None
+
+    if missing:
+        workers = min(len(missing), settings.OUTBOUND_LOOKUP_CONCURRENCY)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(lookup_outbound_identity, missing)
+            for message_id, identity in zip(missing, results):
+                identity_cache.set(message_id, identity or NOT_FOUND)
+                identities[message_id] = identity
+
+    return identities
+
+
+def resolve_outbound_identity(vumi_message_id):
+    """
+    Returns the identity that the message was sent to, or None if the message
+    can't be found
+    """
+    return resolve_outbound_identities([vumi_message_id])[vumi_message_id]
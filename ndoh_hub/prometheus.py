@@ -0,0 +1,174 @@
+"""
+Exposes the instrumentation metrics, and gauges for finding saturation, in the
+Prometheus text format.
+
+The web processes serve the metrics at /metrics. Celery workers don't serve
+HTTP, so the serve_metrics management command is run next to them as a
+sidecar. The metrics of all the processes are only included if they save
+their metrics to a shared INSTRUMENTATION_DIRECTORY, see
+ndoh_hub.instrumentation. The directory should be emptied when the processes
+are restarted.
+"""
+import logging
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
+
+from ndoh_hub import instrumentation
+from ndoh_hub.scheduled_metrics import get_queue_length
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+HELP = {
+    'request_duration_seconds': 'Latency of the requests to each view',
+    'task_duration_seconds': 'Run time of each Celery task',
+    'task_db_queries': 'Number of database queries made by each Celery task',
+    'task_retries_total': 'Number of retries of each Celery task',
+    'external_request_duration_seconds':
+        'Latency of the requests to each external service',
+    'celery_queue_length': 'Number of messages waiting in each Celery queue',
+    'db_connections': 'Number of open connections to the database, by state',
+    'db_max_connections': 'Maximum number of connections to the database',
+}
+
+
+def escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n')\
+        .replace('"', r'\"')
+
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    return '{%s}' % ','.join(
+        '{}="{}"'.format(name, escape(value))
+        for name, value in zip(names, values))
+
+
+def format_value(value):
+    if value == instrumentation.INF:
+        return '+Inf'
+    return repr(float(value))
+
+
+def header(name, metric_type):
+    return [
+        '# HELP {} {}'.format(name, HELP.get(name, name)),
+        '# TYPE {} {}'.format(name, metric_type),
+    ]
+
+
+def render_registry(registry):
+    """
+    Returns the lines for the histograms and counters in `registry`
+    """
+    lines = []
+    last_name = None
+    for name, labels, histogram in registry.collect():
+        if name != last_name:
+            lines.extend(header(name, 'histogram'))
+            last_name = name
+        names = instrumentation.LABEL_NAMES.get(name, ())
+        for bucket, count in histogram.cumulative_counts():
+            lines.append('{}_bucket{} {}'.format(
+                name,
+                format_labels(
+                    names + ('le',), labels + (format_value(bucket),)),
+                format_value(count)))
+        lines.append('{}_count{} {}'.format(
+            name, format_labels(names, labels),
+            format_value(histogram.count)))
+        lines.append('{}_sum{} {}'.format(
+            name, format_labels(names, labels), format_value(histogram.sum)))
+    for name, labels, value in registry.collect_counters():
+        if name != last_name:
+            lines.extend(header(name, 'counter'))
+            last_name = name
+        lines.append('{}{} {}'.format(
+            name,
+            format_labels(instrumentation.LABEL_NAMES.get(name, ()), labels),
+            format_value(value)))
+    return lines
+
+
+def get_queue_lengths():
+    """
+    Returns (labels, value) for the length of each of the Celery queues
+    """
+    return [
+        ((queue.name,), get_queue_length(queue.name))
+        for queue in settings.CELERY_QUEUES
+    ]
+
+
+def get_db_connections():
+    """
+    Returns (labels, value) for the number of connections to our database in
+    each state. Each process has at most one connection per thread, which is
+    kept open for CONN_MAX_AGE, so this shows how close we are to
+    db_max_connections.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT coalesce(state, 'unknown'), count(*) "
+            "FROM pg_stat_activity WHERE datname = current_database() "
+            "GROUP BY 1 ORDER BY 1")
+        return [((state,), count) for state, count in cursor.fetchall()]
+
+
+def get_db_max_connections():
+    with connection.cursor() as cursor:
+        cursor.execute("SHOW max_connections")
+        [(max_connections,)] = cursor.fetchall()
+    return [((), int(max_connections))]
+
+
+GAUGES = (
+    ('celery_queue_length', ('queue',), get_queue_lengths),
+    ('db_connections', ('state',), get_db_connections),
+    ('db_max_connections', (), get_db_max_connections),
+)
+
+
+def render_gauges():
+    """
+    Returns the lines for the gauges. A gauge that can't be read, eg. because
+    the broker is down, is left out, so that the other metrics are still
+    available.
+    """
+    lines = []
+    for name, names, get_values in GAUGES:
+        try:
+            values = get_values()
+        except Exception:
+            logger.exception('Error reading the %s gauge', name)
+            continue
+        lines.extend(header(name, 'gauge'))
+        for labels, value in values:
+            lines.append('{}{} {}'.format(
+                name, format_labels(names, labels), format_value(value)))
+    return lines
+
+
+def render_metrics():
+    """
+    Returns all the metrics, in the Prometheus text format
+    """
+    lines = render_registry(instrumentation.load()) + render_gauges()
+    return '\n'.join(lines) + '\n'
+
+
+class PrometheusMetricsView(APIView):
+
+    """ Prometheus Metrics
+        GET - returns the metrics in the Prometheus text format
+    """
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(render_metrics(), content_type=CONTENT_TYPE)
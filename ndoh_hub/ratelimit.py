@@ -0,0 +1,152 @@
+"""
+Distributed token bucket rate limiting for outbound HTTP requests.
+
+Limits are configured per destination host in settings.OUTBOUND_RATE_LIMITS,
+and the buckets are stored in Redis so that the limit is shared between all
+of the web and Celery worker processes.
+"""
+import time
+try:
+    from urlparse import urlparse
+except ImportError:
+    from urllib.parse import urlparse
+
+import redis
+import requests
+from django.conf import settings
+from seed_services_client.seed_services import SeedHTTPAdapter
+
+
+# Refills the bucket according to the time elapsed since the last request,
+# and then takes the requested tokens if there are enough. Returns the number
+# of seconds to wait until there will be enough tokens, or 0 if the tokens
+# were taken. Returned as a string, because Redis truncates Lua numbers to
+# integers.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local requested = tonumber(ARGV[4])
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'timestamp')
+local tokens = tonumber(bucket[1]) or capacity
+local timestamp = tonumber(bucket[2]) or now
+
+tokens = math.min(capacity, tokens + math.max(0, now - timestamp) * rate)
+local wait = 0
+if tokens >= requested then
+    tokens = tokens - requested
+else
+    wait = (requested - tokens) / rate
+end
+
+redis.call('HMSET', KEYS[1], 'tokens', tokens, 'timestamp', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+_redis = None
+_buckets = {}
+
+
+def get_redis():
+    global _redis
+    if _redis is None:
+        _redis = redis.StrictRedis.from_url(settings.RATE_LIMIT_REDIS_URL)
+    return _redis
+
+
+class TokenBucket(object):
+    """
+    A token bucket stored in Redis, that refills at `rate` tokens per second,
+    up to a maximum of `capacity` tokens.
+    """
+    def __init__(self, redis_client, key, rate, capacity):
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity
+        self.script = redis_client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    def consume(self, tokens=1):
+        """
+        Attempts to take `tokens` from the bucket. Returns 0 if the tokens
+        were taken, otherwise the number of seconds to wait before trying
+        again.
+        """
+        wait = self.script(
+            keys=[self.key],
+            args=[self.rate, self.capacity, time.time(), tokens])
+        return float(wait)
+
+    def acquire(self, tokens=1):
+        """
+        Blocks until `tokens` have been taken from the bucket
+        """
+        wait = self.consume(tokens)
+        while wait > 0:
+            time.sleep(wait)
+            wait = self.consume(tokens)
+
+
+def get_bucket(url):
+    """
+    Returns the token bucket for the host of `url`, or None if there is no
+    rate limit configured for that host.
+    """
+    host = urlparse(url).hostname
+    limit = settings.OUTBOUND_RATE_LIMITS.get(host)
+    if limit is None:
+        return None
+
+    rate, capacity = limit
+    bucket = _buckets.get(host)
+    if bucket is None or (bucket.rate, bucket.capacity) != (rate, capacity):
+        bucket = TokenBucket(
+            get_redis(), 'ratelimit:{}'.format(host), rate, capacity)
+        _buckets[host] = bucket
+    return bucket
+
+
+def throttle(url):
+    """
+    Blocks until a request to `url` is allowed by the rate limit for its host
+    """
+    bucket = get_bucket(url)
+    if bucket is not None:
+        bucket.acquire()
+
+
+class RateLimitedHTTPAdapter(SeedHTTPAdapter):
+    """
+    HTTP adapter that waits for the destination host's rate limit before
+    sending each request
+    """
+    def send(self, request, *args, **kwargs):
+        throttle(request.url)
+        return super(RateLimitedHTTPAdapter, self).send(
+            request, *args, **kwargs)
+
+
+def mount_rate_limiter(session, timeout=None):
+    """
+    Mounts the rate limiting adapter on the given requests session
+    """
+    session.mount('http://', RateLimitedHTTPAdapter(timeout=timeout))
+    session.mount('https://', RateLimitedHTTPAdapter(timeout=timeout))
+    return session
+
+
+def rate_limited_client(client, timeout=65):
+    """
+    Applies the rate limiter to a seed services API client, keeping the
+    client's default timeout
+    """
+    mount_rate_limiter(client.session, timeout=timeout)
+    return client
+
+
+def rate_limited_session():
+    """
+    Returns a new requests session that applies the rate limits
+    """
+    return mount_rate_limiter(requests.Session())
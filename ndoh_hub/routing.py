@@ -4,6 +4,7 @@ from django.utils.functional import SimpleLazyObject
 from rest_framework.authtoken.models import Token
 from urllib.parse import parse_qs
 
+from ndoh_hub.auth import get_token
 import registrations.consumers as registrations
 
 
@@ -18,9 +19,12 @@ class TokenAuthMiddleware(object):
     def get_user(self, scope):
         try:
             token = parse_qs(scope['query_string'])[b'token'][0].decode()
-            return Token.objects.select_related('user').get(key=token).user
+            user = get_token(token).user
         except (KeyError, IndexError, Token.DoesNotExist):
             return None
+        if not user.is_active:
+            return None
+        return user
 
     def __call__(self, scope):
         if 'user' not in scope:
@@ -0,0 +1,171 @@
+"""
+Scheduled metrics are gauges that are calculated periodically, by the
+scheduled_metrics task, and fired to the metrics API in a single request.
+
+The calculators are listed in METRICS_SCHEDULED_TASKS. Each calculator is a
+function that returns a dict of metric name to value, using cheap aggregate
+queries, and has a `names` function that returns the names of the metrics
+that it calculates, for the list of available metrics. The time taken by each
+calculator is fired along with its metrics.
+"""
+import datetime
+import logging
+from timeit import default_timer
+
+from celery import current_app
+from celery.task import Task
+from django.conf import settings
+from django.db.models import Case, Count, Sum, When
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from changes.models import Change
+from ndoh_hub.utils import get_metric_client
+from registrations.models import Registration, RegistrationStatistic, Source
+from registrations.statistics import update_registration_statistics
+
+logger = logging.getLogger(__name__)
+
+
+def calculator(names):
+    """
+    Marks the decorated function as a calculator of the metrics returned by
+    the function `names`
+    """
+    def decorator(func):
+        func.names = names
+        return func
+    return decorator
+
+
+def get_queue_length(queue):
+    """
+    Returns the number of messages waiting in the Celery queue `queue`
+    """
+    with current_app.connection_or_acquire() as conn:
+        try:
+            return conn.default_channel.queue_declare(
+                queue=queue, passive=True).message_count
+        except conn.channel_errors:
+            # Queues that haven't been declared, eg. Redis queues that have
+            # been emptied, don't have any messages
+            return 0
+
+
+def registration_total_names():
+    return [
+        'registrations.type.%s.total.last' % reg_type
+        for reg_type, _ in Registration.REG_TYPE_CHOICES
+    ] + [
+        'registrations.source.%s.total.last' % source_id
+        for source_id in Source.objects.values_list('pk', flat=True)
+    ]
+
+
+@calculator(names=registration_total_names)
+def registration_totals():
+    """
+    The total registrations per registration type and per source, from the
+    daily registration statistics
+    """
+    update_registration_statistics()
+    statistics = RegistrationStatistic.objects.order_by()
+    metrics = dict.fromkeys(registration_total_names(), 0)
+    for reg_type, total in statistics.values_list('reg_type')\
+            .annotate(total=Sum('count')):
+        metrics['registrations.type.%s.total.last' % reg_type] = total
+    for source_id, total in statistics.values_list('source_id')\
+            .annotate(total=Sum('count')):
+        metrics['registrations.source.%s.total.last' % source_id] = total
+    return metrics
+
+
+@calculator(names=lambda: ['registrations.validation_failure_rate.last'])
+def validation_failure_rate():
+    """
+    The fraction of the registrations created in the last
+    METRICS_VALIDATION_FAILURE_WINDOW seconds that failed validation, out of
+    the registrations that have been through validation
+    """
+    since = timezone.now() - datetime.timedelta(
+        seconds=settings.METRICS_VALIDATION_FAILURE_WINDOW)
+    counts = Registration.objects.filter(created_at__gte=since).aggregate(
+        validated=Count(Case(When(validated=True, then=1))),
+        failed=Count(Case(When(data__has_key='invalid_fields', then=1))))
+    total = counts['validated'] + counts['failed']
+    rate = counts['failed'] / float(total) if total else 0.0
+    return {'registrations.validation_failure_rate.last': rate}
+
+
+@calculator(names=lambda: ['changes.pending.last'])
+def pending_changes():
+    """
+    The number of changes that are waiting to be validated
+    """
+    # Uses the partial index on unvalidated changes
+    return {
+        'changes.pending.last': Change.objects.filter(validated=False)
+        .exclude(data__has_key='invalid_fields').count(),
+    }
+
+
+@calculator(names=lambda: ['jembi.backlog.last'])
+def jembi_backlog():
+    """
+    The number of pushes to Jembi that are waiting in the jembi queue
+    """
+    return {'jembi.backlog.last': get_queue_length('jembi')}
+
+
+def get_calculators():
+    return [import_string(path) for path in settings.METRICS_SCHEDULED_TASKS]
+
+
+def get_compute_time_name(calculator):
+    return 'scheduled_metrics.%s.compute_time.last' % calculator.__name__
+
+
+def get_scheduled_metric_names():
+    """
+    Returns the names of all the scheduled metrics
+    """
+    names = []
+    for calculator in get_calculators():
+        names.extend(calculator.names())
+        names.append(get_compute_time_name(calculator))
+    return names
+
+
+def calculate_metrics():
+    """
+    Runs all the calculators, returning a dict of all the metrics, and the
+    time in seconds that each calculator took. A calculator that fails is
+    logged and skipped, so that it doesn't hold back the other metrics.
+    """
+    metrics = {}
+    for calculator in get_calculators():
+        start = default_timer()
+        try:
+            metrics.update(calculator())
+        except Exception:
+            logger.exception(
+                'Error calculating scheduled metrics %s', calculator.__name__)
+            continue
+        metrics[get_compute_time_name(calculator)] = default_timer() - start
+    return metrics
+
+
+class ScheduledMetrics(Task):
+
+    """ Calculates all the scheduled metrics, and fires them using a single
+        MetricsApiClient request
+    """
+    name = "ndoh_hub.tasks.scheduled_metrics"
+
+    def run(self, **kwargs):
+        metrics = calculate_metrics()
+        get_metric_client().fire_metrics(**metrics)
+        return "Fired %s scheduled metrics" % len(metrics)
+
+
+scheduled_metrics = ScheduledMetrics()
@@ -10,6 +10,7 @@ https://docs.djangoproject.com/en/1.9/ref/settings/
 
 from kombu import Exchange, Queue
 
+import datetime
 import os
 import djcelery
 import dj_database_url
@@ -58,6 +59,7 @@ INSTALLED_APPS = (
     'channels',
     'simple_history',
     # us
+    'ndoh_hub',
     'registrations',
     'changes'
 
@@ -73,6 +75,7 @@ MIDDLEWARE = (
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'simple_history.middleware.HistoryRequestMiddleware',
+    'ndoh_hub.instrumentation.RequestLatencyMiddleware',
 )
 
 ROOT_URLCONF = 'ndoh_hub.urls'
@@ -191,7 +194,7 @@ REST_FRAMEWORK = {
         'rest_framework.pagination.CursorPagination',
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework.authentication.BasicAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+        'ndoh_hub.auth.CachedTokenAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -217,10 +220,19 @@ CELERYBEAT_SCHEDULER = 'djcelery.schedulers.DatabaseScheduler'
 BROKER_URL = os.environ.get('BROKER_URL', 'redis://localhost:6379/0')
 
 CELERY_DEFAULT_QUEUE = 'ndoh_hub'
-CELERY_QUEUES = (
-    Queue('ndoh_hub',
-          Exchange('ndoh_hub'),
-          routing_key='ndoh_hub'),
+CELERY_QUEUES = tuple(
+    Queue(name, Exchange(name), routing_key=name) for name in (
+        'ndoh_hub',
+        # CPU and database bound registration and change validation
+        'validation',
+        # Identity Store reads and writes
+        'identity_store',
+        # Pushes of registrations and changes to Jembi
+        'jembi',
+        # Outbound webhooks and callbacks
+        'webhooks',
+        'metrics',
+    )
 )
 
 CELERY_ALWAYS_EAGER = False
@@ -229,25 +241,88 @@ CELERY_ALWAYS_EAGER = False
 CELERY_IMPORTS = (
     'registrations.tasks',
     'changes.tasks',
+    'ndoh_hub.scheduled_metrics',
 )
 
 CELERY_CREATE_MISSING_QUEUES = True
+# NOTE: These must match the names that the tasks are registered under. Task
+#       classes without an explicit `name` are registered under their module
+#       and class name, eg. 'registrations.tasks.DeliverHook'
 CELERY_ROUTES = {
-    'celery.backend_cleanup': {
-        'queue': 'mediumpriority',
-    },
     'ndoh_hub.registrations.tasks.validate_subscribe': {
-        'queue': 'mediumpriority',
+        'queue': 'validation',
+    },
+    'registrations.tasks.ValidateSubscribeJembiAppRegistration': {
+        'queue': 'validation',
     },
     'ndoh_hub.changes.tasks.validate_implement': {
-        'queue': 'mediumpriority',
+        'queue': 'validation',
+    },
+    'ndoh_hub.registrations.tasks.resolve_third_party_registration_identities': {  # noqa
+        'queue': 'identity_store',
+    },
+    'registrations.tasks.remove_personally_identifiable_fields': {
+        'queue': 'identity_store',
+    },
+    'changes.tasks.remove_personally_identifiable_fields': {
+        'queue': 'identity_store',
+    },
+    'ndoh_hub.registrations.tasks.push_registration_to_jembi': {
+        'queue': 'jembi',
+    },
+    'ndoh_hub.registrations.tasks.push_pmtct_registration_to_jembi': {
+        'queue': 'jembi',
+    },
+    'ndoh_hub.registrations.tasks.push_nurse_registration_to_jembi': {
+        'queue': 'jembi',
+    },
+    'ndoh_hub.changes.tasks.push_momconnect_optout_to_jembi': {
+        'queue': 'jembi',
+    },
+    'ndoh_hub.changes.tasks.push_pmtct_optout_to_jembi': {
+        'queue': 'jembi',
+    },
+    'ndoh_hub.changes.tasks.push_momconnect_babyloss_to_jembi': {
+        'queue': 'jembi',
+    },
+    'ndoh_hub.changes.tasks.push_momconnect_babyswitch_to_jembi': {
+        'queue': 'jembi',
+    },
+    'ndoh_hub.changes.tasks.push_nurseconnect_optout_to_jembi': {
+        'queue': 'jembi',
+    },
+    'ndoh_hub.changes.tasks.push_channel_switch_to_jembi': {
+        'queue': 'jembi',
     },
     'registrations.tasks.DeliverHook': {
-        'queue': 'priority',
+        'queue': 'webhooks',
+    },
+    'registrations.tasks.HTTPRequestWithRetries': {
+        'queue': 'webhooks',
     },
     'ndoh_hub.tasks.fire_metric': {
         'queue': 'metrics',
     },
+    'ndoh_hub.tasks.scheduled_metrics': {
+        'queue': 'metrics',
+    },
+    'ndoh_hub.registrations.tasks.update_registration_statistics': {
+        'queue': 'metrics',
+    },
+}
+
+# The DatabaseScheduler adds these to the periodic tasks when beat starts
+CELERYBEAT_SCHEDULE = {
+    'scheduled-metrics': {
+        'task': 'ndoh_hub.tasks.scheduled_metrics',
+        'schedule': datetime.timedelta(seconds=int(os.environ.get(
+            'METRICS_SCHEDULED_INTERVAL', '300'))),
+    },
+    'update-registration-statistics': {
+        'task': 'ndoh_hub.registrations.tasks.update_registration_statistics',
+        'schedule': datetime.timedelta(seconds=int(os.environ.get(
+            'REGISTRATION_STATISTICS_INTERVAL', '300'))),
+    },
 }
 
 CELERY_TASK_SERIALIZER = 'json'
@@ -269,10 +344,35 @@ CHANNEL_LAYERS = {
 METRICS_REALTIME = [
     'registrations.created.sum',
 ]
-METRICS_SCHEDULED = [  # type: ignore
-]
-METRICS_SCHEDULED_TASKS = [  # type: ignore
+# Calculators of the metrics fired by the scheduled_metrics task, see
+# ndoh_hub.scheduled_metrics
+METRICS_SCHEDULED_TASKS = [
+    'ndoh_hub.scheduled_metrics.registration_totals',
+    'ndoh_hub.scheduled_metrics.validation_failure_rate',
+    'ndoh_hub.scheduled_metrics.pending_changes',
+    'ndoh_hub.scheduled_metrics.jembi_backlog',
 ]
+# The period, in seconds, of recently created registrations that the
+# validation failure rate is calculated over
+METRICS_VALIDATION_FAILURE_WINDOW = int(
+    os.environ.get('METRICS_VALIDATION_FAILURE_WINDOW', str(24 * 60 * 60)))
+
+# The fraction of tasks and external requests whose timings are recorded, see
+# ndoh_hub.instrumentation
+INSTRUMENTATION_SAMPLE_RATE = float(
+    os.environ.get('INSTRUMENTATION_SAMPLE_RATE', '0.1'))
+INSTRUMENTATION_FLUSH_INTERVAL = int(
+    os.environ.get('INSTRUMENTATION_FLUSH_INTERVAL', '60'))
+# Where each process saves its metrics for the Prometheus metrics endpoint
+INSTRUMENTATION_DIRECTORY = os.environ.get('INSTRUMENTATION_DIRECTORY', None)
+
+# The maximum time, in seconds, that the health check waits for the probes
+HEALTHCHECK_TIMEOUT = float(os.environ.get('HEALTHCHECK_TIMEOUT', '2'))
+# Probes that take longer than this, in seconds, report their dependency as
+# degraded
+HEALTHCHECK_DEGRADED_LATENCY = float(
+    os.environ.get('HEALTHCHECK_DEGRADED_LATENCY', '1'))
+HEALTHCHECK_CACHE_TTL = int(os.environ.get('HEALTHCHECK_CACHE_TTL', '5'))
 
 METRICS_URL = os.environ.get('METRICS_URL', 'http://metrics/api/v1')
 METRICS_AUTH = (
@@ -312,3 +412,70 @@ WASSUP_NUMBER = os.environ.get('WASSUP_NUMBER', '+27820000000')
 
 NURSECONNECT_RTHB = os.environ.get(
     'NURSECONNECT_RTHB', 'false').lower() == 'true'
+
+# Rate limits for outbound requests, per destination host, in the format
+# "host=rate:burst,host=rate:burst", where rate is the number of requests per
+# second and burst is the maximum number of requests allowed at once. Hosts
+# without a limit are not rate limited.
+OUTBOUND_RATE_LIMITS = {
+    host: tuple(float(v) for v in limit.split(':'))
+    for host, limit in (
+        item.strip().split('=') for item in
+        os.environ.get('OUTBOUND_RATE_LIMITS', '').split(',') if item.strip())
+}
+RATE_LIMIT_REDIS_URL = os.environ.get('RATE_LIMIT_REDIS_URL', REDIS_URL)
+
+# How long, in seconds, each process caches the Source for a user
+SOURCE_CACHE_TTL = int(os.environ.get('SOURCE_CACHE_TTL', 300))
+
+# How long, in seconds, each process caches the table of the messageset,
+# schedule and starting sequence number for new subscriptions. 0 disables the
+# table, and the messageset is looked up for each subscription instead.
+MESSAGESET_TABLE_TTL = int(os.environ.get('MESSAGESET_TABLE_TTL', 300))
+
+# How long, in seconds, each process caches the position trackers' positions.
+# Changes in other processes are picked up through a version in Redis, so this
+# only limits how long a position is kept if Redis misses a change. 0 disables
+# the cache.
+POSITION_CACHE_TTL = int(os.environ.get('POSITION_CACHE_TTL', 60))
+
+# How long, in seconds, each process caches auth tokens for. Deleted tokens
+# and saved users are picked up by other processes through a version in Redis,
+# so this only limits how long a token is kept if Redis misses a change. 0
+# disables the cache.
+TOKEN_CACHE_TTL = int(os.environ.get('TOKEN_CACHE_TTL', 30))
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 1000))
+
+# WhatsApp unsent events are coalesced per user over this many seconds, so
+# that an outage results in one channel switch per identity
+WHATSAPP_UNSENT_EVENT_WINDOW = int(
+    os.environ.get('WHATSAPP_UNSENT_EVENT_WINDOW', 60))
+
+# Vumi message id to identity lookups on the Message Sender are cached per
+# process, and uncached ids are looked up this many at a time
+OUTBOUND_IDENTITY_CACHE_SIZE = int(
+    os.environ.get('OUTBOUND_IDENTITY_CACHE_SIZE', 10000))
+OUTBOUND_IDENTITY_CACHE_TTL = int(
+    os.environ.get('OUTBOUND_IDENTITY_CACHE_TTL', 3600))
+OUTBOUND_LOOKUP_CONCURRENCY = int(
+    os.environ.get('OUTBOUND_LOOKUP_CONCURRENCY', 10))
+
+# The maximum number of threads, and so database connections, that the
+# websocket consumers use for database access in each process
+WEBSOCKET_DB_THREADS = int(os.environ.get('WEBSOCKET_DB_THREADS', 10))
+
+# The change feed returns at most this many events at a time, and long polls
+# wait for new events for at most FEED_LONG_POLL_TIMEOUT seconds, checking
+# every FEED_POLL_INTERVAL seconds
+FEED_PAGE_SIZE = int(os.environ.get('FEED_PAGE_SIZE', 1000))
+FEED_LONG_POLL_TIMEOUT = float(os.environ.get('FEED_LONG_POLL_TIMEOUT', 30))
+FEED_POLL_INTERVAL = float(os.environ.get('FEED_POLL_INTERVAL', 1))
+
+# Registrations written up to this many seconds before the last update of the
+# registration statistics are checked again, in case they were committed late
+REGISTRATION_STATISTICS_OVERLAP = int(
+    os.environ.get('REGISTRATION_STATISTICS_OVERLAP', 300))
+
+# Rows updated up to this many seconds before the `since` of an export are
+# exported again, in case they were committed late, see ndoh_hub.export
+EXPORT_SINCE_OVERLAP = int(os.environ.get('EXPORT_SINCE_OVERLAP', 300))
@@ -0,0 +1,157 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework import exceptions
+from rest_framework.authtoken.models import Token
+
+from ndoh_hub.auth import (
+    CachedTokenAuthentication, TokenCache, get_token, token_cache)
+
+
+class FakeRedis(object):
+    """
+    Stands in for the version stored in Redis
+    """
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def incr(self, key):
+        self.values[key] = self.values.get(key, 0) + 1
+        return self.values[key]
+
+
+@override_settings(TOKEN_CACHE_TTL=30)
+class GetTokenTests(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        patcher = mock.patch(
+            'ndoh_hub.auth.get_redis', return_value=FakeRedis())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user('test')
+        self.token = Token.objects.create(user=self.user)
+
+    def test_cached(self):
+        """
+        The token and user should only be fetched from the database once
+        """
+        with self.assertNumQueries(1):
+            self.assertEqual(get_token(self.token.key).user, self.user)
+            self.assertEqual(get_token(self.token.key).user, self.user)
+
+    def test_copies(self):
+        """
+        Each call should get its own copy of the user, so that per request
+        state isn't shared
+        """
+        self.assertIsNot(
+            get_token(self.token.key).user, get_token(self.token.key).user)
+
+    def test_token_deleted(self):
+        """
+        Deleting the token should remove it from the cache
+        """
+        get_token(self.token.key)
+        self.token.delete()
+        with self.assertRaises(Token.DoesNotExist):
+            get_token(self.token.key)
+
+    def test_user_saved(self):
+        """
+        Saving the user should remove their tokens from the cache, so that
+        deactivated users are seen straight away
+        """
+        get_token(self.token.key)
+        self.user.is_active = False
+        self.user.save()
+        self.assertFalse(get_token(self.token.key).user.is_active)
+
+    @override_settings(TOKEN_CACHE_SIZE=1)
+    def test_lru(self):
+        """
+        The least recently used tokens should be evicted once the cache is
+        full
+        """
+        other = Token.objects.create(user=User.objects.create_user('other'))
+        get_token(self.token.key)
+        get_token(other.key)
+        self.assertIsNone(token_cache.get(self.token.key))
+        self.assertIsNotNone(token_cache.get(other.key))
+
+    @override_settings(TOKEN_CACHE_TTL=0)
+    def test_expiry(self):
+        """
+        Tokens should expire from the cache after the TTL
+        """
+        get_token(self.token.key)
+        self.assertIsNone(token_cache.get(self.token.key))
+
+
+@override_settings(TOKEN_CACHE_TTL=30)
+class OtherProcessTests(TransactionTestCase):
+    """
+    Changes should be seen by the caches in other processes once they're
+    committed
+    """
+    def setUp(self):
+        patcher = mock.patch(
+            'ndoh_hub.auth.get_redis', return_value=FakeRedis())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user('test')
+        self.token = Token.objects.create(user=self.user)
+        self.other = TokenCache()
+
+    def test_token_deleted(self):
+        """
+        Deleting the token should remove it from the other caches
+        """
+        self.other.get_token(self.token.key)
+        self.token.delete()
+        with self.assertRaises(Token.DoesNotExist):
+            self.other.get_token(self.token.key)
+
+    def test_user_saved(self):
+        """
+        Deactivating the user should be seen by the other caches
+        """
+        self.other.get_token(self.token.key)
+        self.user.is_active = False
+        self.user.save()
+        self.assertFalse(self.other.get_token(self.token.key).user.is_active)
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    def setUp(self):
+        token_cache.clear()
+
+    def test_invalid_token(self):
+        """
+        Unknown tokens should fail authentication
+        """
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            CachedTokenAuthentication().authenticate_credentials('bad')
+
+    def test_inactive_user(self):
+        """
+        Tokens for inactive users should fail authentication
+        """
+        user = User.objects.create_user('test', is_active=False)
+        token = Token.objects.create(user=user)
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            CachedTokenAuthentication().authenticate_credentials(token.key)
+
+    def test_valid_token(self):
+        """
+        Valid tokens should return the user and token
+        """
+        user = User.objects.create_user('test')
+        token = Token.objects.create(user=user)
+        auth_user, auth_token = (
+            CachedTokenAuthentication().authenticate_credentials(token.key))
+        self.assertEqual(auth_user, user)
+        self.assertEqual(auth_token, token)
@@ -0,0 +1,26 @@
+from celery import current_app
+from django.conf import settings
+from django.test import TestCase
+
+import changes.tasks  # noqa
+import ndoh_hub.scheduled_metrics  # noqa
+import registrations.tasks  # noqa
+
+
+class CeleryRoutesTests(TestCase):
+    def test_routes_match_registered_tasks(self):
+        """
+        Every route should be for a task name that is registered, otherwise
+        the task silently ends up on the default queue
+        """
+        unregistered = set(settings.CELERY_ROUTES) - set(current_app.tasks)
+        self.assertEqual(unregistered, set())
+
+    def test_routes_to_known_queues(self):
+        """
+        Every route should be to one of the configured queues, so that there
+        is a worker profile consuming it
+        """
+        queues = set(q.name for q in settings.CELERY_QUEUES)
+        for task_name, route in settings.CELERY_ROUTES.items():
+            self.assertIn(route['queue'], queues, task_name)
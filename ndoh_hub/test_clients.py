@@ -0,0 +1,80 @@
+from django.test import TestCase, override_settings
+import responses
+
+from ndoh_hub import clients
+
+
+class GetClientTests(TestCase):
+    def setUp(self):
+        clients.clear()
+
+    def tearDown(self):
+        clients.clear()
+
+    def test_reused(self):
+        """
+        The same client should be returned for each use
+        """
+        client = clients.get_client('identity_store')
+        self.assertIs(clients.get_client('identity_store'), client)
+        self.assertIsNot(clients.get_client('stage_based_messaging'), client)
+
+    @responses.activate
+    def test_settings_changed(self):
+        """
+        If the settings for a client change, a new client with the new
+        settings should be created
+        """
+        responses.add(
+            responses.GET,
+            'http://identitystore/api/v1/identities/identity-uuid/',
+            json={'id': 'identity-uuid'}, status=200)
+
+        client = clients.get_client('identity_store')
+        with override_settings(
+                IDENTITY_STORE_URL='http://identitystore/api/v1',
+                IDENTITY_STORE_TOKEN='identitystore_token'):
+            other = clients.get_client('identity_store')
+        self.assertIsNot(other, client)
+        self.assertIs(clients.get_client('identity_store'), client)
+
+        other.get_identity('identity-uuid')
+        [call] = responses.calls
+        self.assertEqual(call.request.headers['Authorization'],
+                         'Token identitystore_token')
+
+    def test_http_session(self):
+        """
+        The http client should be a single shared requests session
+        """
+        session = clients.get_client('http')
+        self.assertIs(clients.get_client('http'), session)
+
+
+class LazyClientTests(TestCase):
+    def setUp(self):
+        clients.clear()
+
+    def test_lazy(self):
+        """
+        The client should only be created when it is first used
+        """
+        client = clients.LazyClient('identity_store')
+        self.assertEqual(clients._clients, {})
+
+        client.session
+        self.assertEqual(list(clients._clients), [
+            ('identity_store', 'http://is/api/v1', 'REPLACEME')])
+
+    @responses.activate
+    def test_delegates(self):
+        """
+        Requests should be made with the client from the registry
+        """
+        responses.add(
+            responses.GET, 'http://is/api/v1/identities/identity-uuid/',
+            json={'id': 'identity-uuid'}, status=200)
+
+        self.assertEqual(
+            clients.is_client.get_identity('identity-uuid'),
+            {'id': 'identity-uuid'})
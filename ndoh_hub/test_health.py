@@ -0,0 +1,184 @@
+import asyncio
+import time
+from collections import OrderedDict
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+import responses
+
+from ndoh_hub import health
+
+
+def healthy(timeout):
+    pass
+
+
+def failing(timeout):
+    raise Exception('Connection refused')
+
+
+def rejected(timeout):
+    raise health.ProbeDegraded('HTTP 401')
+
+
+def slow(timeout):
+    time.sleep(0.05)
+
+
+def hanging(timeout):
+    time.sleep(0.5)
+
+
+@override_settings(
+    HEALTHCHECK_TIMEOUT=0.2, HEALTHCHECK_DEGRADED_LATENCY=0.02,
+    HEALTHCHECK_CACHE_TTL=5)
+class CheckHealthTests(TestCase):
+    def setUp(self):
+        health.cache.clear()
+
+    def tearDown(self):
+        health.cache.clear()
+
+    def check(self, **probes):
+        with mock.patch.object(health, 'PROBES', OrderedDict(
+                (name, (probe, name.startswith('critical')))
+                for name, probe in sorted(probes.items()))):
+            return health.check_health()
+
+    def test_healthy(self):
+        """
+        If all the probes succeed quickly, we should be healthy
+        """
+        result = self.check(critical=healthy, other=healthy)
+        self.assertEqual(result['up'], True)
+        self.assertEqual(result['status'], 'healthy')
+        self.assertEqual(list(result['result']), ['critical', 'other'])
+        self.assertEqual(result['result']['other']['status'], 'healthy')
+        self.assertIn('latency', result['result']['other'])
+        self.assertNotIn('error', result['result']['other'])
+
+    def test_degraded(self):
+        """
+        Slow dependencies, dependencies that reject the probe, and
+        non-critical dependencies that fail should make us degraded
+        """
+        result = self.check(
+            critical=slow, rejected=rejected, failing=failing)
+        self.assertEqual(result['up'], True)
+        self.assertEqual(result['status'], 'degraded')
+        self.assertEqual(result['result']['critical'], {
+            'status': 'degraded', 'error': 'Slow response',
+            'latency': mock.ANY})
+        self.assertEqual(result['result']['rejected']['status'], 'degraded')
+        self.assertEqual(result['result']['rejected']['error'], 'HTTP 401')
+        self.assertEqual(result['result']['failing']['status'], 'unhealthy')
+        self.assertEqual(
+            result['result']['failing']['error'],
+            'Exception: Connection refused')
+
+    def test_unhealthy(self):
+        """
+        If a critical dependency fails, we should be unhealthy
+        """
+        result = self.check(critical=failing, other=healthy)
+        self.assertEqual(result['up'], False)
+        self.assertEqual(result['status'], 'unhealthy')
+
+    def test_timeout(self):
+        """
+        The check shouldn't wait longer than the timeout for the probes
+        """
+        start = time.time()
+        result = self.check(critical_hanging=hanging, other=healthy)
+        self.assertLess(time.time() - start, 0.4)
+        self.assertEqual(result['status'], 'unhealthy')
+        self.assertEqual(result['result']['critical_hanging'], {
+            'status': 'unhealthy', 'error': 'Timed out', 'latency': 0.2})
+        self.assertEqual(result['result']['other']['status'], 'healthy')
+
+    @mock.patch('ndoh_hub.health.check_health')
+    def test_cached(self, check_health):
+        """
+        The result should be reused until it expires
+        """
+        check_health.return_value = {'up': True}
+        self.assertEqual(health.get_health(), {'up': True})
+        self.assertEqual(health.get_health(), {'up': True})
+        self.assertEqual(check_health.call_count, 1)
+
+        health.cache.clear()
+        health.get_health()
+        self.assertEqual(check_health.call_count, 2)
+
+
+class ProbeTests(TestCase):
+    def test_database(self):
+        health.probe_database(1)
+
+    @mock.patch('ndoh_hub.health.get_channel_layer')
+    def test_channel_layer_timeout(self, get_channel_layer):
+        """
+        The channel layer probe should fail if the layer doesn't respond
+        within the timeout
+        """
+        async def group_send(group, message):
+            await asyncio.sleep(10)
+        get_channel_layer.return_value.group_send = group_send
+
+        with self.assertRaises(asyncio.TimeoutError):
+            health.probe_channel_layer(0.01)
+
+    @responses.activate
+    def test_http(self):
+        """
+        Server errors should fail the probe, and client errors should report
+        the dependency as degraded
+        """
+        responses.add(responses.GET, 'http://ok/')
+        responses.add(responses.GET, 'http://rejected/', status=401)
+        responses.add(responses.GET, 'http://error/', status=500)
+
+        health.probe_http('http://ok/', 1)
+        with self.assertRaises(health.ProbeDegraded):
+            health.probe_http('http://rejected/', 1)
+        with self.assertRaises(Exception):
+            health.probe_http('http://error/', 1)
+
+    @responses.activate
+    def test_seed_service(self):
+        """
+        Seed services should be probed at their API root, with our token
+        """
+        responses.add(responses.GET, 'http://is/api/v1/')
+        health.seed_service_probe(
+            'IDENTITY_STORE_URL', 'IDENTITY_STORE_TOKEN')(1)
+        [call] = responses.calls
+        self.assertEqual(
+            call.request.headers['Authorization'], 'Token REPLACEME')
+
+
+class HealthcheckViewTests(TestCase):
+    def setUp(self):
+        health.cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('test'))
+
+    def tearDown(self):
+        health.cache.clear()
+
+    @mock.patch('ndoh_hub.health.check_health')
+    def test_healthy(self, check_health):
+        check_health.return_value = {
+            'up': True, 'status': 'degraded', 'result': {}}
+        response = self.client.get('/api/health/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'degraded')
+
+    @mock.patch('ndoh_hub.health.check_health')
+    def test_unhealthy(self, check_health):
+        check_health.return_value = {
+            'up': False, 'status': 'unhealthy', 'result': {}}
+        response = self.client.get('/api/health/')
+        self.assertEqual(response.status_code, 503)
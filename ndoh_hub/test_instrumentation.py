@@ -0,0 +1,221 @@
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+
+from celery.signals import task_retry
+from celery.task import task
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+import requests
+import responses
+from rest_framework.test import APIClient
+
+from ndoh_hub import instrumentation
+from ndoh_hub.instrumentation import Histogram, Registry, registry
+
+
+@task()
+def count_users():
+    return User.objects.count()
+
+
+class HistogramTests(TestCase):
+    def test_observe(self):
+        """
+        Values should be counted in the lowest bucket that they fit in
+        """
+        histogram = Histogram((1, 5, float('inf')))
+        for value in (0.5, 1, 3, 10):
+            histogram.observe(value)
+        self.assertEqual(list(histogram.cumulative_counts()), [
+            (1, 2), (5, 3), (float('inf'), 4)])
+        self.assertEqual(histogram.count, 4)
+        self.assertEqual(histogram.sum, 14.5)
+
+
+@override_settings(
+    INSTRUMENTATION_SAMPLE_RATE=1, INSTRUMENTATION_FLUSH_INTERVAL=3600)
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        registry.clear()
+
+    def tearDown(self):
+        registry.clear()
+
+    def get_histogram(self, name, labels):
+        return registry.histograms[(name, labels)]
+
+    def test_get_operation(self):
+        """
+        IDs should be removed from the request path
+        """
+        request = requests.Request(
+            'GET', 'http://is/api/v1/identities/'
+            'b4a8f8e2-2f5c-4c1f-9c58-0a4c7d6d2b1e/addresses/msisdn?a=b'
+        ).prepare()
+        self.assertEqual(
+            instrumentation.get_operation(request),
+            'GET /api/v1/identities/:id/addresses/msisdn')
+
+    @responses.activate
+    def test_external_requests(self):
+        """
+        The latency of requests made with an instrumented session should be
+        recorded by service and operation
+        """
+        responses.add(responses.GET, 'http://is/api/v1/identities/1/')
+        responses.add(responses.POST, 'http://jembi/ws/rest/v1/subscription')
+        session = instrumentation.instrument_session(requests.Session())
+        service_session = instrumentation.instrument_session(
+            requests.Session(), 'identity_store')
+
+        service_session.get('http://is/api/v1/identities/1/')
+        with override_settings(JEMBI_BASE_URL='http://jembi/ws/rest/v1/'):
+            session.post('http://jembi/ws/rest/v1/subscription')
+
+        self.assertEqual(self.get_histogram(
+            'external_request_duration_seconds',
+            ('identity_store', 'GET /api/v1/identities/:id/')).count, 1)
+        self.assertEqual(self.get_histogram(
+            'external_request_duration_seconds',
+            ('jembi', 'POST /ws/rest/v1/subscription')).count, 1)
+
+    @override_settings(INSTRUMENTATION_SAMPLE_RATE=0)
+    @responses.activate
+    def test_not_sampled(self):
+        """
+        Nothing should be recorded if the sample rate is 0
+        """
+        responses.add(responses.GET, 'http://is/api/v1/identities/1/')
+        session = instrumentation.instrument_session(
+            requests.Session(), 'identity_store')
+        session.get('http://is/api/v1/identities/1/')
+        count_users.delay()
+        self.assertEqual(registry.histograms, {})
+
+    def test_tasks(self):
+        """
+        The duration and number of database queries of each task should be
+        recorded
+        """
+        count_users.delay()
+        count_users.delay()
+
+        labels = (count_users.name,)
+        self.assertEqual(
+            self.get_histogram('task_duration_seconds', labels).count, 2)
+        queries = self.get_histogram('task_db_queries', labels)
+        self.assertEqual(queries.count, 2)
+        self.assertEqual(queries.sum, 2)
+
+    @override_settings(INSTRUMENTATION_FLUSH_INTERVAL=0)
+    @responses.activate
+    def test_push(self):
+        """
+        The increases since the last push should be pushed to the metrics API
+        """
+        responses.add(
+            responses.POST, 'http://metrics/api/v1/metrics/', json={})
+        name, labels = 'external_request_duration_seconds', ('is', 'GET /')
+        registry.observe(name, labels, 0.3)
+        registry.observe(name, labels, 3)
+        instrumentation.maybe_push().join()
+
+        registry.observe(name, labels, 3)
+        instrumentation.maybe_push().join()
+
+        [first, second] = [
+            json.loads(c.request.body) for c in responses.calls]
+        prefix = 'external_request_duration_seconds.is.GET__'
+        self.assertNotIn(prefix + '.bucket.0_25.sum', first)
+        self.assertEqual(first[prefix + '.bucket.0_5.sum'], 1)
+        self.assertEqual(first[prefix + '.bucket.+Inf.sum'], 2)
+        self.assertEqual(first[prefix + '.count.sum'], 2)
+        self.assertAlmostEqual(first[prefix + '.seconds.sum'], 3.3)
+        self.assertAlmostEqual(second.pop(prefix + '.seconds.sum'), 3)
+        self.assertEqual(second, {
+            prefix + '.bucket.5.sum': 1,
+            prefix + '.bucket.10.sum': 1,
+            prefix + '.bucket.30.sum': 1,
+            prefix + '.bucket.60.sum': 1,
+            prefix + '.bucket.+Inf.sum': 1,
+            prefix + '.count.sum': 1,
+        })
+
+    def test_retries(self):
+        """
+        Every retry of a task should be counted
+        """
+        task_retry.send(sender=count_users, request=None, reason='Timeout')
+        task_retry.send(sender=count_users, request=None, reason='Timeout')
+        self.assertEqual(
+            registry.counters[('task_retries_total', (count_users.name,))],
+            2)
+
+    def test_requests(self):
+        """
+        The latency of requests should be recorded by view and method
+        """
+        user = User.objects.create_user('test')
+        client = APIClient()
+        client.force_authenticate(user)
+        client.get('/api/metrics/')
+
+        self.assertEqual(self.get_histogram(
+            'request_duration_seconds',
+            ('registrations.views.MetricsView', 'GET')).count, 1)
+
+    def test_save_load(self):
+        """
+        The metrics saved by other processes should be added to this process's
+        metrics
+        """
+        other = Registry()
+        other.observe('task_duration_seconds', ('task',), 1)
+        other.increment('task_retries_total', ('task',))
+        registry.observe('task_duration_seconds', ('task',), 2)
+        registry.increment('task_retries_total', ('task',))
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        # Saved by a running process
+        with open(os.path.join(
+                directory, '{}.json'.format(os.getppid())), 'w') as f:
+            json.dump(other.to_dict(), f)
+        with override_settings(INSTRUMENTATION_DIRECTORY=directory):
+            # This process's saved metrics are replaced by its current ones
+            instrumentation.save()
+            registry.observe('task_duration_seconds', ('task',), 3)
+            loaded = instrumentation.load()
+
+        histogram = loaded.histograms[('task_duration_seconds', ('task',))]
+        self.assertEqual(histogram.count, 3)
+        self.assertEqual(histogram.sum, 6)
+        self.assertEqual(
+            loaded.counters[('task_retries_total', ('task',))], 2)
+
+    def test_remove_dead_processes(self):
+        """
+        The metrics saved by processes that are no longer running should be
+        removed
+        """
+        process = subprocess.Popen(['true'])
+        process.wait()
+        other = Registry()
+        other.increment('task_retries_total', ('task',))
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        for pid in (process.pid, os.getppid()):
+            with open(os.path.join(
+                    directory, '{}.json'.format(pid)), 'w') as f:
+                json.dump(other.to_dict(), f)
+        with override_settings(INSTRUMENTATION_DIRECTORY=directory):
+            loaded = instrumentation.load()
+
+        self.assertEqual(
+            sorted(os.listdir(directory)), ['{}.json'.format(os.getppid())])
+        self.assertEqual(
+            loaded.counters[('task_retries_total', ('task',))], 1)
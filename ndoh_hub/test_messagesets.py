@@ -0,0 +1,124 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+import responses
+
+from ndoh_hub import messagesets, utils, utils_tests
+
+SHORT_NAMES = [
+    'pmtct_prebirth.patient.1', 'pmtct_prebirth.patient.2',
+    'pmtct_prebirth.patient.3', 'pmtct_postbirth.patient.1',
+    'pmtct_postbirth.patient.2', 'momconnect_prebirth.hw_full.1',
+    'momconnect_prebirth.hw_full.2', 'momconnect_prebirth.hw_full.3',
+    'momconnect_prebirth.hw_full.4', 'momconnect_prebirth.hw_full.5',
+    'momconnect_prebirth.hw_full.6', 'momconnect_prebirth.patient.1',
+    'momconnect_prebirth.hw_partial.1', 'nurseconnect.hw_full.1',
+]
+
+
+@override_settings(MESSAGESET_TABLE_TTL=300)
+class MessagesetTableTests(TestCase):
+    def setUp(self):
+        messagesets.cache.clear()
+
+    def tearDown(self):
+        messagesets.cache.clear()
+
+    def mock_messagesets(self):
+        """
+        Mocks the lookup of each messageset and its schedule, and the list of
+        all the messagesets
+        """
+        for short_name in SHORT_NAMES:
+            schedule_id = utils_tests.mock_get_messageset_by_shortname(
+                short_name)
+            utils_tests.mock_get_schedule(schedule_id)
+        results = [
+            utils.get_messageset_schedule(short_name)[0]
+            for short_name in SHORT_NAMES]
+        responses.add(
+            responses.GET, 'http://sbm/api/v1/messageset/',
+            json={'next': None, 'previous': None, 'results': results},
+            match_querystring=True)
+
+    @responses.activate
+    def test_same_as_lookup(self):
+        """
+        Each entry in the table should be the same as looking up the
+        messageset and calculating the sequence number
+        """
+        self.mock_messagesets()
+        table = messagesets.get_table()
+
+        self.assertIn(('pmtct_prebirth', 'patient', 32), table)
+        self.assertIn(('momconnect_prebirth', 'hw_full', 38), table)
+        self.assertNotIn(('loss_general', 'patient', 0), table)
+        for (reg_type, authority, weeks), entry in table.items():
+            short_name = utils.get_messageset_short_name(
+                reg_type, authority, weeks)
+            self.assertEqual(entry.short_name, short_name)
+            self.assertEqual(
+                tuple(entry[1:]),
+                utils.get_messageset_schedule_sequence(short_name, weeks))
+
+    @responses.activate
+    def test_lookup(self):
+        """
+        The table should only be built once, and lookups that aren't in the
+        table should be looked up directly
+        """
+        self.mock_messagesets()
+        calls = len(responses.calls)
+
+        self.assertEqual(
+            messagesets.get_messageset_schedule_sequence(
+                'pmtct_prebirth', 'patient', 32),
+            utils.get_messageset_schedule_sequence(
+                'pmtct_prebirth.patient.2', 32))
+        calls_after_build = len(responses.calls)
+        self.assertGreater(calls_after_build, calls + 1)
+
+        messagesets.get_messageset_schedule_sequence(
+            'momconnect_prebirth', 'hw_full', 20)
+        self.assertEqual(len(responses.calls), calls_after_build)
+
+        self.assertEqual(
+            messagesets.get_messageset_schedule_sequence(
+                'pmtct_postbirth', 'patient', 100),
+            utils.get_messageset_schedule_sequence(
+                'pmtct_postbirth.patient.2', 100))
+
+    @override_settings(MESSAGESET_TABLE_TTL=0)
+    @responses.activate
+    def test_disabled(self):
+        """
+        If the table is disabled, each messageset should be looked up
+        """
+        self.mock_messagesets()
+        calls = len(responses.calls)
+        self.assertEqual(
+            messagesets.get_messageset_schedule_sequence(
+                'pmtct_prebirth', 'patient', 32),
+            utils.get_messageset_schedule_sequence(
+                'pmtct_prebirth.patient.2', 32))
+        self.assertEqual(len(responses.calls), calls + 4)
+        self.assertIsNone(messagesets.cache.get('table'))
+
+    @responses.activate
+    def test_export(self):
+        """
+        The table should be exported as CSV
+        """
+        self.mock_messagesets()
+        stdout = StringIO()
+        call_command('export_messageset_table', stdout=stdout)
+
+        lines = stdout.getvalue().splitlines()
+        self.assertEqual(
+            lines[0],
+            'reg_type,authority,weeks,short_name,messageset_id,schedule_id,'
+            'next_sequence_number')
+        self.assertIn(
+            'pmtct_prebirth,patient,32,pmtct_prebirth.patient.2,12,112,4',
+            lines)
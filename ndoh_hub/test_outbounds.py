@@ -0,0 +1,56 @@
+from django.test import TestCase, override_settings
+import responses
+
+from ndoh_hub.outbounds import identity_cache, resolve_outbound_identities
+
+
+@override_settings(
+    OUTBOUND_IDENTITY_CACHE_SIZE=100, OUTBOUND_IDENTITY_CACHE_TTL=60,
+    OUTBOUND_LOOKUP_CONCURRENCY=5)
+class ResolveOutboundIdentitiesTests(TestCase):
+    def setUp(self):
+        identity_cache.clear()
+
+    def add_outbound(self, message_id, identity):
+        responses.add(
+            responses.GET,
+            'http://ms/api/v1/outbound/?vumi_message_id={}'.format(
+                message_id),
+            json={
+                'results': [{'to_identity': identity}] if identity else []
+            }, status=200, match_querystring=True)
+
+    @responses.activate
+    def test_resolve(self):
+        """
+        Each message id should be resolved to its identity, or None if the
+        message can't be found
+        """
+        self.add_outbound('message1', 'identity1')
+        self.add_outbound('message2', 'identity2')
+        self.add_outbound('message3', None)
+
+        self.assertEqual(
+            resolve_outbound_identities(
+                ['message1', 'message2', 'message3', 'message1']),
+            {
+                'message1': 'identity1',
+                'message2': 'identity2',
+                'message3': None,
+            })
+        self.assertEqual(len(responses.calls), 3)
+
+    @responses.activate
+    def test_cached(self):
+        """
+        Message ids that have already been resolved, including ones that
+        couldn't be found, shouldn't be looked up again
+        """
+        self.add_outbound('message1', 'identity1')
+        self.add_outbound('message2', None)
+        resolve_outbound_identities(['message1', 'message2'])
+
+        self.assertEqual(
+            resolve_outbound_identities(['message1', 'message2']),
+            {'message1': 'identity1', 'message2': None})
+        self.assertEqual(len(responses.calls), 2)
@@ -0,0 +1,86 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from ndoh_hub import prometheus
+from ndoh_hub.instrumentation import Registry, registry
+
+
+class RenderTests(TestCase):
+    def test_render_registry(self):
+        """
+        Histograms and counters should be rendered in the Prometheus text
+        format, with their label names
+        """
+        metrics = Registry()
+        metrics.observe('external_request_duration_seconds', (
+            'identity_store', 'GET /api/v1/identities/:id/'), 0.3)
+        metrics.increment('task_retries_total', ('ndoh_hub.tasks."x"',))
+
+        lines = prometheus.render_registry(metrics)
+        labels = (
+            'service="identity_store",'
+            'operation="GET /api/v1/identities/:id/"')
+        self.assertIn(
+            '# TYPE external_request_duration_seconds histogram', lines)
+        self.assertIn(
+            'external_request_duration_seconds_bucket{%s,le="0.25"} 0.0'
+            % labels, lines)
+        self.assertIn(
+            'external_request_duration_seconds_bucket{%s,le="0.5"} 1.0'
+            % labels, lines)
+        self.assertIn(
+            'external_request_duration_seconds_bucket{%s,le="+Inf"} 1.0'
+            % labels, lines)
+        self.assertIn(
+            'external_request_duration_seconds_count{%s} 1.0' % labels,
+            lines)
+        self.assertIn(
+            'external_request_duration_seconds_sum{%s} 0.3' % labels, lines)
+        self.assertIn('# TYPE task_retries_total counter', lines)
+        self.assertIn(
+            'task_retries_total{task="ndoh_hub.tasks.\\"x\\""} 1.0', lines)
+
+
+class PrometheusMetricsViewTests(TestCase):
+    def setUp(self):
+        registry.clear()
+
+    def tearDown(self):
+        registry.clear()
+
+    @mock.patch('ndoh_hub.prometheus.get_queue_length')
+    def test_metrics(self, get_queue_length):
+        """
+        The metrics should include the instrumentation, the length of each
+        Celery queue, and the database connections
+        """
+        get_queue_length.return_value = 7
+        registry.increment('task_retries_total', ('task',))
+        client = APIClient()
+        self.assertEqual(client.get('/metrics').status_code, 401)
+
+        client.force_authenticate(User.objects.create_user('test'))
+        response = client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], prometheus.CONTENT_TYPE)
+        lines = response.content.decode('utf-8').splitlines()
+        self.assertIn('task_retries_total{task="task"} 1.0', lines)
+        self.assertIn('celery_queue_length{queue="ndoh_hub"} 7.0', lines)
+        self.assertIn('celery_queue_length{queue="jembi"} 7.0', lines)
+        self.assertIn('# TYPE db_connections gauge', lines)
+        self.assertTrue(any(
+            line.startswith('db_max_connections ') for line in lines))
+
+    @mock.patch('ndoh_hub.prometheus.get_queue_length')
+    def test_gauge_error(self, get_queue_length):
+        """
+        If a gauge can't be read, the other metrics should still be returned
+        """
+        get_queue_length.side_effect = Exception('Broker unavailable')
+        with self.assertLogs('ndoh_hub.prometheus', 'ERROR'):
+            lines = prometheus.render_metrics().splitlines()
+        self.assertNotIn('# TYPE celery_queue_length gauge', lines)
+        self.assertIn('# TYPE db_max_connections gauge', lines)
@@ -0,0 +1,76 @@
+from django.test import TestCase, override_settings
+from unittest import mock
+import requests
+import responses
+
+from ndoh_hub import ratelimit
+
+
+class TokenBucketTests(TestCase):
+    def test_consume(self):
+        """
+        Consume should run the script against the bucket's key, and return the
+        wait time as a float
+        """
+        redis = mock.MagicMock()
+        redis.register_script.return_value.return_value = b'0.25'
+        bucket = ratelimit.TokenBucket(redis, 'test-key', 10, 20)
+
+        self.assertEqual(bucket.consume(), 0.25)
+        [call] = redis.register_script.return_value.call_args_list
+        self.assertEqual(call[1]['keys'], ['test-key'])
+        self.assertEqual(call[1]['args'][:2], [10, 20])
+        self.assertEqual(call[1]['args'][3], 1)
+
+    @mock.patch('ndoh_hub.ratelimit.time.sleep')
+    def test_acquire_waits(self, sleep):
+        """
+        Acquire should sleep for the returned wait time until the tokens are
+        taken
+        """
+        redis = mock.MagicMock()
+        redis.register_script.return_value.side_effect = [b'0.5', b'0.1', b'0']
+        bucket = ratelimit.TokenBucket(redis, 'test-key', 10, 20)
+
+        bucket.acquire()
+        self.assertEqual(
+            sleep.call_args_list, [mock.call(0.5), mock.call(0.1)])
+
+
+class GetBucketTests(TestCase):
+    def setUp(self):
+        ratelimit._buckets.clear()
+
+    @override_settings(OUTBOUND_RATE_LIMITS={})
+    def test_no_limit(self):
+        """
+        If there is no limit configured for the host, no bucket is returned
+        """
+        self.assertIsNone(ratelimit.get_bucket('http://jembi/ws/rest/v1/'))
+
+    @override_settings(OUTBOUND_RATE_LIMITS={'jembi': (5.0, 10.0)})
+    @mock.patch('ndoh_hub.ratelimit.get_redis')
+    def test_limit(self, get_redis):
+        """
+        If there is a limit configured for the host, the bucket for that host
+        is returned, and reused for later requests
+        """
+        bucket = ratelimit.get_bucket('http://jembi/ws/rest/v1/subscription')
+        self.assertEqual(bucket.key, 'ratelimit:jembi')
+        self.assertEqual((bucket.rate, bucket.capacity), (5.0, 10.0))
+        self.assertIs(ratelimit.get_bucket('http://jembi/other'), bucket)
+
+
+class RateLimitedHTTPAdapterTests(TestCase):
+    @responses.activate
+    @mock.patch('ndoh_hub.ratelimit.throttle')
+    def test_throttles_requests(self, throttle):
+        """
+        Requests made through a rate limited session should wait for the
+        rate limit of the destination
+        """
+        responses.add(responses.GET, 'http://jembi/test', json={})
+        session = ratelimit.mount_rate_limiter(requests.Session())
+
+        session.get('http://jembi/test')
+        throttle.assert_called_once_with('http://jembi/test')
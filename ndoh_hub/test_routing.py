@@ -54,3 +54,16 @@ class TokenAuthMiddlewareTests(TestCase):
         mw = TokenAuthMiddleware(lambda _: None)
         mw(scope)
         self.assertEqual(scope['user'], None)
+
+    def test_inactive_user(self):
+        """
+        If the token's user is inactive, then the user should be set to None
+        """
+        user = User.objects.create_user('test', is_active=False)
+        token = Token.objects.create(user=user)
+        scope = {
+            'query_string': urlencode({'token': str(token.key)}).encode(),
+        }
+        mw = TokenAuthMiddleware(lambda _: None)
+        mw(scope)
+        self.assertEqual(scope['user'], None)
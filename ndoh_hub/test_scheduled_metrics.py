@@ -0,0 +1,131 @@
+import datetime
+import json
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+import responses
+
+from changes.models import Change
+from ndoh_hub import scheduled_metrics
+from registrations.models import Registration, Source
+
+
+class ScheduledMetricsTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('test')
+        self.source = Source.objects.create(
+            name='test', user=user, authority='hw_full')
+
+    def create_registrations(self, count, **kwargs):
+        """
+        Creates the registrations without running the post save hooks
+        """
+        kwargs.setdefault('reg_type', 'momconnect_prebirth')
+        kwargs.setdefault('data', {})
+        return Registration.objects.bulk_create(
+            Registration(source=self.source, **kwargs) for _ in range(count))
+
+    def test_registration_totals(self):
+        """
+        Should return the total registrations for every registration type and
+        source
+        """
+        self.create_registrations(2)
+        self.create_registrations(1, reg_type='pmtct_prebirth')
+
+        metrics = scheduled_metrics.registration_totals()
+        self.assertEqual(
+            metrics['registrations.type.momconnect_prebirth.total.last'], 2)
+        self.assertEqual(
+            metrics['registrations.type.pmtct_prebirth.total.last'], 1)
+        self.assertEqual(
+            metrics['registrations.type.nurseconnect.total.last'], 0)
+        self.assertEqual(
+            metrics['registrations.source.%s.total.last' % self.source.pk],
+            3)
+        self.assertEqual(
+            sorted(metrics),
+            sorted(scheduled_metrics.registration_totals.names()))
+
+    def test_validation_failure_rate(self):
+        """
+        Should return the fraction of the recent registrations that failed
+        validation, ignoring the registrations still waiting for validation
+        """
+        self.assertEqual(scheduled_metrics.validation_failure_rate(), {
+            'registrations.validation_failure_rate.last': 0.0})
+
+        self.create_registrations(3, validated=True)
+        self.create_registrations(1, data={'invalid_fields': 'Invalid edd'})
+        self.create_registrations(2)
+        old = self.create_registrations(
+            2, data={'invalid_fields': 'Invalid edd'})
+        Registration.objects.filter(pk__in=[r.pk for r in old]).update(
+            created_at=timezone.now() - datetime.timedelta(days=2))
+
+        self.assertEqual(scheduled_metrics.validation_failure_rate(), {
+            'registrations.validation_failure_rate.last': 0.25})
+
+    def test_pending_changes(self):
+        """
+        Should return the number of changes that haven't been validated yet
+        """
+        Change.objects.bulk_create([
+            Change(source=self.source, action='nurse_optout', data={}),
+            Change(source=self.source, action='nurse_optout', data={},
+                   validated=True),
+            Change(source=self.source, action='nurse_optout',
+                   data={'invalid_fields': 'Invalid msisdn'}),
+        ])
+        self.assertEqual(scheduled_metrics.pending_changes(), {
+            'changes.pending.last': 1})
+
+    def test_jembi_backlog(self):
+        """
+        Should return the number of messages in the jembi queue
+        """
+        self.assertEqual(scheduled_metrics.jembi_backlog(), {
+            'jembi.backlog.last': 0})
+
+    @override_settings(METRICS_SCHEDULED_TASKS=[
+        'ndoh_hub.scheduled_metrics.pending_changes',
+        'ndoh_hub.scheduled_metrics.jembi_backlog',
+    ])
+    @mock.patch('ndoh_hub.scheduled_metrics.get_queue_length')
+    def test_calculate_metrics(self, get_queue_length):
+        """
+        Should return the metrics from all the calculators, and their compute
+        times, skipping calculators that fail
+        """
+        get_queue_length.side_effect = Exception('Broker unavailable')
+        with self.assertLogs('ndoh_hub.scheduled_metrics', 'ERROR'):
+            metrics = scheduled_metrics.calculate_metrics()
+        self.assertEqual(sorted(metrics), [
+            'changes.pending.last',
+            'scheduled_metrics.pending_changes.compute_time.last',
+        ])
+        self.assertGreaterEqual(
+            metrics['scheduled_metrics.pending_changes.compute_time.last'], 0)
+
+    @override_settings(METRICS_SCHEDULED_TASKS=[
+        'ndoh_hub.scheduled_metrics.pending_changes',
+    ])
+    @responses.activate
+    def test_task(self):
+        """
+        The task should fire all the metrics in a single request
+        """
+        responses.add(
+            responses.POST, 'http://metrics/api/v1/metrics/', json={})
+
+        result = scheduled_metrics.scheduled_metrics.delay()
+        self.assertEqual(result.get(), 'Fired 2 scheduled metrics')
+
+        [call] = responses.calls
+        self.assertEqual(
+            sorted(json.loads(call.request.body)), [
+                'changes.pending.last',
+                'scheduled_metrics.pending_changes.compute_time.last',
+            ])
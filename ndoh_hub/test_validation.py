@@ -0,0 +1,131 @@
+import datetime
+from unittest import mock
+
+from django.test import TestCase
+
+from changes.models import Change
+from changes.validation import schema as change_schema
+from ndoh_hub import utils, validation
+from ndoh_hub.validation import FieldError
+from registrations.models import Registration, Source
+from registrations.validation import schema as registration_schema
+
+REGISTRANT_ID = 'mother01-63e2-4acc-9b94-26663b9bc267'
+
+
+def override_get_today():
+    return datetime.date(2016, 1, 1)
+
+
+class ParseDateTests(TestCase):
+    def test_same_as_strptime(self):
+        """
+        The dates that are parsed should be the same as the ones that
+        strptime accepts
+        """
+        for value in [
+                '2016-01-01', '2016-1-1', '2016-02-30', '2016-13-01',
+                '16-01-01', '2016-01-01 ', '2016-01-01\n', '2016/01/01', '',
+                'foo', None, 20160101, ['2016-01-01']]:
+            try:
+                expected = datetime.datetime.strptime(
+                    value, '%Y-%m-%d').date()
+            except Exception:
+                expected = None
+            self.assertEqual(utils.parse_date(value), expected, value)
+
+
+@mock.patch('ndoh_hub.utils.get_today', override_get_today)
+class RegistrationSchemaTests(TestCase):
+    def registration(self, reg_type, data, authority='hw_full'):
+        return Registration(
+            reg_type=reg_type, registrant_id=REGISTRANT_ID, data=data,
+            source=Source(authority=authority))
+
+    def test_field_errors(self):
+        """
+        Each error should have the field that it's for, and all the failing
+        fields should be reported, in the order that they're checked
+        """
+        registration = self.registration('pmtct_postbirth', {
+            'language': 'eng_ZA',
+            'mom_dob': '1999-02-29',
+            'baby_dob': '2016-01-02',
+        })
+        self.assertEqual(registration_schema.validate(registration), [
+            FieldError('mom_dob', "Mother DOB invalid"),
+            FieldError(
+                'baby_dob', "Baby Date of Birth cannot be in the future"),
+            FieldError('operator_id', "Operator ID missing"),
+        ])
+
+    def test_conditional_rules(self):
+        """
+        The ID should only be checked for health worker registrations, and
+        the fields depend on the ID type
+        """
+        data = {
+            'operator_id': REGISTRANT_ID,
+            'msisdn_registrant': '+27821112222',
+            'msisdn_device': '+27821112222',
+            'language': 'eng_ZA',
+            'consent': True,
+            'id_type': 'passport',
+            'passport_origin': 'uk',
+        }
+        self.assertEqual(registration_schema.validate(self.registration(
+            'momconnect_prebirth', data, 'hw_partial')), [
+            FieldError('passport_no', "Passport number missing"),
+            FieldError('passport_origin', "Passport origin invalid"),
+        ])
+        self.assertEqual(registration_schema.validate(self.registration(
+            'momconnect_prebirth', data, 'patient')), [])
+
+    def test_batch(self):
+        """
+        Validating a batch should give the errors for each registration
+        """
+        registrations = [
+            self.registration('loss_general', {}),
+            self.registration('jembi_momconnect', {}),
+            self.registration('pmtct_prebirth', {
+                'language': 'eng_ZA', 'mom_dob': '1999-01-01',
+                'edd': '2016-05-01', 'operator_id': REGISTRANT_ID}),
+        ]
+        registrations[1].registrant_id = 'invalid'
+        self.assertEqual(registration_schema.validate_batch(registrations), [
+            [FieldError('reg_type', "Loss general not yet supported")],
+            [FieldError('registrant_id', "Invalid UUID registrant_id")],
+            [],
+        ])
+
+
+class ChangeSchemaTests(TestCase):
+    def change(self, action, data):
+        return Change(action=action, registrant_id=REGISTRANT_ID, data=data)
+
+    def test_messages(self):
+        """
+        The errors should have the same messages as the previous checks
+        """
+        for action, data, messages in [
+                ('baby_switch', {}, []),
+                ('pmtct_loss_optout', {}, ["Optout reason is missing"]),
+                ('momconnect_nonloss_optout', {'reason': 'not_hiv_pos'},
+                 ["Not a valid nonloss reason"]),
+                ('nurse_update_detail', {'faccode': ''}, ["Faccode invalid"]),
+                ('nurse_update_detail', {
+                    'id_type': 'sa_id', 'sa_id_no': '123', 'dob': '1990-1-1'},
+                 ["SA ID number is invalid"]),
+                ('momconnect_change_identification', {'id_type': 'none'},
+                 ["ID type should be 'sa_id' or 'passport'"]),
+                ('admin_change_subscription', {}, [
+                    "One of these fields must be populated: messageset, "
+                    "language",
+                    "Subscription field is missing"]),
+                ('switch_channel', {'channel': 'email'},
+                 ["'channel' must be one of ['sms', 'whatsapp']"])]:
+            self.assertEqual(
+                validation.get_messages(
+                    change_schema.validate(self.change(action, data))),
+                messages, action)
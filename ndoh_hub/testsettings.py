@@ -13,6 +13,21 @@ CELERY_ALWAYS_EAGER = True
 BROKER_BACKEND = 'memory'
 CELERY_RESULT_BACKEND = 'djcelery.backends.database:DatabaseBackend'
 
+# Only recorded and pushed in the instrumentation tests
+INSTRUMENTATION_SAMPLE_RATE = 0
+INSTRUMENTATION_FLUSH_INTERVAL = 24 * 60 * 60
+
+# Only built in the messageset table tests, the other tests mock the lookup of
+# each messageset
+MESSAGESET_TABLE_TTL = 0
+
+# Only cached in the position tests, the other tests change the positions
+# directly
+POSITION_CACHE_TTL = 0
+
+# Only cached in the auth tests, so that the other tests don't need Redis
+TOKEN_CACHE_TTL = 0
+
 PASSWORD_HASHERS = (
     'django.contrib.auth.hashers.MD5PasswordHasher',
 )
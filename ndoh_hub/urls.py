@@ -1,6 +1,7 @@
 import os
 from django.conf.urls import include, url
 from django.contrib import admin
+from ndoh_hub.prometheus import PrometheusMetricsView
 from registrations import views
 from rest_framework.authtoken.views import obtain_auth_token
 import rest_framework_docs.urls
@@ -16,6 +17,7 @@ urlpatterns = [
     url(r'^api/token-auth/', obtain_auth_token),
     url(r'^api/metrics/', views.MetricsView.as_view()),
     url(r'^api/health/', views.HealthcheckView.as_view()),
+    url(r'^metrics$', PrometheusMetricsView.as_view()),
     url(r'^docs/', include(rest_framework_docs.urls)),
     url(r'^', include('registrations.urls')),
     url(r'^', include('changes.urls')),
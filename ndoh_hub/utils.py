@@ -3,18 +3,18 @@ from __future__ import absolute_import
 
 import datetime
 import json
+import re
+from functools import lru_cache
+
 import six
 
 from celery.task import Task
 from django.conf import settings
-from rest_framework.authentication import TokenAuthentication
-from seed_services_client.metrics import MetricsApiClient
-from seed_services_client.stage_based_messaging import (
-    StageBasedMessagingApiClient)
-from seed_services_client.identity_store import IdentityStoreApiClient
-from seed_services_client.message_sender import MessageSenderApiClient
 
-from registrations.models import PositionTracker
+from ndoh_hub.auth import CachedTokenAuthentication
+from ndoh_hub.clients import (  # noqa
+    get_client, http_session, is_client, ms_client, sbm_client)
+from registrations import positions
 
 
 ID_TYPES = ["sa_id", "passport", "none"]
@@ -34,21 +34,6 @@ LANGUAGES = [
         "nbl_ZA",  # isiNdebele
 ]
 
-sbm_client = StageBasedMessagingApiClient(
-    api_url=settings.STAGE_BASED_MESSAGING_URL,
-    auth_token=settings.STAGE_BASED_MESSAGING_TOKEN
-)
-
-is_client = IdentityStoreApiClient(
-    api_url=settings.IDENTITY_STORE_URL,
-    auth_token=settings.IDENTITY_STORE_TOKEN
-)
-
-ms_client = MessageSenderApiClient(
-    api_url=settings.MESSAGE_SENDER_URL,
-    auth_token=settings.MESSAGE_SENDER_TOKEN,
-)
-
 
 def get_identity_msisdn(registrant_id):
     """
@@ -76,6 +61,32 @@ def is_valid_uuid(id):
     return len(id) == 36 and id[14] == '4' and id[19] in ['a', 'b', '8', '9']
 
 
+# The dates that strptime accepts for "%Y-%m-%d"
+DATE_RE = re.compile(r'(\d{4})-(\d{1,2})-(\d{1,2})\Z')
+
+
+@lru_cache(maxsize=4096)
+def _parse_date(value):
+    match = DATE_RE.match(value)
+    if match is None:
+        return None
+    try:
+        return datetime.date(*map(int, match.groups()))
+    except ValueError:
+        return None
+
+
+def parse_date(value):
+    """
+    Returns the date for a YYYY-MM-DD string, or None if `value` isn't a
+    valid date. The same dates appear in many objects, so they're only parsed
+    once.
+    """
+    if not isinstance(value, str):
+        return None
+    return _parse_date(value)
+
+
 def is_valid_date(date):
     try:
         datetime.datetime.strptime(date, "%Y-%m-%d")
@@ -222,11 +233,15 @@ def get_messageset_short_name(reg_type, authority, weeks):
     return short_name
 
 
-def get_messageset_schedule_sequence(short_name, weeks):
-    # get messageset
+def get_messageset_schedule(short_name):
+    """
+    Returns the messageset with the short name, and for prebirth messagesets,
+    how many messages a week its default schedule sends
+    """
     messageset = next(sbm_client.get_messagesets(
         {"short_name": short_name})["results"])
 
+    msgs_per_week = None
     if "prebirth" in short_name:
         # get schedule
         schedule = sbm_client.get_schedule(messageset["default_schedule"])
@@ -235,6 +250,13 @@ def get_messageset_schedule_sequence(short_name, weeks):
         # determine how many times a week messages are sent e.g. 2 for '1,3'
         msgs_per_week = len(days_of_week.split(','))
 
+    return messageset, msgs_per_week
+
+
+def get_sequence_number(short_name, weeks, msgs_per_week):
+    """
+    Returns the sequence number to start a subscription to the messageset on
+    """
     next_sequence_number = 1  # default to 1
 
     # calculate next_sequence_number
@@ -276,15 +298,106 @@ def get_messageset_schedule_sequence(short_name, weeks):
 
     # loss subscriptions always start at 1
 
+    return next_sequence_number
+
+
+def get_messageset_schedule_sequence(short_name, weeks):
+    messageset, msgs_per_week = get_messageset_schedule(short_name)
+    next_sequence_number = get_sequence_number(
+        short_name, weeks, msgs_per_week)
+
     # RTHB NurseConnect subscriptions are tracked by the position tracker
     if 'nurseconnect_rthb' in short_name:
-        next_sequence_number = PositionTracker.objects.get(
-            label='nurseconnect_rthb').position
+        next_sequence_number = positions.get_position('nurseconnect_rthb')
 
     return (messageset["id"], messageset["default_schedule"],
             next_sequence_number)
 
 
+# Batch versions of the functions above, for bulk processing. They take
+# sequences, eg. a column of registration data, and return a list with the
+# result for each item. Each distinct value is only calculated once, and the
+# dates that aren't valid give None, instead of raising an exception.
+def map_distinct(func, *columns):
+    """
+    Returns [func(*row) for row in zip(*columns)], calling `func` only once
+    for each distinct row
+    """
+    results = {}
+    mapped = []
+    for row in zip(*columns):
+        try:
+            result = results[row]
+        except KeyError:
+            result = results[row] = func(*row)
+        mapped.append(result)
+    return mapped
+
+
+def get_mom_ages(today, mom_dobs):
+    def age(mom_dob):
+        born = parse_date(mom_dob)
+        if born is None:
+            return None
+        return today.year - born.year - (
+            (today.month, today.day) < (born.month, born.day))
+    return map_distinct(age, mom_dobs)
+
+
+def get_pregnancy_weeks(today, edds):
+    today = today.toordinal()
+
+    def weeks(edd):
+        due_date = parse_date(edd)
+        if due_date is None:
+            return None
+        # You can't be less than two week pregnant
+        return max(40 - (due_date.toordinal() - today) // 7, 2)
+    return map_distinct(weeks, edds)
+
+
+def get_baby_ages(today, baby_dobs):
+    today = today.toordinal()
+
+    def weeks(baby_dob):
+        birth_date = parse_date(baby_dob)
+        if birth_date is None:
+            return None
+        return (today - birth_date.toordinal()) // 7
+    return map_distinct(weeks, baby_dobs)
+
+
+def get_messageset_short_names(reg_types, authorities, weeks):
+    return map_distinct(
+        get_messageset_short_name, reg_types, authorities, weeks)
+
+
+def get_messageset_schedule_sequences(short_names, weeks):
+    """
+    Returns the (messageset id, schedule, sequence number) for each short
+    name, looking up each messageset and its schedule only once
+    """
+    schedules = {}
+    rthb_position = None
+    results = []
+    for short_name, week in zip(short_names, weeks):
+        if short_name not in schedules:
+            schedules[short_name] = get_messageset_schedule(short_name)
+        messageset, msgs_per_week = schedules[short_name]
+        if 'nurseconnect_rthb' in short_name:
+            if rthb_position is None:
+                rthb_position = positions.get_position(
+                    'nurseconnect_rthb')
+            next_sequence_number = rthb_position
+        else:
+            next_sequence_number = get_sequence_number(
+                short_name, week, msgs_per_week)
+        results.append((
+            messageset["id"], messageset["default_schedule"],
+            next_sequence_number))
+    return results
+
+
 def append_or_create(dictionary, field, value):
     """
     If 'field' exists in 'dictionary', it appends 'value' to the existing
@@ -297,13 +410,18 @@ def append_or_create(dictionary, field, value):
 
 
 def get_available_metrics():
+    # Imported here, because the scheduled metrics use the registrations tasks
+    from ndoh_hub.scheduled_metrics import get_scheduled_metric_names
     available_metrics = []
     available_metrics.extend(settings.METRICS_REALTIME)
-    available_metrics.extend(settings.METRICS_SCHEDULED)
+    available_metrics.extend(get_scheduled_metric_names())
     return available_metrics
 
 
 def get_metric_client(session=None):
+    if session is None:
+        return get_client('metrics')
+    from seed_services_client.metrics import MetricsApiClient
     return MetricsApiClient(
         url=settings.METRICS_URL,
         auth=settings.METRICS_AUTH,
@@ -340,7 +458,7 @@ def json_decode(data):
     return json.loads(data)
 
 
-class TokenAuthQueryString(TokenAuthentication):
+class TokenAuthQueryString(CachedTokenAuthentication):
     """
     Look for the token in the querystring parameter "token"
     """
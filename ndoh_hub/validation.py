@@ -0,0 +1,216 @@
+"""
+A declarative engine for validating the data of registrations and changes.
+
+A Schema lists the rules for each type of object, eg. for each reg_type or
+change action, and compiles them once into a flat list of validator
+functions. Validating an object runs its type's validators, and returns a list
+of FieldErrors, each with the field and the message. Many objects can be
+validated in a single pass with Schema.validate_batch.
+"""
+import datetime
+from collections import namedtuple
+
+from ndoh_hub import utils
+from ndoh_hub.utils import parse_date
+
+FieldError = namedtuple('FieldError', ['field', 'message'])
+
+
+# Checks of a field's value, given the value and today's date
+def is_date(value, today):
+    return parse_date(value) is not None
+
+
+def is_not_future_date(value, today):
+    return parse_date(value) <= today
+
+
+def is_valid_edd(value, today):
+    edd = parse_date(value)
+    return (
+        edd is not None and
+        today < edd < today + datetime.timedelta(weeks=43))
+
+
+def check(predicate):
+    """
+    Returns a check of a field's value, for a predicate that only takes the
+    value, eg. utils.is_valid_msisdn
+    """
+    return lambda value, today: predicate(value)
+
+
+def one_of(choices):
+    choices = tuple(choices)
+    return lambda value, today: value in choices
+
+
+class Rule(object):
+    def compile(self):
+        """
+        Returns a list of validators. Each is a function of
+        (obj, data, today), that returns a list of FieldErrors.
+        """
+        raise NotImplementedError()
+
+
+class Required(Rule):
+    """
+    The field must be in the data, and its value must pass each of `checks`,
+    a list of (check, message). Only the first failure is reported. If the
+    value passes, the rules in `cases` for the value, if any, are checked.
+    """
+    def __init__(self, field, missing, *checks, cases=None):
+        self.field = field
+        self.missing = missing
+        self.checks = checks
+        self.cases = cases or {}
+
+    def compile(self):
+        field, missing, checks = self.field, self.missing, self.checks
+        cases = {
+            value: compile_rules(rules) for value, rules in self.cases.items()}
+
+        def validator(obj, data, today):
+            if field not in data:
+                return [FieldError(field, missing)]
+            value = data[field]
+            for check, message in checks:
+                if not check(value, today):
+                    return [FieldError(field, message)]
+            if cases and value in cases:
+                return run_validators(cases[value], obj, data, today)
+            return []
+        return [validator]
+
+
+class AnyOf(Rule):
+    """
+    At least one of the fields must be in the data
+    """
+    def __init__(self, fields, message):
+        self.fields = fields
+        self.message = message
+
+    def compile(self):
+        fields, message = self.fields, self.message
+        error = [FieldError(fields[0], message)]
+
+        def validator(obj, data, today):
+            if any(field in data for field in fields):
+                return []
+            return error
+        return [validator]
+
+
+class Invalid(Rule):
+    """
+    Always fails, eg. for types that aren't supported
+    """
+    def __init__(self, field, message):
+        self.field = field
+        self.message = message
+
+    def compile(self):
+        error = [FieldError(self.field, self.message)]
+        return [lambda obj, data, today: error]
+
+
+class When(Rule):
+    """
+    Only checks the rules if `condition(obj)` is true
+    """
+    def __init__(self, condition, *rules):
+        self.condition = condition
+        self.rules = rules
+
+    def compile(self):
+        condition = self.condition
+        validators = compile_rules(self.rules)
+
+        def validator(obj, data, today):
+            if condition(obj):
+                return run_validators(validators, obj, data, today)
+            return []
+        return [validator]
+
+
+class Attribute(Rule):
+    """
+    An attribute of the object, rather than a field in its data, must pass
+    `predicate`
+    """
+    def __init__(self, attribute, predicate, message):
+        self.attribute = attribute
+        self.predicate = predicate
+        self.message = message
+
+    def compile(self):
+        attribute, predicate = self.attribute, self.predicate
+        error = [FieldError(attribute, self.message)]
+
+        def validator(obj, data, today):
+            if predicate(getattr(obj, attribute)):
+                return []
+            return error
+        return [validator]
+
+
+def compile_rules(rules):
+    """
+    Compiles a list of rules into a flat list of validators. Plain functions
+    of (obj, data, today), for checks that don't fit the rules, are used as
+    they are.
+    """
+    validators = []
+    for rule in rules:
+        if isinstance(rule, Rule):
+            validators.extend(rule.compile())
+        else:
+            validators.append(rule)
+    return validators
+
+
+def run_validators(validators, obj, data, today):
+    errors = []
+    for validator in validators:
+        errors.extend(validator(obj, data, today))
+    return errors
+
+
+class Schema(object):
+    """
+    The rules for each type of object. The object's type is its
+    `type_attribute`. The `common` rules apply to every type, and come
+    before the type's rules.
+    """
+    def __init__(self, type_attribute, common, types):
+        self.type_attribute = type_attribute
+        self.default = compile_rules(common)
+        self.validators = {
+            type_: compile_rules(list(common) + list(rules))
+            for type_, rules in types.items()}
+
+    def validate(self, obj, today=None):
+        """
+        Returns the list of FieldErrors for the object
+        """
+        if today is None:
+            today = utils.get_today()
+        validators = self.validators.get(
+            getattr(obj, self.type_attribute), self.default)
+        return run_validators(validators, obj, obj.data, today)
+
+    def validate_batch(self, objs):
+        """
+        Returns the list of FieldErrors for each of the objects, in order
+        """
+        today = utils.get_today()
+        return [self.validate(obj, today) for obj in objs]
+
+
+def get_messages(errors):
+    """
+    Returns the messages of a list of FieldErrors
+    """
+    return [error.message for error in errors]
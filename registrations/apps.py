@@ -1,6 +1,6 @@
 from django.apps import AppConfig
 
-from django.db.models.signals import post_save, pre_save  # noqa
+from django.db.models.signals import post_save, pre_save, post_delete  # noqa
 
 
 class RegistrationsAppConfig(AppConfig):
@@ -8,7 +8,24 @@ class RegistrationsAppConfig(AppConfig):
     name = 'registrations'
 
     def ready(self):
-        from .signals import psh_validate_subscribe, psh_fire_created_metric
+        from celery.signals import task_prerun, task_postrun, task_retry
+        from ndoh_hub import instrumentation
+        from .signals import (
+            psh_validate_subscribe, psh_fire_created_metric,
+            clear_source_cache, clear_position_cache,
+            pdh_recount_registration_statistics)
+
+        task_prerun.connect(
+            instrumentation.task_prerun,
+            dispatch_uid='instrumentation_task_prerun')
+
+        task_postrun.connect(
+            instrumentation.task_postrun,
+            dispatch_uid='instrumentation_task_postrun')
+
+        task_retry.connect(
+            instrumentation.task_retry,
+            dispatch_uid='instrumentation_task_retry')
 
         post_save.connect(
             psh_validate_subscribe,
@@ -19,3 +36,28 @@ class RegistrationsAppConfig(AppConfig):
             psh_fire_created_metric,
             sender='registrations.Registration',
             dispatch_uid='psh_fire_created_metric')
+
+        post_delete.connect(
+            pdh_recount_registration_statistics,
+            sender='registrations.Registration',
+            dispatch_uid='pdh_recount_registration_statistics')
+
+        post_save.connect(
+            clear_source_cache,
+            sender='registrations.Source',
+            dispatch_uid='clear_source_cache_save')
+
+        post_delete.connect(
+            clear_source_cache,
+            sender='registrations.Source',
+            dispatch_uid='clear_source_cache_delete')
+
+        post_save.connect(
+            clear_position_cache,
+            sender='registrations.PositionTracker',
+            dispatch_uid='clear_position_cache_save')
+
+        post_delete.connect(
+            clear_position_cache,
+            sender='registrations.PositionTracker',
+            dispatch_uid='clear_position_cache_delete')
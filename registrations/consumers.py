@@ -1,103 +1,167 @@
-from asgiref.sync import async_to_sync
-from channels.generic.websocket import JsonWebsocketConsumer
-from django.core.exceptions import PermissionDenied
-from django.http import Http404
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from channels.db import DatabaseSyncToAsync
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.conf import settings
+from django.contrib.auth.models import User
 from rest_framework.exceptions import ValidationError
 
+from registrations.models import Registration
 from registrations.views import (
     JembiAppRegistration, JembiAppRegistrationStatus)
 
 
-class JembiAppRegistrationConsumer(JsonWebsocketConsumer):
-    def connect(self) -> None:
-        self.user = self.scope['user']
+# All the database work for the websocket consumers happens on this pool, so
+# that many concurrent clients can't use more than WEBSOCKET_DB_THREADS
+# database connections per process
+db_executor = ThreadPoolExecutor(max_workers=settings.WEBSOCKET_DB_THREADS)
+
+
+class BoundedDatabaseSyncToAsync(DatabaseSyncToAsync):
+    """
+    database_sync_to_async, but run on the bounded db_executor thread pool
+    instead of the event loop's default executor
+    """
+    async def __call__(self, *args, **kwargs):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(db_executor, functools.partial(
+            self.thread_handler, loop, *args, **kwargs))
+
+
+database_sync_to_async = BoundedDatabaseSyncToAsync
 
-        if not self.user or not self.user.is_authenticated:
-            self.close()
+
+def get_scope_user(scope: dict) -> User:
+    """
+    Returns the authenticated user for the scope, or None. The middleware sets
+    the user lazily, so this needs the database.
+    """
+    user = scope.get('user')
+    if not user or not user.is_authenticated:
+        return None
+    return user
+
+
+class JembiAppRegistrationConsumer(AsyncJsonWebsocketConsumer):
+    async def connect(self) -> None:
+        self.user = await database_sync_to_async(get_scope_user)(self.scope)
+
+        if self.user is None:
+            await self.close()
             return
 
-        self.accept()
-        async_to_sync(self.channel_layer.group_add)(
+        await self.accept()
+        await self.channel_layer.group_add(
             "user.{}".format(self.user.id), self.channel_name)
 
-    def disconnect(self, close_code):
-        async_to_sync(self.channel_layer.group_discard)(
+    async def disconnect(self, close_code):
+        if getattr(self, 'user', None) is None:
+            return
+        await self.channel_layer.group_discard(
             "user.{}".format(self.user.id), self.channel_name)
 
-    def registration_event(self, event: dict) -> None:
+    async def registration_event(self, event: dict) -> None:
         """
         Sends the registration event over the websocket
         """
-        self.send_json(event['data'])
+        await self.send_json(event['data'])
 
-    def action_registration(self, data: dict) -> None:
+    def create_registration(self, data: dict) -> dict:
         """
-        Attempts to create a new registration, and returns the result of the
-        new registration
+        Creates the registration, returning the validation failure response if
+        the data isn't valid
         """
         try:
-            JembiAppRegistration.create_registration(
-                self.user, data)
+            JembiAppRegistration.create_registration(self.user, data)
         except ValidationError as e:
-            self.send_json({
+            return {
                 'registration_id': data.get('external_id'),
                 'registration_data': data,
                 'status': 'validation_failed',
                 'error': e.detail,
-            })
+            }
 
-    def action_status(self, data: dict) -> None:
+    async def action_registration(self, data: dict) -> None:
         """
-        If allowed, and if it exists, attempts to get the status of a
-        registration
+        Attempts to create a new registration, and returns the result of the
+        new registration
         """
-        reg_id = data.get('id', None)
-        if reg_id is None:
-            self.send_json({
-                'registration_id': None,
-                'registration_data': data,
-                'status': 'validation_failed',
-                'error': {
-                    'id': "id must be supplied for status query",
-                },
-            })
-            return
+        response = await database_sync_to_async(
+            self.create_registration)(data)
+        if response is not None:
+            await self.send_json(response)
 
-        try:
-            reg = JembiAppRegistrationStatus.get_registration(
-                self.user, reg_id)
-            self.send_json(reg.status)
-        except Http404:
-            self.send_json({
+    def get_statuses(self, requests: list) -> list:
+        """
+        Returns the status responses for a list of (registration ID, request
+        data) pairs, looking up all the registrations in a single query
+        """
+        registrations = JembiAppRegistrationStatus.get_registrations(
+            [reg_id for reg_id, _ in requests])
+
+        allowed = [
+            reg for reg in registrations.values()
+            if reg.created_by_id == self.user.id]
+        statuses = dict(zip(
+            (reg.pk for reg in allowed), Registration.get_statuses(allowed)))
+
+        responses = []
+        for reg_id, data in requests:
+            reg = registrations.get(reg_id)
+            if reg is None:
+                error = "Cannot find registration with ID {}".format(reg_id)
+            elif reg.created_by_id != self.user.id:
+                error = "You do not have permission to view this registration"
+            else:
+                responses.append(statuses[reg.pk])
+                continue
+            responses.append({
                 'registration_id': reg_id,
                 'registration_data': data,
                 'status': 'validation_failed',
                 'error': {
-                    'id': "Cannot find registration with ID {}".format(reg_id),
+                    'id': error,
                 },
             })
-            return
-        except PermissionDenied:
-            self.send_json({
-                'registration_id': reg_id,
+        return responses
+
+    async def action_status(self, data: dict) -> None:
+        """
+        If allowed, and if they exist, attempts to get the status of the
+        registration given by `id`, or of each registration given by `ids`
+        """
+        if data.get('ids'):
+            requests = [
+                (str(reg_id), {'id': reg_id}) for reg_id in data['ids']]
+        elif data.get('id') is not None:
+            requests = [(str(data['id']), data)]
+        else:
+            await self.send_json({
+                'registration_id': None,
                 'registration_data': data,
                 'status': 'validation_failed',
                 'error': {
-                    'id': "You do not have permission to view this "
-                    "registration",
+                    'id': "id must be supplied for status query",
                 },
             })
+            return
+
+        responses = await database_sync_to_async(self.get_statuses)(requests)
+        for response in responses:
+            await self.send_json(response)
 
-    def receive_json(self, content: dict) -> None:
+    async def receive_json(self, content: dict) -> None:
         action = content.get('action', None)
         data = content.get('data', {})
 
         if action == 'registration':
-            self.action_registration(data)
+            await self.action_registration(data)
         elif action == 'status':
-            self.action_status(data)
+            await self.action_status(data)
         else:
-            self.send_json({
+            await self.send_json({
                 'registration_id': data.get('external_id'),
                 'registration_data': data,
                 'status': 'validation_failed',
@@ -0,0 +1,131 @@
+"""
+The change feed of registrations, changes and subscription requests, for
+consumers that keep a copy of our data in sync without rereading the tables.
+
+Events are written by database triggers, see models.FeedEvent, but event IDs
+are allocated when the row is written, not when the transaction commits, so
+reading by ID could skip an event whose transaction commits after a later
+one. Instead, each event is given its place in the feed by `sequence_events`
+once its transaction has committed, and consumers read in that order.
+
+The events only record which row was written, and the current data of the row
+is added when the events are read, so that personally identifiable fields
+that are removed from a row are also removed from the feed.
+"""
+import time
+from collections import defaultdict
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import FeedEvent
+
+# The model of each of the model names in the feed
+FEED_MODELS = {
+    'registration': 'registrations.Registration',
+    'subscriptionrequest': 'registrations.SubscriptionRequest',
+    'change': 'changes.Change',
+}
+
+# Held while sequencing, so that only one process sequences at a time
+SEQUENCER_LOCK = 0x6e646f6866656564
+
+# Sequences, in the order they were written, the events of all the
+# transactions that are older than the oldest transaction still in progress.
+# Those transactions have all either committed or rolled back, so no more
+# events can appear before the ones that are sequenced.
+SEQUENCE_EVENTS_SQL = """
+UPDATE registrations_feedevent AS event
+SET sequence = pending.sequence
+FROM (
+    SELECT
+        id,
+        (SELECT COALESCE(MAX(sequence), 0) FROM registrations_feedevent) +
+            row_number() OVER (ORDER BY id) AS sequence
+    FROM registrations_feedevent
+    WHERE sequence IS NULL
+    AND txid < txid_snapshot_xmin(txid_current_snapshot())
+) AS pending
+WHERE event.id = pending.id
+"""
+
+
+def sequence_events():
+    """
+    Adds the events of all the committed transactions to the feed. Returns
+    the number of events added.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", [SEQUENCER_LOCK])
+        cursor.execute(SEQUENCE_EVENTS_SQL)
+        return cursor.rowcount
+
+
+def get_events(after=0, limit=None, models=None):
+    """
+    Returns up to `limit` events from the feed that come after the sequence
+    `after`, optionally only for the given models
+    """
+    if limit is None:
+        limit = settings.FEED_PAGE_SIZE
+    events = FeedEvent.objects.filter(sequence__gt=after)
+    if models:
+        events = events.filter(model__in=models)
+    events = list(events.order_by('sequence')[:limit])
+    add_data(events)
+    return events
+
+
+def add_data(events):
+    """
+    Sets `data` on each event to the current columns of its row, or None if
+    the row has been deleted
+    """
+    object_ids = defaultdict(set)
+    for event in events:
+        object_ids[event.model].add(event.object_id)
+
+    rows = {}
+    for model_name, ids in object_ids.items():
+        model = apps.get_model(*FEED_MODELS[model_name].split('.'))
+        fields = model._meta.concrete_fields
+        for obj in model.objects.filter(pk__in=ids):
+            rows[(model_name, str(obj.pk))] = {
+                field.attname: field.value_from_object(obj)
+                for field in fields}
+
+    for event in events:
+        event.data = rows.get((event.model, event.object_id))
+
+
+def wait_for_events(after=0, limit=None, models=None, timeout=0):
+    """
+    Returns the events after the sequence `after` like `get_events`, but if
+    there aren't any, waits for up to `timeout` seconds for new events
+    """
+    deadline = time.time() + timeout
+    while True:
+        sequence_events()
+        events = get_events(after, limit, models)
+        if events or time.time() >= deadline:
+            return events
+        time.sleep(min(
+            settings.FEED_POLL_INTERVAL, max(0, deadline - time.time())))
+
+
+def prune_events(keep):
+    """
+    Deletes the sequenced events that are older than the `keep` timedelta.
+    The latest event is always kept, so that the sequence carries on from it.
+    Returns the number of events deleted.
+    """
+    latest = FeedEvent.objects.filter(sequence__isnull=False).order_by(
+        '-sequence').values_list('sequence', flat=True).first()
+    if latest is None:
+        return 0
+    deleted, _ = FeedEvent.objects.filter(
+        sequence__lt=latest,
+        created_at__lt=timezone.now() - keep).delete()
+    return deleted
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from registrations.statistics import (
+    backfill_risk_statuses, update_registration_statistics)
+
+
+class Command(BaseCommand):
+    help = ("Stores the risk status on the validated PMTCT prebirth "
+            "registrations from before it was stored on validation, using "
+            "the fields on the Identity Store, and updates the registration "
+            "statistics.")
+
+    def handle(self, *args, **kwargs):
+        updated = backfill_risk_statuses()
+        update_registration_statistics()
+        self.stdout.write("Updated {} registrations".format(updated))
@@ -0,0 +1,30 @@
+import csv
+from itertools import chain
+
+from django.core.management.base import BaseCommand
+
+from ndoh_hub import messagesets
+
+
+class Command(BaseCommand):
+    help = ("Exports the table of the messageset, schedule and starting "
+            "sequence number that new subscriptions are created with, for "
+            "each registration type, authority and week, as CSV")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', type=str,
+            help="The file to write to, instead of stdout")
+
+    def handle(self, *args, **kwargs):
+        output = self.stdout
+        if kwargs['output']:
+            output = open(kwargs['output'], 'w')
+
+        table = messagesets.build_table()
+        writer = csv.writer(output)
+        writer.writerow(chain(
+            ('reg_type', 'authority', 'weeks'),
+            messagesets.MessagesetEntry._fields))
+        for key, entry in sorted(table.items()):
+            writer.writerow(chain(key, entry))
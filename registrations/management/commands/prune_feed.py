@@ -0,0 +1,20 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from registrations.feed import prune_events
+
+
+class Command(BaseCommand):
+    help = ("Deletes the change feed events that are older than the given "
+            "number of days. Consumers that are further behind than this "
+            "will miss events.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=30,
+            help="The number of days of events to keep")
+
+    def handle(self, *args, **kwargs):
+        deleted = prune_events(datetime.timedelta(days=kwargs['days']))
+        self.stdout.write("Deleted {} feed events".format(deleted))
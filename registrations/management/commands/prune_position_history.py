@@ -0,0 +1,20 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from registrations.positions import prune_history
+
+
+class Command(BaseCommand):
+    help = ("Deletes the position tracker history that is older than the "
+            "given number of days, keeping the latest history of each "
+            "tracker.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=90,
+            help="The number of days of history to keep")
+
+    def handle(self, *args, **kwargs):
+        deleted = prune_history(datetime.timedelta(days=kwargs['days']))
+        self.stdout.write("Deleted {} history records".format(deleted))
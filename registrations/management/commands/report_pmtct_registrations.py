@@ -4,6 +4,8 @@ from django.core.management.base import BaseCommand
 from django.db import connection
 from six.moves import zip
 
+from registrations.statistics import update_registration_statistics
+
 
 class Command(BaseCommand):
     help = 'Generate reports for PMTCT registrations.'
@@ -30,13 +32,14 @@ class Command(BaseCommand):
             writer.writerow(record)
 
     def handle(self, *args, **kwargs):
+        update_registration_statistics()
         query = """
         SELECT
          reg_type AS "Registration Type",
-         to_char(created_at, 'YYYY-MM-DD') AS created,
-         count(*) AS count
+         to_char(date, 'YYYY-MM-DD') AS created,
+         sum(count) AS count
         FROM
-         registrations_registration
+         registrations_registrationstatistic
         WHERE
          reg_type LIKE 'pmtct%'
         AND
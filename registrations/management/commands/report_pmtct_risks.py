@@ -1,5 +1,6 @@
 import csv
 from collections import defaultdict
+from itertools import islice
 
 # NOTE: Python 3 compatibility
 try:
@@ -11,9 +12,10 @@ from django.core.management.base import BaseCommand, CommandError
 from django.core.validators import URLValidator
 from django.db.models import Q
 
+from ndoh_hub.utils import get_today
 from registrations.models import Registration
 from registrations.tasks import (
-    add_personally_identifiable_fields, get_risk_status)
+    add_personally_identifiable_fields, get_risk_status, get_risk_statuses)
 
 from seed_services_client import HubApiClient, IdentityStoreApiClient
 
@@ -123,13 +125,20 @@ class Command(BaseCommand):
                 Q(reg_type='whatsapp_pmtct_prebirth'),
                 validated=True)
 
-            for registration in registrations.iterator():
-                add_personally_identifiable_fields(registration)
-                risk = get_risk_status(registration.reg_type,
-                                       registration.data["mom_dob"],
-                                       registration.data.get("edd"))
-
-                add_to_result(risk, registration.registrant_id)
+            # The risks are calculated a chunk of registrations at a time
+            rows = registrations.iterator()
+            for chunk in iter(lambda: list(islice(rows, 1000)), []):
+                for registration in chunk:
+                    add_personally_identifiable_fields(registration)
+                risks = get_risk_statuses(
+                    get_today(),
+                    [registration.reg_type for registration in chunk],
+                    [registration.data["mom_dob"] for registration in chunk],
+                    [registration.data.get("edd") for registration in chunk])
+
+                for registration, risk in zip(chunk, risks):
+                    add_to_result(
+                        risk or "unknown", registration.registrant_id)
 
         writer = csv.DictWriter(output, headers)
         writer.writeheader()
@@ -0,0 +1,37 @@
+from wsgiref.simple_server import make_server
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from ndoh_hub.prometheus import CONTENT_TYPE, render_metrics
+
+
+def metrics_app(environ, start_response):
+    if environ['PATH_INFO'] != '/metrics':
+        start_response('404 Not Found', [('Content-Type', 'text/plain')])
+        return [b'Not Found\n']
+    close_old_connections()
+    body = render_metrics().encode('utf-8')
+    start_response('200 OK', [
+        ('Content-Type', CONTENT_TYPE),
+        ('Content-Length', str(len(body))),
+    ])
+    return [body]
+
+
+class Command(BaseCommand):
+    help = ("Serves the Prometheus metrics at /metrics, for processes that "
+            "don't serve HTTP, eg. Celery workers. Run it next to the "
+            "workers, with the same INSTRUMENTATION_DIRECTORY.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--host', default='0.0.0.0', help="The address to listen on")
+        parser.add_argument(
+            '--port', type=int, default=9100, help="The port to listen on")
+
+    def handle(self, *args, **kwargs):
+        server = make_server(kwargs['host'], kwargs['port'], metrics_app)
+        self.stdout.write('Serving metrics on http://{}:{}/metrics'.format(
+            kwargs['host'], kwargs['port']))
+        server.serve_forever()
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from registrations.statistics import update_registration_statistics
+
+
+class Command(BaseCommand):
+    help = ("Updates the daily registration statistics for the registrations "
+            "written since the last update.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild', action='store_true', default=False,
+            help="Recount all of the registrations")
+
+    def handle(self, *args, **kwargs):
+        update_registration_statistics(rebuild=kwargs['rebuild'])
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.10 on 2026-10-18 11:40
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+
+
+# Records a feed event for each row written to the table that the trigger is
+# on. The first trigger argument is the model name for the events.
+RECORD_FEED_EVENT = """
+CREATE OR REPLACE FUNCTION registrations_record_feed_event()
+RETURNS trigger AS $$
+DECLARE
+    rec record;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        rec := OLD;
+    ELSE
+        rec := NEW;
+    END IF;
+    INSERT INTO registrations_feedevent
+        (txid, model, object_id, action, data, created_at)
+    VALUES (
+        txid_current(), TG_ARGV[0], rec.id::text,
+        CASE TG_OP
+            WHEN 'INSERT' THEN 'created'
+            WHEN 'UPDATE' THEN 'updated'
+            ELSE 'deleted'
+        END,
+        CASE TG_OP WHEN 'DELETE' THEN NULL ELSE row_to_json(rec)::jsonb END,
+        now()
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+CREATE_TRIGGER = """
+CREATE TRIGGER {table}_feed
+AFTER INSERT OR UPDATE OR DELETE ON {table}
+FOR EACH ROW EXECUTE PROCEDURE registrations_record_feed_event('{model}');
+"""
+
+DROP_TRIGGER = "DROP TRIGGER IF EXISTS {table}_feed ON {table};"
+
+
+def feed_trigger(table, model):
+    return migrations.RunSQL(
+        CREATE_TRIGGER.format(table=table, model=model),
+        DROP_TRIGGER.format(table=table))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registrations', '0015_auto_20261018_0912'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('sequence', models.BigIntegerField(help_text='The position of the event in the feed', null=True, unique=True)),  # noqa
+                ('txid', models.BigIntegerField(help_text='The ID of the transaction that wrote the event')),  # noqa
+                ('model', models.CharField(max_length=30)),
+                ('object_id', models.CharField(max_length=36)),
+                ('action', models.CharField(choices=[('created', 'Created'), ('updated', 'Updated'), ('deleted', 'Deleted')], max_length=10)),  # noqa
+                ('data', django.contrib.postgres.fields.jsonb.JSONField(blank=True, help_text='The row after the write, or null for deletes', null=True)),  # noqa
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        # The sequencer looks for the events that haven't been sequenced yet
+        migrations.RunSQL(
+            "CREATE INDEX registrations_feedevent_unsequenced "
+            "ON registrations_feedevent (id) WHERE sequence IS NULL;",
+            "DROP INDEX registrations_feedevent_unsequenced;"),
+        migrations.RunSQL(
+            RECORD_FEED_EVENT,
+            "DROP FUNCTION registrations_record_feed_event();"),
+        feed_trigger('registrations_registration', 'registration'),
+        feed_trigger(
+            'registrations_subscriptionrequest', 'subscriptionrequest'),
+    ]
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.10 on 2026-10-18 13:05
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registrations', '0016_feedevent'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='registration',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.CreateModel(
+            name='RegistrationStatistic',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),  # noqa
+                ('date', models.DateField()),
+                ('reg_type', models.CharField(max_length=30)),
+                ('validated', models.BooleanField()),
+                ('risk', models.CharField(blank=True, default='', help_text='The risk status for PMTCT registrations, if known', max_length=10)),  # noqa
+                ('count', models.IntegerField(default=0)),
+                ('source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='statistics', to='registrations.Source')),  # noqa
+            ],
+        ),
+        migrations.CreateModel(
+            name='Watermark',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),  # noqa
+                ('timestamp', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='registrationstatistic',
+            unique_together=set([('date', 'reg_type', 'source', 'validated', 'risk')]),  # noqa
+        ),
+    ]
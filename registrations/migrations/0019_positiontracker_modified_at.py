@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.10 on 2026-10-18 16:02
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def set_modified_at(apps, schema_editor):
+    """
+    Sets the modified at time to the time of the last change in the history
+    """
+    PositionTracker = apps.get_model('registrations', 'PositionTracker')
+    HistoricalPositionTracker = apps.get_model(
+        'registrations', 'HistoricalPositionTracker')
+    for tracker in PositionTracker.objects.all():
+        history = HistoricalPositionTracker.objects.filter(
+            label=tracker.label).order_by('-history_date').first()
+        if history is not None:
+            PositionTracker.objects.filter(label=tracker.label).update(
+                modified_at=history.history_date)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registrations', '0017_registrationstatistic_watermark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historicalpositiontracker',
+            name='modified_at',
+            field=models.DateTimeField(blank=True, db_index=True, default=django.utils.timezone.now, editable=False, help_text='When the tracker was last modified'),  # noqa
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='positiontracker',
+            name='modified_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now, help_text='When the tracker was last modified'),  # noqa
+            preserve_default=False,
+        ),
+        migrations.RunPython(set_modified_at, migrations.RunPython.noop),
+    ]
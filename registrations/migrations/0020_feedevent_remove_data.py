@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.10 on 2026-10-19 09:10
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# Only records which row was written, and how. The row itself is loaded when
+# the event is served, so that the feed doesn't keep copies of personally
+# identifiable fields after they're removed from the row.
+RECORD_FEED_EVENT = """
+CREATE OR REPLACE FUNCTION registrations_record_feed_event()
+RETURNS trigger AS $$
+DECLARE
+    rec record;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        rec := OLD;
+    ELSE
+        rec := NEW;
+    END IF;
+    INSERT INTO registrations_feedevent
+        (txid, model, object_id, action, created_at)
+    VALUES (
+        txid_current(), TG_ARGV[0], rec.id::text,
+        CASE TG_OP
+            WHEN 'INSERT' THEN 'created'
+            WHEN 'UPDATE' THEN 'updated'
+            ELSE 'deleted'
+        END,
+        now()
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+# The previous version, which copied the row into the event
+RECORD_FEED_EVENT_WITH_DATA = """
+CREATE OR REPLACE FUNCTION registrations_record_feed_event()
+RETURNS trigger AS $$
+DECLARE
+    rec record;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        rec := OLD;
+    ELSE
+        rec := NEW;
+    END IF;
+    INSERT INTO registrations_feedevent
+        (txid, model, object_id, action, data, created_at)
+    VALUES (
+        txid_current(), TG_ARGV[0], rec.id::text,
+        CASE TG_OP
+            WHEN 'INSERT' THEN 'created'
+            WHEN 'UPDATE' THEN 'updated'
+            ELSE 'deleted'
+        END,
+        CASE TG_OP WHEN 'DELETE' THEN NULL ELSE row_to_json(rec)::jsonb END,
+        now()
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registrations', '0019_positiontracker_modified_at'),
+    ]
+
+    operations = [
+        migrations.RunSQL(RECORD_FEED_EVENT, RECORD_FEED_EVENT_WITH_DATA),
+        migrations.RemoveField(
+            model_name='feedevent',
+            name='data',
+        ),
+    ]
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.10 on 2026-10-19 10:02
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registrations', '0020_feedevent_remove_data'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegistrationStatisticRecount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),  # noqa
+                ('date', models.DateField()),
+            ],
+        ),
+    ]
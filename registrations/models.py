@@ -4,6 +4,7 @@ from django.contrib.postgres.fields import JSONField
 from django.contrib.auth.models import User
 from django.db import models
 from django.utils.encoding import python_2_unicode_compatible
+from rest_framework.fields import DateTimeField
 from simple_history.models import HistoricalRecords
 
 
@@ -30,6 +31,26 @@ class Source(models.Model):
         return "%s" % self.name
 
 
+_represent_datetime = DateTimeField().to_representation
+
+# The fields of RegistrationSerializer, as (field name, model attribute,
+# representation), so that the registration data for statuses can be built
+# without running the serializer. Null values are always represented as None.
+STATUS_DATA_FIELDS = (
+    ('id', 'id', str),
+    ('external_id', 'external_id', str),
+    ('reg_type', 'reg_type', str),
+    ('registrant_id', 'registrant_id', str),
+    ('validated', 'validated', bool),
+    ('data', 'data', None),
+    ('source', 'source_id', None),
+    ('created_at', 'created_at', _represent_datetime),
+    ('updated_at', 'updated_at', _represent_datetime),
+    ('created_by', 'created_by_id', None),
+    ('updated_by', 'updated_by_id', None),
+)
+
+
 @python_2_unicode_compatible
 class Registration(models.Model):
     """ A registation submitted via Vumi or other sources.
@@ -73,8 +94,8 @@ class Registration(models.Model):
     validated = models.BooleanField(default=False)
     source = models.ForeignKey(Source, related_name='registrations',
                                null=False)
-    created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     created_by = models.ForeignKey(User, related_name='registrations_created',
                                    null=True)
     updated_by = models.ForeignKey(User, related_name='registrations_updated',
@@ -98,10 +119,9 @@ class Registration(models.Model):
         """
         Returns the processing status information for the registration
         """
-        from registrations.serializers import RegistrationSerializer
         data = {
             'registration_id': str(self.external_id or self.id),
-            'registration_data': RegistrationSerializer(instance=self).data,
+            'registration_data': self.get_registration_data(),
         }
 
         if self.validated is True:
@@ -116,6 +136,27 @@ class Registration(models.Model):
             data['status'] = 'processing'
         return data
 
+    @classmethod
+    def get_statuses(cls, registrations):
+        """
+        Returns the processing status information for each of the
+        registrations
+        """
+        return [reg.status for reg in registrations]
+
+    def get_registration_data(self):
+        """
+        Returns the same data as RegistrationSerializer, built directly from
+        the model fields
+        """
+        data = {}
+        for name, attribute, represent in STATUS_DATA_FIELDS:
+            value = getattr(self, attribute)
+            if value is not None and represent is not None:
+                value = represent(value)
+            data[name] = value
+        return data
+
 
 @python_2_unicode_compatible
 class SubscriptionRequest(models.Model):
@@ -172,6 +213,9 @@ class PositionTracker(models.Model):
         help_text="The unique label to identify the tracker")
     position = models.IntegerField(
         default=1, help_text="The current position of the tracker")
+    modified_at = models.DateTimeField(
+        auto_now=True, db_index=True,
+        help_text="When the tracker was last modified")
     history = HistoricalRecords()
 
     class Meta:
@@ -179,12 +223,92 @@ class PositionTracker(models.Model):
             'increment_position_positiontracker', 'Can increment the position'
         ),)
 
-    @property
-    def modified_at(self):
-        """
-        Returns the datetime when the position was last modified
-        """
-        return self.history.first().history_date
-
     def __str__(self):
         return '{}: {}'.format(self.label, self.position)
+
+
+@python_2_unicode_compatible
+class FeedEvent(models.Model):
+    """
+    An entry in the change feed of creates, updates and deletes of
+    registrations, changes and subscription requests.
+
+    Events are written by database triggers, in the same transaction as the
+    write, so every write is recorded, including bulk creates and queryset
+    updates. `sequence` is only assigned once the writing transaction has
+    committed, by registrations.feed.sequence_events, so consumers that read
+    the feed in order of sequence never miss an event.
+
+    Only the row that was written is recorded, not its data, which is loaded
+    from the row when the event is served. Old events are deleted by
+    registrations.feed.prune_events.
+    """
+    ACTION_CHOICES = (
+        ('created', "Created"),
+        ('updated', "Updated"),
+        ('deleted', "Deleted"),
+    )
+    id = models.BigAutoField(primary_key=True)
+    sequence = models.BigIntegerField(
+        null=True, unique=True,
+        help_text="The position of the event in the feed")
+    txid = models.BigIntegerField(
+        help_text="The ID of the transaction that wrote the event")
+    model = models.CharField(max_length=30)
+    object_id = models.CharField(max_length=36)
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return '{} {} {}'.format(self.model, self.object_id, self.action)
+
+
+@python_2_unicode_compatible
+class RegistrationStatistic(models.Model):
+    """
+    The number of registrations created on a day, for each combination of
+    registration type, source, validation and risk status, so that reports
+    don't need to count all of the registrations.
+
+    Kept up to date by registrations.statistics.update_registration_statistics
+    """
+    date = models.DateField()
+    reg_type = models.CharField(max_length=30)
+    source = models.ForeignKey(Source, related_name='statistics', null=False)
+    validated = models.BooleanField()
+    risk = models.CharField(
+        max_length=10, blank=True, default='',
+        help_text="The risk status for PMTCT registrations, if known")
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = (
+            ('date', 'reg_type', 'source', 'validated', 'risk'),)
+
+    def __str__(self):
+        return '{} {}: {}'.format(self.date, self.reg_type, self.count)
+
+
+@python_2_unicode_compatible
+class RegistrationStatisticRecount(models.Model):
+    """
+    A day whose registration statistics need to be recounted, because a
+    registration created on it was deleted, and so won't be found by the next
+    incremental update. One is added for each deleted registration.
+    """
+    date = models.DateField()
+
+    def __str__(self):
+        return str(self.date)
+
+
+@python_2_unicode_compatible
+class Watermark(models.Model):
+    """
+    Records how far through a table an incremental job has processed
+    """
+    name = models.CharField(max_length=100, primary_key=True)
+    timestamp = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return '{}: {}'.format(self.name, self.timestamp)
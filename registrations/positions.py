@@ -0,0 +1,140 @@
+"""
+Cached reads and atomic increments of the PositionTracker positions.
+
+The positions are read for every subscription that is created on a tracked
+messageset, but only change when the position is incremented, so they're
+cached in each process. Each cached position is stored with the version in
+Redis that it was read at, and the version is incremented whenever a
+PositionTracker is incremented, saved or deleted, so that every process reads
+the new position on its next read. Entries also expire after
+settings.POSITION_CACHE_TTL seconds, and 0 disables the cache.
+
+Each increment also writes a history record, which is kept for auditing.
+prune_history deletes the old history, so that the history table stays
+small.
+"""
+import redis
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from ndoh_hub.cache import LRUCache
+
+from .models import PositionTracker
+
+
+class PositionCache(LRUCache):
+    """
+    Cache of the position for each PositionTracker label
+    """
+    maxsize = 100
+
+    @property
+    def ttl(self):
+        return settings.POSITION_CACHE_TTL
+
+
+cache = PositionCache()
+
+VERSION_KEY = 'position_tracker_version'
+
+_redis = None
+
+
+def get_redis():
+    global _redis
+    if _redis is None:
+        _redis = redis.StrictRedis.from_url(settings.REDIS_URL)
+    return _redis
+
+
+def get_position(label):
+    """
+    Returns the current position of the tracker. Raises
+    PositionTracker.DoesNotExist if there is no tracker with the label.
+    """
+    if not settings.POSITION_CACHE_TTL:
+        return PositionTracker.objects.values_list(
+            'position', flat=True).get(label=label)
+
+    # The version is read before the position, so that a position is never
+    # cached against a version that is newer than it
+    version = get_redis().get(VERSION_KEY)
+    entry = cache.get(label)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    position = PositionTracker.objects.values_list(
+        'position', flat=True).get(label=label)
+    cache.set(label, (version, position))
+    return position
+
+
+def increment_position(label, interval, user=None):
+    """
+    Increments the position of the tracker, unless it has been modified,
+    either by an increment or by a save, within `interval`. The check and the
+    increment are a single update, so concurrent increments can't both
+    succeed or lose an increment.
+
+    Returns the updated tracker, or None if it wasn't incremented.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        updated = PositionTracker.objects.filter(
+            label=label, modified_at__lte=now - interval
+        ).update(
+            position=F('position') + 1, modified_at=now)
+        if not updated:
+            return None
+
+        # Queryset updates don't create a history record, so create it here
+        tracker = PositionTracker.objects.get(label=label)
+        PositionTracker.history.create(
+            label=tracker.label, position=tracker.position,
+            modified_at=tracker.modified_at, history_date=now,
+            history_type='~', history_user=user)
+    cache.delete(label)
+    increment_version()
+    return tracker
+
+
+def prune_history(keep):
+    """
+    Deletes the history of the trackers that is older than the `keep`
+    timedelta, except for the latest history of each tracker. Returns the
+    number of history records deleted.
+    """
+    latest = []
+    for label in PositionTracker.objects.values_list('label', flat=True):
+        history_id = PositionTracker.history.filter(label=label).values_list(
+            'history_id', flat=True).first()
+        if history_id is not None:
+            latest.append(history_id)
+
+    deleted, _ = PositionTracker.history.filter(
+        history_date__lt=timezone.now() - keep
+    ).exclude(history_id__in=latest).delete()
+    return deleted
+
+
+def increment_version():
+    """
+    Increments the version in Redis, so that every process reads the
+    positions from the database on their next read
+    """
+    if settings.POSITION_CACHE_TTL:
+        get_redis().incr(VERSION_KEY)
+
+
+def invalidate_cache():
+    """
+    Clears the cache in this process now, and in every process once the
+    current transaction is committed
+    """
+    cache.clear()
+    transaction.on_commit(increment_version)
+
+
+def clear_cache():
+    cache.clear()
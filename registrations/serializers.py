@@ -7,7 +7,7 @@ from rest_hooks.models import Hook
 
 from ndoh_hub import utils
 from registrations import validators
-from registrations.models import PositionTracker
+from registrations.models import FeedEvent, PositionTracker
 
 
 class UserSerializer(serializers.HyperlinkedModelSerializer):
@@ -233,3 +233,23 @@ class PositionTrackerSerializer(serializers.ModelSerializer):
     class Meta:
         model = PositionTracker
         fields = ('url', 'label', 'position')
+
+
+class FeedEventSerializer(serializers.ModelSerializer):
+    # Added by registrations.feed.get_events, from the current row
+    data = serializers.JSONField(read_only=True)
+
+    class Meta:
+        model = FeedEvent
+        fields = ('sequence', 'model', 'object_id', 'action', 'data',
+                  'created_at')
+
+
+class FeedQuerySerializer(serializers.Serializer):
+    after = serializers.IntegerField(min_value=0, default=0)
+    limit = serializers.IntegerField(min_value=1, required=False)
+    model = serializers.ListField(
+        child=serializers.ChoiceField(
+            choices=('registration', 'change', 'subscriptionrequest')),
+        required=False)
+    timeout = serializers.FloatField(min_value=0, default=0)
@@ -19,3 +19,28 @@ def psh_fire_created_metric(sender, instance, created, **kwargs):
             "metric_name": 'registrations.created.sum',
             "metric_value": 1.0
         })
+
+
+def clear_source_cache(sender, instance, **kwargs):
+    """ Post save and delete hook to clear the cached Sources
+    """
+    from .sources import clear_cache
+    clear_cache()
+
+
+def clear_position_cache(sender, instance, **kwargs):
+    """ Post save and delete hook to clear the cached positions in every
+        process
+    """
+    from .positions import invalidate_cache
+    invalidate_cache()
+
+
+def pdh_recount_registration_statistics(sender, instance, **kwargs):
+    """ Post delete hook to recount the registration statistics for the day
+    that the Registration was created on
+    """
+    from django.utils import timezone
+    from .models import RegistrationStatisticRecount
+    RegistrationStatisticRecount.objects.create(
+        date=timezone.localdate(instance.created_at))
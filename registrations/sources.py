@@ -0,0 +1,49 @@
+"""
+Cached lookups of the Source for an authenticated user.
+
+Sources change very rarely, but are needed for every registration and change
+that is submitted, so they're cached in each process. The cache is cleared
+whenever a Source is saved or deleted in this process, and entries expire
+after settings.SOURCE_CACHE_TTL seconds so that changes made by other
+processes are eventually picked up.
+"""
+from django.conf import settings
+
+from ndoh_hub.cache import LRUCache
+
+from .models import Source
+
+
+class SourceCache(LRUCache):
+    """
+    Cache of the Source for each user and authority
+    """
+    maxsize = 1000
+
+    @property
+    def ttl(self):
+        return settings.SOURCE_CACHE_TTL
+
+
+cache = SourceCache()
+
+
+def get_source(user_id, authority=None):
+    """
+    Returns the source for the user, optionally limited to the sources with
+    the given authority. Raises Source.DoesNotExist or
+    Source.MultipleObjectsReturned like Source.objects.get.
+    """
+    key = (str(user_id), authority)
+    source = cache.get(key)
+    if source is None:
+        sources = Source.objects.filter(user_id=user_id)
+        if authority is not None:
+            sources = sources.filter(authority=authority)
+        source = sources.get()
+        cache.set(key, source)
+    return source
+
+
+def clear_cache():
+    cache.clear()
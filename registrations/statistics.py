@@ -0,0 +1,218 @@
+"""
+Daily registration counts, rolled up into RegistrationStatistic, so that
+reports and dashboards can read a few pre-aggregated rows instead of counting
+the whole registration table.
+
+The rollup is updated incrementally. Each update recounts only the days that
+have registrations which were written since the last update, found using the
+index on updated_at. An update can be run at any time. The
+update_registration_statistics task runs one every
+REGISTRATION_STATISTICS_INTERVAL seconds, and the reports run one before they
+read the statistics.
+"""
+import datetime
+from collections import Counter
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.postgres.fields import JSONField
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from ndoh_hub import utils
+from .models import (
+    Registration, RegistrationStatistic, RegistrationStatisticRecount,
+    Watermark)
+from .tasks import (
+    add_personally_identifiable_fields, get_risk_status, get_risk_statuses)
+
+WATERMARK = 'registration_statistics'
+RISK_CHUNK_SIZE = 2000
+PMTCT_PREBIRTH_REG_TYPES = ('pmtct_prebirth', 'whatsapp_pmtct_prebirth')
+
+
+def get_risk(reg_type, data):
+    """
+    Returns the risk status of a PMTCT registration, or '' for other
+    registrations, or if the risk can't be determined.
+
+    The risk status is stored on the registration when it is validated. For
+    older registrations, it is calculated if the registration still has the
+    information needed.
+    """
+    if 'pmtct' not in reg_type:
+        return ''
+    data = data or {}
+    if data.get('risk_status'):
+        return data['risk_status']
+    if 'postbirth' in reg_type or (data.get('mom_dob') and data.get('edd')):
+        return get_risk_status(reg_type, data.get('mom_dob'), data.get('edd'))
+    return ''
+
+
+def get_risks(registrations):
+    """
+    Batch version of get_risk, for a list of (reg_type, data). The risks that
+    have to be calculated are calculated together.
+    """
+    risks = []
+    calculate = []
+    for i, (reg_type, data) in enumerate(registrations):
+        data = data or {}
+        if 'pmtct' not in reg_type:
+            risks.append('')
+        elif data.get('risk_status'):
+            risks.append(data['risk_status'])
+        elif 'postbirth' in reg_type or (
+                data.get('mom_dob') and data.get('edd')):
+            risks.append('')
+            calculate.append(
+                (i, reg_type, data.get('mom_dob'), data.get('edd')))
+        else:
+            risks.append('')
+
+    if calculate:
+        indexes, reg_types, mom_dobs, edds = zip(*calculate)
+        for i, risk in zip(indexes, get_risk_statuses(
+                utils.get_today(), reg_types, mom_dobs, edds)):
+            risks[i] = risk or ''
+    return risks
+
+
+def backfill_risk_statuses():
+    """
+    Stores the risk status on the validated PMTCT prebirth registrations from
+    before it was stored on validation, whose personally identifiable fields
+    have already been removed, so that it can't be calculated from their data.
+
+    The fields are added back from the Identity Store to calculate the risk,
+    but only the risk status is saved. If the risk still can't be calculated,
+    an empty risk status is saved, so that the registration isn't looked up
+    again. updated_at is set, so that the next statistics update recounts the
+    registrations. Returns the number of registrations updated.
+    """
+    registrations = Registration.objects.filter(
+        reg_type__in=PMTCT_PREBIRTH_REG_TYPES, validated=True)\
+        .exclude(data__has_key='risk_status')
+    updated = 0
+    rows = registrations.iterator()
+    for chunk in iter(lambda: list(islice(rows, RISK_CHUNK_SIZE)), []):
+        chunk = [
+            registration for registration in chunk
+            if not get_risk(registration.reg_type, registration.data)]
+        # Copied before the fields are added, so that they aren't saved
+        data = [dict(registration.data) for registration in chunk]
+        for registration in chunk:
+            add_personally_identifiable_fields(registration)
+        risks = get_risk_statuses(
+            utils.get_today(),
+            [registration.reg_type for registration in chunk],
+            [registration.data.get('mom_dob') for registration in chunk],
+            [registration.data.get('edd') for registration in chunk])
+
+        now = timezone.now()
+        for registration, registration_data, risk in zip(chunk, data, risks):
+            registration_data['risk_status'] = risk or ''
+            Registration.objects.filter(pk=registration.pk).update(
+                data=registration_data, updated_at=now)
+            updated += 1
+    return updated
+
+
+def day_range(date):
+    """
+    Returns a filter for the registrations created on the day `date`, in the
+    current timezone, that can use the index on created_at
+    """
+    start = timezone.make_aware(
+        datetime.datetime.combine(date, datetime.time()))
+    return Q(
+        created_at__gte=start,
+        created_at__lt=start + datetime.timedelta(days=1))
+
+
+def count_registrations(dates=None):
+    """
+    Recounts the registrations created on each of the given days, replacing
+    the statistics for those days, or for all days if `dates` is None
+    """
+    registrations = Registration.objects.all()
+    statistics = RegistrationStatistic.objects.all()
+    if dates is not None:
+        if not dates:
+            return
+        days = Q()
+        for date in dates:
+            days |= day_range(date)
+        registrations = registrations.filter(days)
+        statistics = statistics.filter(date__in=dates)
+
+    # Only the PMTCT registrations' data is needed, to get the risk status
+    registrations = registrations.annotate(
+        date=TruncDate('created_at'),
+        pmtct_data=Case(
+            When(reg_type__contains='pmtct', then=F('data')),
+            default=Value(None), output_field=JSONField()))
+
+    rows = registrations.values_list(
+        'date', 'reg_type', 'source_id', 'validated', 'pmtct_data')\
+        .iterator()
+    counts = Counter()
+    # The risks are calculated a chunk of registrations at a time
+    for chunk in iter(lambda: list(islice(rows, RISK_CHUNK_SIZE)), []):
+        risks = get_risks([(row[1], row[4]) for row in chunk])
+        for (date, reg_type, source_id, validated, _), risk in zip(
+                chunk, risks):
+            counts[(date, reg_type, source_id, validated, risk)] += 1
+
+    statistics.delete()
+    RegistrationStatistic.objects.bulk_create(
+        RegistrationStatistic(
+            date=date, reg_type=reg_type, source_id=source_id,
+            validated=validated, risk=risk, count=count)
+        for (date, reg_type, source_id, validated, risk), count
+        in counts.items())
+
+
+def update_registration_statistics(rebuild=False):
+    """
+    Updates the statistics for the days that have registrations that were
+    written since the last update. The first update, or an update with
+    `rebuild`, counts all the registrations.
+
+    Rows are written with updated_at set before their transaction commits, so
+    registrations written up to REGISTRATION_STATISTICS_OVERLAP seconds before
+    the last update are checked again. The days of deleted registrations are
+    recorded in RegistrationStatisticRecount when they're deleted, and are
+    recounted too.
+    """
+    with transaction.atomic():
+        Watermark.objects.get_or_create(name=WATERMARK)
+        # Locks the watermark, so that only one update runs at a time
+        watermark = Watermark.objects.select_for_update().get(name=WATERMARK)
+        now = timezone.now()
+
+        recounts = list(
+            RegistrationStatisticRecount.objects.values_list('id', 'date'))
+        if rebuild or watermark.timestamp is None:
+            count_registrations()
+        else:
+            since = watermark.timestamp - datetime.timedelta(
+                seconds=settings.REGISTRATION_STATISTICS_OVERLAP)
+            dates = set(
+                Registration.objects.filter(updated_at__gte=since)
+                .annotate(date=TruncDate('created_at'))
+                .values_list('date', flat=True)
+                .distinct())
+            dates.update(date for _, date in recounts)
+            count_registrations(sorted(dates))
+
+        # Only the recounts that were read, any added since are for the next
+        # update
+        RegistrationStatisticRecount.objects.filter(
+            id__in=[id for id, _ in recounts]).delete()
+
+        watermark.timestamp = now
+        watermark.save()
@@ -1,3 +1,4 @@
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 import json
 import random
@@ -9,7 +10,6 @@ except ImportError:
     from urllib.parse import urljoin
 from datetime import datetime
 
-import requests
 from requests.exceptions import HTTPError, ConnectionError
 
 from asgiref.sync import async_to_sync
@@ -18,25 +18,21 @@ from celery import chain
 from celery.task import Task
 from celery.utils.log import get_task_logger
 from channels.layers import get_channel_layer
-from seed_services_client.identity_store import IdentityStoreApiClient
-from seed_services_client.service_rating import ServiceRatingApiClient
 
-from ndoh_hub import utils
+from ndoh_hub import messagesets, utils
 from ndoh_hub.celery import app
+from ndoh_hub.clients import is_client, sr_client
+from ndoh_hub.validation import get_messages
 from .models import Registration
+from .validation import schema as registration_schema
 
 
-is_client = IdentityStoreApiClient(
-    api_url=settings.IDENTITY_STORE_URL,
-    auth_token=settings.IDENTITY_STORE_TOKEN
-)
-
-sr_client = ServiceRatingApiClient(
-    api_url=settings.SERVICE_RATING_URL,
-    auth_token=settings.SERVICE_RATING_TOKEN
-)
-
-group_send = async_to_sync(get_channel_layer().group_send)
+def group_send(group, message):
+    """
+    Sends the message to the channel layer group. The channel layer is only
+    set up on first use.
+    """
+    async_to_sync(get_channel_layer().group_send)(group, message)
 
 
 def get_risk_status(reg_type, mom_dob, edd):
@@ -60,6 +56,118 @@ def get_risk_status(reg_type, mom_dob, edd):
     return "normal"
 
 
+def get_risk_statuses(today, reg_types, mom_dobs, edds):
+    """
+    Batch version of get_risk_status, for columns of registration data.
+    Returns None for prebirth registrations whose dates aren't valid.
+    """
+    ages = utils.get_mom_ages(today, mom_dobs)
+    weeks = utils.get_pregnancy_weeks(today, edds)
+    risks = []
+    for reg_type, age, week in zip(reg_types, ages, weeks):
+        if "postbirth" in reg_type:
+            risks.append("high")
+        elif age is None:
+            risks.append(None)
+        elif age < 18:
+            risks.append("high")
+        elif week is None:
+            risks.append(None)
+        elif week >= 20:
+            risks.append("high")
+        else:
+            risks.append("normal")
+    return risks
+
+
+def get_identity_by_msisdn(is_client, msisdn):
+    """
+    Returns the first identity with the given msisdn, or None if there is no
+    such identity
+    """
+    results = is_client.get_identity_by_address('msisdn', msisdn)['results']
+    return next(iter(results), None)
+
+
+def get_third_party_identity_details(reg_data, authority):
+    """
+    Returns the details to store on the mother's identity for a third party
+    registration
+    """
+    details = {
+        'operator_id': reg_data['operator_id'],
+        'lang_code': reg_data['language'],
+        'id_type': reg_data['id_type'],
+        'mom_dob': reg_data['mom_dob'],
+        'last_edd': reg_data['edd'],
+        'faccode': reg_data['faccode'],
+        'consent': reg_data['consent'],
+        'last_mc_reg_on': authority,
+        'source': 'external',
+    }
+    if reg_data['id_type'] == 'sa_id':
+        details['sa_id_no'] = reg_data['sa_id_no']
+    elif reg_data['id_type'] == 'passport':
+        details['passport_origin'] = reg_data['passport_origin']
+        details['passport_no'] = reg_data['passport_no']
+    return details
+
+
+def resolve_third_party_identities(is_client, reg_data, authority):
+    """
+    Gets or creates the health care worker's and the mother's identities for
+    a third party registration, and stores the registration details on the
+    mother's identity. The two identity lookups are done concurrently.
+
+    Returns the operator ID, which is None if the mother registered herself,
+    and the mother's identity.
+    """
+    mom_msisdn = reg_data['msisdn_registrant']
+    hcw_msisdn = reg_data['msisdn_device']
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        mom_lookup = executor.submit(
+            get_identity_by_msisdn, is_client, mom_msisdn)
+        hcw_lookup = None
+        if hcw_msisdn != mom_msisdn:
+            hcw_lookup = executor.submit(
+                get_identity_by_msisdn, is_client, hcw_msisdn)
+        mom_identity = mom_lookup.result()
+        hcw_identity = hcw_lookup.result() if hcw_lookup else None
+
+    operator = None
+    if hcw_lookup is not None:
+        if hcw_identity is None:
+            hcw_identity = is_client.create_identity({
+                'details': {
+                    'default_addr_type': 'msisdn',
+                    'addresses': {
+                        'msisdn': {
+                            hcw_msisdn: {'default': True}
+                        }
+                    }
+                }
+            })
+        operator = hcw_identity['id']
+
+    details = get_third_party_identity_details(
+        dict(reg_data, operator_id=operator), authority)
+    if mom_identity is None:
+        details['default_addr_type'] = 'msisdn'
+        details['addresses'] = {
+            'msisdn': {
+                mom_msisdn: {'default': True}
+            }
+        }
+        mom_identity = is_client.create_identity({'details': details})
+    else:
+        mom_identity['details'].update(details)
+        # update_identity returns the object directly as JSON
+        mom_identity = is_client.update_identity(
+            mom_identity['id'], data=mom_identity)
+
+    return operator, mom_identity
+
+
 class HTTPRetryMixin(object):
     """
     A mixin for exponential delay retries on retriable http errors
@@ -87,125 +195,6 @@ class ValidateSubscribe(Task):
     name = "ndoh_hub.registrations.tasks.validate_subscribe"
     log = get_task_logger(__name__)
 
-    # Validation checks
-    def check_lang(self, data_fields, registration):
-        if "language" not in data_fields:
-            return ["Language is missing from data"]
-        elif not utils.is_valid_lang(registration.data["language"]):
-            return ["Language not a valid option"]
-        else:
-            return []
-
-    def check_mom_dob(self, data_fields, registration):
-        if "mom_dob" not in data_fields:
-            return ["Mother DOB missing"]
-        elif not utils.is_valid_date(registration.data["mom_dob"]):
-            return ["Mother DOB invalid"]
-        else:
-            return []
-
-    def check_edd(self, data_fields, registration):
-        if "edd" not in data_fields:
-            return ["Estimated Due Date missing"]
-        elif not utils.is_valid_edd(registration.data["edd"]):
-            return ["Estimated Due Date invalid"]
-        else:
-            return []
-
-    def check_baby_dob(self, data_fields, registration):
-        if "baby_dob" not in data_fields:
-            return ["Baby Date of Birth missing"]
-        elif not utils.is_valid_date(registration.data["baby_dob"]):
-            return ["Baby Date of Birth invalid"]
-        elif utils.get_baby_age(utils.get_today(),
-                                registration.data["baby_dob"]) < 0:
-            return ["Baby Date of Birth cannot be in the future"]
-        else:
-            return []
-
-    def check_operator_id(self, data_fields, registration):
-        if "operator_id" not in data_fields:
-            return ["Operator ID missing"]
-        elif not utils.is_valid_uuid(registration.data["operator_id"]):
-            return ["Operator ID invalid"]
-        else:
-            return []
-
-    def check_msisdn_registrant(self, data_fields, registration):
-        if "msisdn_registrant" not in data_fields:
-            return ["MSISDN of Registrant missing"]
-        elif not utils.is_valid_msisdn(registration.data["msisdn_registrant"]):
-            return ["MSISDN of Registrant invalid"]
-        else:
-            return []
-
-    def check_msisdn_device(self, data_fields, registration):
-        if "msisdn_device" not in data_fields:
-            return ["MSISDN of device missing"]
-        elif not utils.is_valid_msisdn(registration.data["msisdn_device"]):
-            return ["MSISDN of device invalid"]
-        else:
-            return []
-
-    def check_faccode(self, data_fields, registration):
-        if "faccode" not in data_fields:
-            return ["Facility (clinic) code missing"]
-        elif not utils.is_valid_faccode(registration.data["faccode"]):
-            return ["Facility code invalid"]
-        else:
-            return []
-
-    def check_consent(self, data_fields, registration):
-        if "consent" not in data_fields:
-            return ["Consent is missing"]
-        elif registration.data["consent"] is not True:
-            return ["Cannot continue without consent"]
-        else:
-            return []
-
-    def check_sa_id_no(self, data_fields, registration):
-        if "sa_id_no" not in data_fields:
-            return ["SA ID number missing"]
-        elif not utils.is_valid_sa_id_no(registration.data["sa_id_no"]):
-            return ["SA ID number invalid"]
-        else:
-            return []
-
-    def check_passport_no(self, data_fields, registration):
-        if "passport_no" not in data_fields:
-            return ["Passport number missing"]
-        elif not utils.is_valid_passport_no(registration.data["passport_no"]):
-            return ["Passport number invalid"]
-        else:
-            return []
-
-    def check_passport_origin(self, data_fields, registration):
-        if "passport_origin" not in data_fields:
-            return ["Passport origin missing"]
-        elif not utils.is_valid_passport_origin(
-          registration.data["passport_origin"]):
-            return ["Passport origin invalid"]
-        else:
-            return []
-
-    def check_id(self, data_fields, registration):
-        if "id_type" not in data_fields:
-            return ["ID type missing"]
-        elif not utils.is_valid_id_type(registration.data['id_type']):
-            return ["ID type should be one of {}".format(utils.ID_TYPES)]
-        else:
-            id_errors = []
-            if registration.data["id_type"] == "sa_id":
-                id_errors += self.check_sa_id_no(data_fields, registration)
-                id_errors += self.check_mom_dob(data_fields, registration)
-            elif registration.data["id_type"] == "passport":
-                id_errors += self.check_passport_no(data_fields, registration)
-                id_errors += self.check_passport_origin(
-                    data_fields, registration)
-            elif registration.data["id_type"] == "none":
-                id_errors += self.check_mom_dob(data_fields, registration)
-            return id_errors
-
     # Validate
     def validate(self, registration):
         """ Validates that all the required info is provided for a
@@ -213,72 +202,8 @@ class ValidateSubscribe(Task):
         """
         self.log.info("Starting registration validation")
 
-        validation_errors = []
-
-        # Check if registrant_id is a valid UUID
-        if not utils.is_valid_uuid(registration.registrant_id):
-            validation_errors += ["Invalid UUID registrant_id"]
-
-        # Check that required fields are provided and valid
-        data_fields = registration.data.keys()
-
-        if "pmtct_prebirth" in registration.reg_type:
-            validation_errors += self.check_lang(data_fields, registration)
-            validation_errors += self.check_mom_dob(data_fields, registration)
-            validation_errors += self.check_edd(data_fields, registration)
-            validation_errors += self.check_operator_id(
-                data_fields, registration)
-
-        elif "pmtct_postbirth" in registration.reg_type:
-            validation_errors += self.check_lang(data_fields, registration)
-            validation_errors += self.check_mom_dob(data_fields, registration)
-            validation_errors += self.check_baby_dob(data_fields, registration)
-            validation_errors += self.check_operator_id(
-                data_fields, registration)
-
-        elif 'nurseconnect' in registration.reg_type:
-            validation_errors += self.check_faccode(
-                data_fields, registration)
-            validation_errors += self.check_operator_id(
-                data_fields, registration)
-            validation_errors += self.check_msisdn_registrant(
-                data_fields, registration)
-            validation_errors += self.check_msisdn_device(
-                data_fields, registration)
-            validation_errors += self.check_lang(
-                data_fields, registration)
-
-        elif registration.reg_type in [
-                "momconnect_prebirth", "whatsapp_prebirth"]:
-            # Checks that apply to clinic, chw, public
-            validation_errors += self.check_operator_id(
-                data_fields, registration)
-            validation_errors += self.check_msisdn_registrant(
-                data_fields, registration)
-            validation_errors += self.check_msisdn_device(
-                data_fields, registration)
-            validation_errors += self.check_lang(
-                data_fields, registration)
-            validation_errors += self.check_consent(
-                data_fields, registration)
-
-            # Checks that apply to clinic, chw
-            if registration.source.authority in ["hw_full", "hw_partial"]:
-                validation_errors += self.check_id(
-                    data_fields, registration)
-
-            # Checks that apply to clinic only
-            if registration.source.authority == "hw_full":
-                validation_errors += self.check_edd(
-                    data_fields, registration)
-                validation_errors += self.check_faccode(
-                    data_fields, registration)
-
-        elif registration.reg_type == "momconnect_postbirth":
-            validation_errors.append("Momconnect postbirth not yet supported")
-
-        elif registration.reg_type == "loss_general":
-            validation_errors.append("Loss general not yet supported")
+        validation_errors = get_messages(
+            registration_schema.validate(registration))
 
         # Evaluate if there were any problems, save and return
         if len(validation_errors) == 0:
@@ -349,16 +274,11 @@ class ValidateSubscribe(Task):
             weeks = utils.get_baby_age(utils.get_today(),
                                        registration.data["baby_dob"])
 
-        # . determine messageset shortname
-        self.log.info("Determining messageset shortname")
-        short_name = utils.get_messageset_short_name(
-            registration.reg_type, registration.source.authority, weeks)
-
-        # . determine sbm details
+        # . determine messageset and sbm details
         self.log.info("Determining SBM details")
         msgset_id, msgset_schedule, next_sequence_number =\
-            utils.get_messageset_schedule_sequence(
-                short_name, weeks)
+            messagesets.get_messageset_schedule_sequence(
+                registration.reg_type, registration.source.authority, weeks)
 
         subscription = {
             "identity": registration.registrant_id,
@@ -408,6 +328,11 @@ class ValidateSubscribe(Task):
         is_client.update_identity(
             registration.registrant_id, {"details": details})
 
+        # Kept on the registration for the registration statistics, after the
+        # personally identifiable fields that it is calculated from are removed
+        registration.data["risk_status"] = risk
+        registration.save(update_fields=("data", "updated_at"))
+
         self.log.info("Identity updated with risk level")
         return risk
 
@@ -425,6 +350,11 @@ class ValidateSubscribe(Task):
             # We do this validation in it's own task
             return
 
+        if 'identity_resolution' in registration.data:
+            # The identities are still being resolved. That task will call
+            # this one once the registration has a registrant
+            return
+
         reg_validates = self.validate(registration)
         if reg_validates:
             self.create_subscriptionrequests(registration)
@@ -457,6 +387,16 @@ class ValidateSubscribe(Task):
 validate_subscribe = ValidateSubscribe()
 
 
+@app.task(name='ndoh_hub.registrations.tasks.update_registration_statistics')
+def update_registration_statistics():
+    """
+    Updates the registration statistics for the registrations written since
+    the last update. Should be scheduled to run periodically.
+    """
+    from .statistics import update_registration_statistics
+    update_registration_statistics()
+
+
 @app.task()
 def remove_personally_identifiable_fields(registration_id):
     """
@@ -666,7 +606,7 @@ class ValidateSubscribeJembiAppRegistration(HTTPRetryMixin, ValidateSubscribe):
         """
         Returns whether or not the number is recognised on wassup
         """
-        r = requests.post(
+        r = utils.http_session.post(
             settings.WASSUP_URL,
             json={
                 'number': settings.WASSUP_NUMBER,
@@ -723,9 +663,9 @@ class ValidateSubscribeJembiAppRegistration(HTTPRetryMixin, ValidateSubscribe):
         """
         Checks to see if the specified clinic code is recognised or not
         """
-        r = requests.get(
+        r = utils.http_session.get(
             urljoin(settings.JEMBI_BASE_URL, 'facilityCheck'),
-            {
+            params={
                 'criteria': "code:{}".format(code),
             },
             auth=(settings.JEMBI_USERNAME, settings.JEMBI_PASSWORD),
@@ -816,6 +756,54 @@ validate_subscribe_jembi_app_registration = (
     ValidateSubscribeJembiAppRegistration())
 
 
+class ResolveThirdPartyRegistrationIdentities(HTTPRetryMixin, Task):
+    """
+    Resolves the identities for a third party registration that was accepted
+    asynchronously, and then validates the registration
+    """
+    name = (
+        "ndoh_hub.registrations.tasks."
+        "resolve_third_party_registration_identities")
+    log = get_task_logger(__name__)
+
+    def run(self, registration_id, **kwargs):
+        registration = Registration.objects.get(id=registration_id)
+        resolution = registration.data.get('identity_resolution')
+        if resolution is None or resolution['status'] != 'pending':
+            self.log.info(
+                "Identities for registration %s already resolved",
+                registration_id)
+            return
+
+        operator, mom_identity = resolve_third_party_identities(
+            is_client, registration.data, resolution['authority'])
+
+        del registration.data['identity_resolution']
+        registration.data['operator_id'] = operator
+        registration.registrant_id = mom_identity['id']
+        registration.save()
+
+        validate_subscribe.delay(registration_id=str(registration.pk))
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        super(ResolveThirdPartyRegistrationIdentities, self).on_failure(
+            exc, task_id, args, kwargs, einfo)
+        registration_id = kwargs.get('registration_id', None) or args[0]
+        registration = Registration.objects.get(id=registration_id)
+        registration.data.setdefault(
+            'identity_resolution', {})['status'] = 'failed'
+        registration.data['error_data'] = {
+            'type': einfo.type.__name__,
+            'message': str(exc),
+            'traceback': einfo.traceback,
+        }
+        registration.save()
+
+
+resolve_third_party_registration_identities = (
+    ResolveThirdPartyRegistrationIdentities())
+
+
 class BasePushRegistrationToJembi(object):
     """
     Base class that contains helper functions for pushing registration data
@@ -893,7 +881,7 @@ class BasePushRegistrationToJembi(object):
 
         json_doc = self.build_jembi_json(registration)
         try:
-            result = requests.post(
+            result = utils.http_session.post(
                 self.URL,
                 headers={'Content-Type': 'application/json'},
                 data=json.dumps(json_doc),
@@ -1118,7 +1106,7 @@ class DeliverHook(Task):
         instance_id:   a possibly None "trigger" instance ID
         hook_id:       the ID of defining Hook object
         """
-        requests.post(
+        utils.http_session.post(
             url=target,
             data=json.dumps(payload),
             headers={
@@ -1143,7 +1131,8 @@ def deliver_hook_wrapper(target, payload, instance, hook):
 
 class HTTPRequestWithRetries(HTTPRetryMixin, Task):
     def run(self, method, url, headers, payload):
-        r = requests.request(method, url, headers=headers, json=payload)
+        r = utils.http_session.request(
+            method, url, headers=headers, json=payload)
         r.raise_for_status()
         return r.text
 
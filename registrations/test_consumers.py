@@ -291,3 +291,51 @@ async def test_status_valid() -> None:
     await communicator.disconnect()
     await cleanup_user(user)
     await cleanup_registration(reg)
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_status_multiple() -> None:
+    """
+    If multiple IDs are given, the status of each registration should be
+    returned, in the order they were requested
+    """
+    user1 = await create_user('test1')
+    user2 = await create_user('test2')
+    communicator = await create_communicator(user1)
+    reg1 = await create_registration(user1, 'test-external')
+    reg2 = await create_registration(user1)
+    reg3 = await create_registration(user2)
+
+    await communicator.send_json_to({
+        'action': 'status',
+        'data': {
+            'ids': ['test-external', str(reg2.id), str(reg3.id), 'bad-id'],
+        },
+    })
+
+    assert await communicator.receive_json_from() == reg1.status
+    assert await communicator.receive_json_from() == reg2.status
+    res = await communicator.receive_json_from()
+    assert res['registration_id'] == str(reg3.id)
+    assert res['error'] == {
+        'id': 'You do not have permission to view this registration',
+    }
+    res = await communicator.receive_json_from()
+    assert res == {
+        'registration_id': 'bad-id',
+        'registration_data': {
+            'id': 'bad-id',
+        },
+        'status': 'validation_failed',
+        'error': {
+            'id': 'Cannot find registration with ID bad-id',
+        },
+    }
+
+    await communicator.disconnect()
+    await cleanup_registration(reg1)
+    await cleanup_registration(reg2)
+    await cleanup_registration(reg3)
+    await cleanup_user(user1)
+    await cleanup_user(user2)
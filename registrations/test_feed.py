@@ -0,0 +1,164 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from changes.models import Change
+from registrations import feed
+from registrations.models import (
+    FeedEvent, Registration, Source, SubscriptionRequest)
+
+
+# Events are only sequenced once their transaction has committed, so these
+# tests can't run inside a transaction. bulk_create is used to skip the post
+# save hooks, the triggers record the writes regardless.
+class FeedTests(TransactionTestCase):
+    serialized_rollback = True
+
+    @classmethod
+    def tearDownClass(cls):
+        # The database is emptied after each test, so restore the data from
+        # the migrations for the tests that run after these
+        connection.creation.deserialize_db_from_string(
+            connection._test_serialized_contents)
+        super(FeedTests, cls).tearDownClass()
+
+    def setUp(self):
+        # Tests on other connections, eg. the consumer tests, can leave
+        # events behind
+        FeedEvent.objects.all().delete()
+        self.user = User.objects.create_user('test')
+        self.source = Source.objects.create(
+            name='test', user=self.user, authority='hw_full')
+
+    def test_writes_recorded(self):
+        """
+        Creates, updates and deletes of registrations, changes and
+        subscription requests should be recorded in order
+        """
+        [reg] = Registration.objects.bulk_create([Registration(
+            source=self.source, reg_type='nurseconnect', data={'foo': 'bar'})])
+        Registration.objects.filter(pk=reg.pk).update(validated=True)
+        [change] = Change.objects.bulk_create([Change(
+            source=self.source, action='nurse_optout', data={})])
+        [subreq] = SubscriptionRequest.objects.bulk_create([
+            SubscriptionRequest(identity='identity', messageset=1, lang='eng')
+        ])
+        Registration.objects.filter(pk=reg.pk).delete()
+
+        self.assertEqual(feed.sequence_events(), 5)
+        events = feed.get_events()
+        self.assertEqual(
+            [(e.sequence, e.model, e.object_id, e.action) for e in events], [
+                (1, 'registration', str(reg.pk), 'created'),
+                (2, 'registration', str(reg.pk), 'updated'),
+                (3, 'change', str(change.pk), 'created'),
+                (4, 'subscriptionrequest', str(subreq.pk), 'created'),
+                (5, 'registration', str(reg.pk), 'deleted'),
+            ])
+        # The registration has been deleted, so it has no data
+        self.assertIsNone(events[0].data)
+        self.assertIsNone(events[4].data)
+        self.assertEqual(events[2].data['action'], 'nurse_optout')
+        self.assertEqual(events[3].data['identity'], 'identity')
+
+        self.assertEqual(
+            [e.sequence for e in feed.get_events(after=2, limit=2)], [3, 4])
+        self.assertEqual(
+            [e.sequence for e in feed.get_events(models=['change'])], [3])
+
+    def test_current_data(self):
+        """
+        The events should have the current data of the row, so that removed
+        fields aren't kept in the feed
+        """
+        [reg] = Registration.objects.bulk_create([Registration(
+            source=self.source, reg_type='nurseconnect',
+            data={'foo': 'bar', 'sa_id_no': '8606045069081'})])
+        Registration.objects.filter(pk=reg.pk).update(
+            data={'foo': 'bar'}, validated=True)
+
+        feed.sequence_events()
+        events = feed.get_events()
+        self.assertEqual(len(events), 2)
+        for event in events:
+            self.assertEqual(event.data['data'], {'foo': 'bar'})
+            self.assertEqual(event.data['validated'], True)
+            self.assertEqual(event.data['source_id'], self.source.pk)
+        self.assertEqual(
+            list(FeedEvent.objects.values_list('object_id', flat=True)),
+            [str(reg.pk)] * 2)
+
+    def test_prune_events(self):
+        """
+        Sequenced events older than the given age should be deleted, except
+        for the latest event
+        """
+        Registration.objects.bulk_create([
+            Registration(source=self.source, data={}) for _ in range(3)])
+        feed.sequence_events()
+        FeedEvent.objects.update(
+            created_at=timezone.now() - datetime.timedelta(days=40))
+        Registration.objects.bulk_create([
+            Registration(source=self.source, data={})])
+
+        self.assertEqual(feed.prune_events(datetime.timedelta(days=30)), 2)
+        self.assertEqual(
+            list(FeedEvent.objects.order_by('id').values_list(
+                'sequence', flat=True)),
+            [3, None])
+
+        feed.sequence_events()
+        self.assertEqual(
+            [e.sequence for e in feed.get_events()], [3, 4])
+
+    def test_uncommitted_not_sequenced(self):
+        """
+        Events should only be added to the feed once their transaction has
+        committed
+        """
+        with transaction.atomic():
+            Registration.objects.bulk_create([
+                Registration(source=self.source, data={})])
+            self.assertEqual(feed.sequence_events(), 0)
+        self.assertEqual(FeedEvent.objects.get().sequence, None)
+
+        self.assertEqual(feed.sequence_events(), 1)
+        self.assertEqual(FeedEvent.objects.get().sequence, 1)
+        self.assertEqual(feed.sequence_events(), 0)
+
+    @override_settings(FEED_PAGE_SIZE=1, FEED_LONG_POLL_TIMEOUT=0)
+    def test_feed_view(self):
+        """
+        The view should return the events after `after`, and the URL for the
+        next events
+        """
+        client = APIClient()
+        url = '/api/v1/feed/'
+        self.assertEqual(client.get(url).status_code, 401)
+
+        client.force_authenticate(self.user)
+        Registration.objects.bulk_create([
+            Registration(source=self.source, data={}) for _ in range(2)])
+
+        body = client.get(url, {'timeout': 10}).json()
+        self.assertEqual(
+            [e['sequence'] for e in body['results']], [1])
+        self.assertEqual(body['results'][0]['action'], 'created')
+        self.assertEqual(
+            body['next'], 'http://testserver/api/v1/feed/?after=1&timeout=10')
+
+        body = client.get(body['next']).json()
+        self.assertEqual(
+            [e['sequence'] for e in body['results']], [2])
+
+        body = client.get(body['next']).json()
+        self.assertEqual(body['results'], [])
+        self.assertEqual(
+            body['next'], 'http://testserver/api/v1/feed/?after=2&timeout=10')
+
+        response = client.get(url, {'model': 'foo'})
+        self.assertEqual(response.status_code, 400)
@@ -1,6 +1,8 @@
+from django.contrib.auth.models import User
 from django.test import TestCase
 
-from registrations.models import Registration
+from registrations.models import Registration, Source, STATUS_DATA_FIELDS
+from registrations.serializers import RegistrationSerializer
 
 
 class RegistrationTests(TestCase):
@@ -54,3 +56,50 @@ class RegistrationTests(TestCase):
         """
         reg = Registration(data={})
         self.assertEqual(reg.status['status'], 'processing')
+
+    def test_get_statuses(self):
+        """
+        The statuses for multiple registrations should match each of their
+        individual statuses
+        """
+        regs = [
+            Registration(external_id='test-external', data={}),
+            Registration(validated=True, data={}),
+        ]
+        self.assertEqual(
+            Registration.get_statuses(regs), [r.status for r in regs])
+
+    def test_registration_data_fields(self):
+        """
+        The status data fields should be the same as the serializer's fields
+        """
+        self.assertEqual(
+            tuple(name for name, _, _ in STATUS_DATA_FIELDS),
+            RegistrationSerializer.Meta.fields)
+
+    def test_registration_data_matches_serializer(self):
+        """
+        The registration data in the status should be the same as the
+        serializer's output
+        """
+        user = User.objects.create_user('test')
+        source = Source.objects.create(
+            name='test', user=user, authority='hw_full')
+        # bulk_create skips the post save hooks
+        [reg] = Registration.objects.bulk_create([Registration(
+            external_id='test-external', reg_type='momconnect_prebirth',
+            registrant_id='mother-id', source=source, created_by=user,
+            data={'test': ['data']})])
+        self.assertEqual(
+            reg.get_registration_data(),
+            RegistrationSerializer(instance=reg).data)
+
+        reg = Registration.objects.get(pk=reg.pk)
+        self.assertEqual(
+            reg.get_registration_data(),
+            RegistrationSerializer(instance=reg).data)
+
+        reg = Registration()
+        self.assertEqual(
+            reg.get_registration_data(),
+            RegistrationSerializer(instance=reg).data)
@@ -0,0 +1,152 @@
+import datetime
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from registrations import positions
+from registrations.models import PositionTracker
+
+
+@override_settings(POSITION_CACHE_TTL=60)
+class GetPositionTests(TestCase):
+    def setUp(self):
+        positions.clear_cache()
+        patcher = mock.patch('registrations.positions.get_redis')
+        self.redis = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.redis.get.return_value = b'1'
+
+    def tearDown(self):
+        positions.clear_cache()
+
+    def test_cached(self):
+        """
+        The position should only be fetched from the database once
+        """
+        PositionTracker.objects.create(label='test', position=3)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(positions.get_position('test'), 3)
+            self.assertEqual(positions.get_position('test'), 3)
+        with self.assertRaises(PositionTracker.DoesNotExist):
+            positions.get_position('missing')
+
+    def test_cleared_on_save(self):
+        """
+        Saving a tracker should clear the cache, so that the change is seen
+        """
+        pt = PositionTracker.objects.create(label='test', position=3)
+        positions.get_position('test')
+
+        pt.position = 5
+        pt.save()
+        self.assertEqual(positions.get_position('test'), 5)
+
+    def test_cleared_on_increment(self):
+        """
+        Incrementing a tracker should clear the cache, so that the new
+        position is seen
+        """
+        PositionTracker.objects.create(label='test', position=3)
+        positions.get_position('test')
+
+        positions.increment_position('test', datetime.timedelta(0))
+        self.assertEqual(positions.get_position('test'), 4)
+        self.redis.incr.assert_called_once_with(positions.VERSION_KEY)
+
+    def test_cleared_on_version(self):
+        """
+        Changing the version should clear the cache, so that changes in other
+        processes are seen
+        """
+        PositionTracker.objects.create(label='test', position=3)
+        positions.get_position('test')
+
+        PositionTracker.objects.filter(label='test').update(position=5)
+        self.assertEqual(positions.get_position('test'), 3)
+        self.redis.get.return_value = b'2'
+        self.assertEqual(positions.get_position('test'), 5)
+
+    @override_settings(POSITION_CACHE_TTL=0)
+    def test_disabled(self):
+        """
+        If the cache is disabled, the position should be read from the
+        database without using Redis
+        """
+        PositionTracker.objects.create(label='test', position=3)
+
+        with self.assertNumQueries(2):
+            self.assertEqual(positions.get_position('test'), 3)
+            self.assertEqual(positions.get_position('test'), 3)
+        self.redis.get.assert_not_called()
+
+
+class IncrementPositionTests(TestCase):
+    def test_increment(self):
+        """
+        The position should be incremented, and the time of the increment
+        recorded
+        """
+        PositionTracker.objects.create(label='test', position=1)
+        before = timezone.now()
+
+        pt = positions.increment_position('test', datetime.timedelta(0))
+        self.assertEqual(pt.position, 2)
+        self.assertGreaterEqual(pt.modified_at, before)
+        self.assertEqual(pt.history.first().position, 2)
+        pt.refresh_from_db()
+        self.assertEqual(pt.position, 2)
+
+    def test_interval(self):
+        """
+        The position should only be incremented if it wasn't modified within
+        the interval
+        """
+        now = timezone.now()
+        PositionTracker.objects.create(label='recent', position=1)
+        PositionTracker.objects.filter(label='recent').update(
+            modified_at=now - datetime.timedelta(hours=11))
+        PositionTracker.objects.create(label='old', position=1)
+        PositionTracker.objects.filter(label='old').update(
+            modified_at=now - datetime.timedelta(hours=13))
+
+        self.assertIsNone(positions.increment_position(
+            'recent', datetime.timedelta(hours=12)))
+        self.assertIsNone(positions.increment_position(
+            'missing', datetime.timedelta(hours=12)))
+        self.assertEqual(positions.increment_position(
+            'old', datetime.timedelta(hours=12)).position, 2)
+        self.assertIsNone(positions.increment_position(
+            'old', datetime.timedelta(hours=12)))
+
+        self.assertEqual(
+            PositionTracker.objects.get(label='recent').position, 1)
+        self.assertEqual(PositionTracker.objects.get(label='old').position, 2)
+
+
+class PruneHistoryTests(TestCase):
+    def test_prune(self):
+        """
+        History older than the given age should be deleted, except for the
+        latest history of each tracker
+        """
+        old = timezone.now() - datetime.timedelta(days=100)
+        pt = PositionTracker.objects.create(label='test', position=1)
+        pt.position = 2
+        pt.save()
+        pt.history.update(history_date=old)
+        pt.position = 3
+        pt.save()
+        unchanged = PositionTracker.objects.create(label='unchanged')
+        unchanged.history.update(history_date=old)
+
+        stdout = StringIO()
+        call_command('prune_position_history', '--days', '90', stdout=stdout)
+        self.assertEqual(
+            stdout.getvalue().strip(), "Deleted 2 history records")
+
+        self.assertEqual([h.position for h in pt.history.all()], [3])
+        self.assertEqual(unchanged.history.count(), 1)
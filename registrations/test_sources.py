@@ -0,0 +1,54 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from registrations import sources
+from registrations.models import Source
+
+
+class GetSourceTests(TestCase):
+    def setUp(self):
+        sources.clear_cache()
+        self.user = User.objects.create_user('test')
+
+    def test_cached(self):
+        """
+        The source should only be fetched from the database once for each
+        user and authority
+        """
+        source = Source.objects.create(
+            name='test', user=self.user, authority='hw_full')
+
+        with self.assertNumQueries(1):
+            self.assertEqual(sources.get_source(self.user.id), source)
+            self.assertEqual(sources.get_source(str(self.user.id)), source)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                sources.get_source(self.user.id, authority='hw_full'), source)
+        with self.assertRaises(Source.DoesNotExist):
+            sources.get_source(self.user.id, authority='patient')
+
+    def test_cleared_on_save(self):
+        """
+        Saving a source should clear the cache, so that the change is seen
+        """
+        source = Source.objects.create(
+            name='test', user=self.user, authority='hw_full')
+        sources.get_source(self.user.id)
+
+        source.name = 'changed'
+        source.save()
+        self.assertEqual(sources.get_source(self.user.id).name, 'changed')
+
+    def test_cleared_on_delete(self):
+        """
+        Deleting a source should clear the cache, so that the source is no
+        longer returned
+        """
+        source = Source.objects.create(
+            name='test', user=self.user, authority='hw_full')
+        sources.get_source(self.user.id)
+
+        source.delete()
+        with self.assertRaises(Source.DoesNotExist):
+            sources.get_source(self.user.id)
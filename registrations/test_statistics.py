@@ -0,0 +1,236 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+import pytz
+import responses
+
+from ndoh_hub import utils_tests
+from registrations.models import (
+    Registration, RegistrationStatistic, RegistrationStatisticRecount, Source,
+    Watermark)
+from registrations.statistics import (
+    WATERMARK, backfill_risk_statuses, get_risk, get_risks,
+    update_registration_statistics)
+from registrations.tasks import get_risk_status
+
+REGISTRANT_ID = 'mother01-63e2-4acc-9b94-26663b9bc267'
+
+
+class GetRiskTests(TestCase):
+    def test_not_pmtct(self):
+        """
+        Only PMTCT registrations have a risk status
+        """
+        self.assertEqual(get_risk('momconnect_prebirth', {}), '')
+
+    def test_stored(self):
+        """
+        The risk status stored on validation should be used
+        """
+        self.assertEqual(
+            get_risk('pmtct_prebirth', {'risk_status': 'normal'}), 'normal')
+
+    def test_calculated(self):
+        """
+        If there's no stored risk status, it should be calculated from the
+        registration data if possible
+        """
+        self.assertEqual(get_risk('pmtct_postbirth', {}), 'high')
+        self.assertEqual(get_risk('pmtct_prebirth', {
+            'mom_dob': '1999-01-27', 'edd': '2016-05-01'}), 'high')
+        self.assertEqual(get_risk('pmtct_prebirth', None), '')
+
+    def test_batch(self):
+        """
+        The batch of risks should be the same as each registration's risk,
+        with '' for the dates that aren't valid
+        """
+        registrations = [
+            ('momconnect_prebirth', {}),
+            ('pmtct_prebirth', {'risk_status': 'normal'}),
+            ('pmtct_postbirth', {}),
+            ('pmtct_prebirth', {'mom_dob': '1999-01-27', 'edd': '2016-05-01'}),
+            ('pmtct_prebirth', None),
+        ]
+        self.assertEqual(
+            get_risks(registrations),
+            [get_risk(*registration) for registration in registrations])
+        self.assertEqual(get_risks([
+            ('pmtct_prebirth', {'mom_dob': '1999-02-30', 'edd': 'unknown'}),
+        ]), [''])
+
+
+@override_settings(REGISTRATION_STATISTICS_OVERLAP=0)
+class UpdateRegistrationStatisticsTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('test')
+        self.source = Source.objects.create(
+            name='test', user=user, authority='hw_full')
+
+    def create_registrations(self, count, created_at, **kwargs):
+        """
+        Creates the registrations without running the post save hooks
+        """
+        kwargs.setdefault('reg_type', 'momconnect_prebirth')
+        kwargs.setdefault('data', {})
+        registrations = Registration.objects.bulk_create(
+            Registration(source=self.source, **kwargs) for _ in range(count))
+        Registration.objects.filter(pk__in=[r.pk for r in registrations])\
+            .update(created_at=created_at)
+        return registrations
+
+    def get_statistics(self):
+        return sorted(
+            RegistrationStatistic.objects.values_list(
+                'date', 'reg_type', 'validated', 'risk', 'count'))
+
+    def test_counts(self):
+        """
+        The registrations should be counted per day, registration type,
+        validation and risk status
+        """
+        day1 = datetime.datetime(2018, 5, 1, 23, 59, tzinfo=pytz.UTC)
+        day2 = datetime.datetime(2018, 5, 2, tzinfo=pytz.UTC)
+        self.create_registrations(2, day1)
+        self.create_registrations(1, day1, validated=True)
+        self.create_registrations(1, day2, validated=True)
+        self.create_registrations(
+            2, day2, reg_type='pmtct_prebirth', validated=True,
+            data={'risk_status': 'normal'})
+        self.create_registrations(
+            1, day2, reg_type='pmtct_postbirth', validated=True)
+
+        update_registration_statistics()
+
+        self.assertEqual(self.get_statistics(), [
+            (day1.date(), 'momconnect_prebirth', False, '', 2),
+            (day1.date(), 'momconnect_prebirth', True, '', 1),
+            (day2.date(), 'momconnect_prebirth', True, '', 1),
+            (day2.date(), 'pmtct_postbirth', True, 'high', 1),
+            (day2.date(), 'pmtct_prebirth', True, 'normal', 2),
+        ])
+
+    def test_incremental(self):
+        """
+        Only the days with registrations that were written since the last
+        update should be recounted
+        """
+        day1 = datetime.datetime(2018, 5, 1, tzinfo=pytz.UTC)
+        day2 = datetime.datetime(2018, 5, 2, tzinfo=pytz.UTC)
+        [reg] = self.create_registrations(1, day1)
+        update_registration_statistics()
+        self.assertEqual(self.get_statistics(), [
+            (day1.date(), 'momconnect_prebirth', False, '', 1)])
+
+        # Changes to the statistics for days that weren't written to since
+        # the last update should be left alone
+        RegistrationStatistic.objects.update(count=5)
+        Registration.objects.update(
+            updated_at=datetime.datetime(2018, 1, 1, tzinfo=pytz.UTC))
+        self.create_registrations(1, day2)
+        update_registration_statistics()
+        self.assertEqual(self.get_statistics(), [
+            (day1.date(), 'momconnect_prebirth', False, '', 5),
+            (day2.date(), 'momconnect_prebirth', False, '', 1),
+        ])
+
+        # Registrations that are updated should be moved to their new counts
+        reg.refresh_from_db()
+        reg.validated = True
+        reg.save()
+        update_registration_statistics()
+        self.assertEqual(self.get_statistics(), [
+            (day1.date(), 'momconnect_prebirth', True, '', 1),
+            (day2.date(), 'momconnect_prebirth', False, '', 1),
+        ])
+
+    def test_deleted(self):
+        """
+        The days of registrations that are deleted should be recounted
+        """
+        day1 = datetime.datetime(2018, 5, 1, tzinfo=pytz.UTC)
+        day2 = datetime.datetime(2018, 5, 2, tzinfo=pytz.UTC)
+        [reg, _] = self.create_registrations(2, day1)
+        self.create_registrations(1, day2)
+        update_registration_statistics()
+        Registration.objects.update(
+            updated_at=datetime.datetime(2018, 1, 1, tzinfo=pytz.UTC))
+
+        Registration.objects.filter(pk=reg.pk).delete()
+        update_registration_statistics()
+        self.assertEqual(self.get_statistics(), [
+            (day1.date(), 'momconnect_prebirth', False, '', 1),
+            (day2.date(), 'momconnect_prebirth', False, '', 1),
+        ])
+        self.assertFalse(RegistrationStatisticRecount.objects.exists())
+
+    def test_rebuild(self):
+        """
+        A rebuild should recount all the registrations
+        """
+        day1 = datetime.datetime(2018, 5, 1, tzinfo=pytz.UTC)
+        self.create_registrations(1, day1)
+        update_registration_statistics()
+        RegistrationStatistic.objects.update(count=5)
+        Watermark.objects.filter(name=WATERMARK).update(
+            timestamp=datetime.datetime(2100, 1, 1, tzinfo=pytz.UTC))
+
+        update_registration_statistics()
+        self.assertEqual(self.get_statistics(), [
+            (day1.date(), 'momconnect_prebirth', False, '', 5)])
+
+        update_registration_statistics(rebuild=True)
+        self.assertEqual(self.get_statistics(), [
+            (day1.date(), 'momconnect_prebirth', False, '', 1)])
+
+
+class BackfillRiskStatusTests(TestCase):
+    @responses.activate
+    def test_backfill(self):
+        """
+        The risk status should be stored on the validated prebirth
+        registrations that don't have it, from the fields on the identity,
+        without saving those fields
+        """
+        utils_tests.mock_get_identity_by_id(REGISTRANT_ID, {
+            'mom_dob': '1999-01-27'})
+        source = Source.objects.create(
+            name='test', user=User.objects.create_user('test'),
+            authority='hw_full')
+        missing, unknown, stored, unvalidated = (
+            Registration.objects.bulk_create([
+                Registration(
+                    source=source, reg_type='pmtct_prebirth', validated=True,
+                    registrant_id=REGISTRANT_ID, data={'edd': '2016-05-01'}),
+                Registration(
+                    source=source, reg_type='pmtct_prebirth', validated=True,
+                    registrant_id=REGISTRANT_ID, data={}),
+                Registration(
+                    source=source, reg_type='pmtct_prebirth', validated=True,
+                    registrant_id=REGISTRANT_ID,
+                    data={'edd': '2016-05-01', 'risk_status': 'normal'}),
+                Registration(
+                    source=source, reg_type='pmtct_prebirth', validated=False,
+                    registrant_id=REGISTRANT_ID, data={'edd': '2016-05-01'}),
+            ]))
+
+        self.assertEqual(backfill_risk_statuses(), 2)
+
+        missing.refresh_from_db()
+        self.assertEqual(missing.data, {
+            'edd': '2016-05-01',
+            'risk_status': get_risk_status(
+                'pmtct_prebirth', '1999-01-27', '2016-05-01'),
+        })
+        # The risk can't be calculated without the edd, so it's stored as
+        # unknown, and not looked up again
+        unknown.refresh_from_db()
+        self.assertEqual(unknown.data, {'risk_status': ''})
+        stored.refresh_from_db()
+        self.assertEqual(stored.data['risk_status'], 'normal')
+        unvalidated.refresh_from_db()
+        self.assertNotIn('risk_status', unvalidated.data)
+        self.assertEqual(len(responses.calls), 2)
+
+        self.assertEqual(backfill_risk_statuses(), 0)
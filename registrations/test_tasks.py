@@ -10,7 +10,8 @@ from registrations.serializers import RegistrationSerializer
 from registrations.signals import (
     psh_fire_created_metric, psh_validate_subscribe)
 from registrations.tasks import (
-    validate_subscribe_jembi_app_registration as task)
+    validate_subscribe_jembi_app_registration as task,
+    resolve_third_party_registration_identities)
 
 
 class ValidateSubscribeJembiAppRegistrationsTests(TestCase):
@@ -913,3 +914,138 @@ class ValidateSubscribeJembiAppRegistrationsTests(TestCase):
             'status': 'succeeded',
         })
         pmtct.assert_called_with(reg, {'id': "mother-id"})
+
+
+class ResolveThirdPartyRegistrationIdentitiesTests(TestCase):
+    def setUp(self):
+        post_save.disconnect(
+            receiver=psh_validate_subscribe, sender=Registration,
+            dispatch_uid='psh_validate_subscribe')
+        post_save.disconnect(
+            receiver=psh_fire_created_metric, sender=Registration,
+            dispatch_uid='psh_fire_created_metric')
+
+    def tearDown(self):
+        post_save.connect(psh_validate_subscribe, sender=Registration,
+                          dispatch_uid='psh_validate_subscribe')
+        post_save.connect(psh_fire_created_metric, sender=Registration,
+                          dispatch_uid='psh_fire_created_metric')
+
+    def make_registration(self):
+        user = User.objects.create_user('test', 'test@example.org', 'test')
+        source = Source.objects.create(
+            name='testsource', user=user, authority='hw_partial')
+        return Registration.objects.create(
+            reg_type='momconnect_prebirth', source=source, data={
+                'operator_id': None,
+                'msisdn_registrant': '+27820000000',
+                'msisdn_device': '+27821111111',
+                'id_type': 'sa_id',
+                'sa_id_no': '8108015001051',
+                'language': 'eng_ZA',
+                'mom_dob': '1981-08-01',
+                'edd': '2016-11-05',
+                'faccode': '123456',
+                'consent': True,
+                'identity_resolution': {
+                    'status': 'pending',
+                    'authority': 'chw',
+                },
+            })
+
+    @mock.patch('registrations.tasks.validate_subscribe.delay')
+    @responses.activate
+    def test_resolves_identities(self, validate):
+        """
+        The health care worker's identity should be created if it doesn't
+        exist, the mother's identity should be updated with the registration
+        details, and the registration should then be validated
+        """
+        reg = self.make_registration()
+        responses.add(
+            responses.GET,
+            'http://is/api/v1/identities/search/'
+            '?details__addresses__msisdn=%2B27821111111',
+            json={'results': []}, status=200, match_querystring=True)
+        responses.add(
+            responses.POST, 'http://is/api/v1/identities/',
+            json={'id': 'operator-id'})
+        responses.add(
+            responses.GET,
+            'http://is/api/v1/identities/search/'
+            '?details__addresses__msisdn=%2B27820000000',
+            json={'results': [{'id': 'mother-id', 'details': {}}]},
+            status=200, match_querystring=True)
+        responses.add(
+            responses.PATCH, 'http://is/api/v1/identities/mother-id/',
+            json={'id': 'mother-id'})
+
+        resolve_third_party_registration_identities(str(reg.pk))
+
+        reg.refresh_from_db()
+        self.assertEqual(reg.registrant_id, 'mother-id')
+        self.assertEqual(reg.data['operator_id'], 'operator-id')
+        self.assertNotIn('identity_resolution', reg.data)
+        validate.assert_called_once_with(registration_id=str(reg.pk))
+
+        [update] = [
+            c for c in responses.calls if c.request.method == 'PATCH']
+        details = json.loads(update.request.body)['details']
+        self.assertEqual(details['operator_id'], 'operator-id')
+        self.assertEqual(details['last_mc_reg_on'], 'chw')
+        self.assertEqual(details['sa_id_no'], '8108015001051')
+
+    @mock.patch('registrations.tasks.validate_subscribe.delay')
+    def test_already_resolved(self, validate):
+        """
+        If the identities have already been resolved, the task should do
+        nothing
+        """
+        reg = self.make_registration()
+        del reg.data['identity_resolution']
+        reg.save()
+
+        resolve_third_party_registration_identities(str(reg.pk))
+        validate.assert_not_called()
+
+    @responses.activate
+    def test_failure(self):
+        """
+        If resolving the identities fails, the error should be stored on the
+        registration so that it shows in the registration's status
+        """
+        reg = self.make_registration()
+        responses.add(
+            responses.GET, 'http://is/api/v1/identities/search/', status=400)
+
+        resolve_third_party_registration_identities.apply(
+            kwargs={'registration_id': str(reg.pk)})
+
+        reg.refresh_from_db()
+        self.assertEqual(reg.data['identity_resolution']['status'], 'failed')
+        self.assertEqual(reg.status['status'], 'failed')
+
+    @mock.patch('registrations.tasks.validate_subscribe.delay')
+    @responses.activate
+    def test_failure_after_resolved(self, validate):
+        """
+        If the task fails after the identities were resolved, the original
+        error should still be stored on the registration
+        """
+        reg = self.make_registration()
+        responses.add(
+            responses.GET, 'http://is/api/v1/identities/search/',
+            json={'results': [{'id': 'identity-id', 'details': {}}]},
+            status=200)
+        responses.add(
+            responses.PATCH, 'http://is/api/v1/identities/identity-id/',
+            json={'id': 'identity-id'})
+        validate.side_effect = Exception("Broker unavailable")
+
+        resolve_third_party_registration_identities.apply(
+            kwargs={'registration_id': str(reg.pk)})
+
+        reg.refresh_from_db()
+        self.assertEqual(reg.data['identity_resolution']['status'], 'failed')
+        self.assertEqual(
+            reg.data['error_data']['message'], "Broker unavailable")
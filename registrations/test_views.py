@@ -1,6 +1,8 @@
+import csv
 import datetime
 from django.contrib.auth.models import Permission
 from django.urls import reverse
+from django.utils import timezone
 import json
 from unittest import mock
 import pytz
@@ -115,6 +117,226 @@ class JembiAppRegistrationStatusViewTests(AuthenticatedAPITestCase):
         self.assertEqual(response.status_code, 403)
 
 
+class JembiAppRegistrationBatchStatusViewTests(AuthenticatedAPITestCase):
+    url = '/api/v1/jembiregistration/status/'
+
+    def test_authentication_required(self):
+        """
+        Authentication must be provided in order to access the endpoint
+        """
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 401)
+
+    def test_external_id_required(self):
+        """
+        If no external IDs are given, a 400 error should be returned
+        """
+        response = self.normalclient.get(self.url)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(), {'external_id': ["This field is required."]})
+
+    def test_batch_status(self):
+        """
+        The statuses of the user's registrations with the given external IDs
+        should be returned, a page at a time
+        """
+        source = self.make_source_normaluser()
+        regs = [
+            Registration.objects.create(
+                external_id='test-{}'.format(i), source=source,
+                created_by=self.normaluser, data={})
+            for i in range(3)]
+        Registration.objects.create(
+            external_id='test-other', source=source,
+            created_by=self.adminuser, data={})
+
+        response = self.normalclient.get(
+            '{}?external_id=test-0,test-1,test-other,test-missing'
+            '&external_id=test-2'.format(self.url))
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        # PAGE_SIZE is 2 for tests
+        self.assertEqual(
+            [r['registration_id'] for r in body['results']],
+            ['test-2', 'test-1'])
+        self.assertEqual(body['results'][0], regs[2].status)
+
+        response = self.normalclient.get(body['next'])
+        body = response.json()
+        self.assertEqual(
+            [r['registration_id'] for r in body['results']], ['test-0'])
+        self.assertIsNone(body['next'])
+
+
+class RegistrationExportViewTests(AuthenticatedAPITestCase):
+    url = '/api/v1/registrations/export/'
+
+    def get_rows(self, response):
+        content = b''.join(response.streaming_content).decode()
+        return [json.loads(line) for line in content.splitlines()]
+
+    def test_authentication_required(self):
+        """
+        Authentication must be provided in order to access the endpoint
+        """
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 401)
+
+    def test_export_ndjson(self):
+        """
+        All the registrations should be streamed as NDJSON, in order of when
+        they were last updated, with the same fields as the registrations
+        endpoint
+        """
+        source = self.make_source_normaluser()
+        reg1 = Registration.objects.create(
+            source=source, reg_type='momconnect_prebirth', data={'foo': 1})
+        reg2 = Registration.objects.create(
+            source=source, reg_type='nurseconnect', data={})
+        reg1.save()
+
+        response = self.adminclient.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(self.get_rows(response), [
+            RegistrationSerializer(reg2).data,
+            RegistrationSerializer(reg1).data,
+        ])
+
+    def test_export_filtered(self):
+        """
+        The same filters as the registrations endpoint should apply
+        """
+        source = self.make_source_normaluser()
+        Registration.objects.create(
+            source=source, reg_type='momconnect_prebirth', data={})
+        reg = Registration.objects.create(
+            source=source, reg_type='nurseconnect', data={})
+
+        response = self.adminclient.get(
+            '{}?reg_type=nurseconnect'.format(self.url))
+        self.assertEqual(
+            [r['id'] for r in self.get_rows(response)], [str(reg.pk)])
+
+    def test_export_since(self):
+        """
+        Only registrations updated at or after `since`, or within the overlap
+        before it, should be returned
+        """
+        source = self.make_source_normaluser()
+        old = Registration.objects.create(source=source, data={})
+        late = Registration.objects.create(source=source, data={})
+        new = Registration.objects.create(source=source, data={})
+        Registration.objects.filter(pk=old.pk).update(
+            updated_at=datetime.datetime(2018, 1, 1, tzinfo=pytz.UTC))
+        Registration.objects.filter(pk=late.pk).update(
+            updated_at=datetime.datetime(2018, 1, 31, 23, 58, tzinfo=pytz.UTC))
+        Registration.objects.filter(pk=new.pk).update(
+            updated_at=datetime.datetime(2018, 2, 1, tzinfo=pytz.UTC))
+
+        with self.settings(EXPORT_SINCE_OVERLAP=300):
+            response = self.adminclient.get(
+                '{}?since=2018-02-01T00:00:00Z'.format(self.url))
+        self.assertEqual(
+            [r['id'] for r in self.get_rows(response)],
+            [str(late.pk), str(new.pk)])
+
+        response = self.adminclient.get('{}?since=yesterday'.format(self.url))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(), {'since': ["Must be an ISO 8601 timestamp"]})
+
+        response = self.adminclient.get(
+            '{}?since=yesterday&format=csv'.format(self.url))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(
+            response.json(), {'since': ["Must be an ISO 8601 timestamp"]})
+
+    def test_export_csv(self):
+        """
+        If CSV is requested, the registrations should be streamed as CSV, with
+        a header row
+        """
+        source = self.make_source_normaluser()
+        reg = Registration.objects.create(
+            source=source, reg_type='nurseconnect', data={'foo': 'bar'})
+
+        response = self.adminclient.get('{}?format=csv'.format(self.url))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(
+            response['Content-Disposition'],
+            'attachment; filename="registration.csv"')
+        [header, row] = csv.reader(
+            b''.join(response.streaming_content).decode().splitlines())
+        self.assertEqual(header, list(RegistrationSerializer.Meta.fields))
+        data = dict(zip(header, row))
+        self.assertEqual(data['id'], str(reg.pk))
+        self.assertEqual(data['external_id'], '')
+        self.assertEqual(data['validated'], 'false')
+        self.assertEqual(json.loads(data['data']), {'foo': 'bar'})
+        self.assertEqual(data['source'], str(source.pk))
+
+
+class ThirdPartyRegistrationAsyncViewTests(AuthenticatedAPITestCase):
+    data = {
+        'hcw_msisdn': '+27821112222',
+        'mom_msisdn': '+27824440000',
+        'mom_id_type': 'sa_id',
+        'mom_passport_origin': None,
+        'mom_lang': 'en',
+        'mom_edd': '2016-11-05',
+        'mom_id_no': '8108015001051',
+        'mom_dob': '1981-08-01',
+        'clinic_code': '123456',
+        'authority': 'chw',
+        'consent': True,
+    }
+
+    @mock.patch(
+        'registrations.views.resolve_third_party_registration_identities.'
+        'delay')
+    def test_respond_async(self, task):
+        """
+        If the client prefers an async response, the registration should be
+        created with its identities pending, and the status URL returned
+        """
+        self.make_external_source_partial()
+        response = self.partialclient.post(
+            '/api/v1/extregistration/', json.dumps(self.data),
+            content_type='application/json', HTTP_PREFER='respond-async')
+        self.assertEqual(response.status_code, 202)
+
+        [reg] = Registration.objects.all()
+        self.assertIsNone(reg.registrant_id)
+        self.assertEqual(reg.data['msisdn_device'], '+27821112222')
+        self.assertEqual(reg.data['identity_resolution'], {
+            'status': 'pending',
+            'authority': 'chw',
+        })
+        self.assertEqual(response.json()['status'], 'processing')
+        self.assertEqual(response['Preference-Applied'], 'respond-async')
+        self.assertEqual(
+            response['Location'],
+            'http://testserver/api/v1/extregistration/{}/'.format(reg.pk))
+        task.assert_called_once_with(registration_id=str(reg.pk))
+
+    def test_registration_status(self):
+        """
+        The status of the registration should be available at the status URL
+        """
+        reg = Registration.objects.create(
+            source=self.make_external_source_partial(),
+            created_by=self.partialuser, data={})
+
+        response = self.partialclient.get(
+            reverse('extregistration-status', args=[str(reg.pk)]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'processing')
+
+
 class PositionTrackerViewsetTests(AuthenticatedAPITestCase):
     def test_authentication_required(self):
         """
@@ -151,9 +373,8 @@ class PositionTrackerViewsetTests(AuthenticatedAPITestCase):
         """
         pt = PositionTracker.objects.create(label='test', position=1)
         # Ensure that it's older than 12 hours
-        [h] = pt.history.all()
-        h.history_date -= datetime.timedelta(hours=13)
-        h.save()
+        PositionTracker.objects.filter(pk=pt.pk).update(
+            modified_at=timezone.now() - datetime.timedelta(hours=13))
 
         url = reverse('positiontracker-increment-position', args=[str(pt.pk)])
         response = self.normalclient.post(url)
@@ -176,9 +397,8 @@ class PositionTrackerViewsetTests(AuthenticatedAPITestCase):
         """
         pt = PositionTracker.objects.create(label='test', position=1)
         # Ensure that it's older than 12 hours
-        [h] = pt.history.all()
-        h.history_date -= datetime.timedelta(hours=13)
-        h.save()
+        PositionTracker.objects.filter(pk=pt.pk).update(
+            modified_at=timezone.now() - datetime.timedelta(hours=13))
         self.normaluser.user_permissions.add(
             Permission.objects.get(name='Can increment the position'))
 
@@ -192,3 +412,25 @@ class PositionTrackerViewsetTests(AuthenticatedAPITestCase):
         self.assertEqual(response.status_code, 400)
         pt.refresh_from_db()
         self.assertEqual(pt.position, 2)
+
+    def test_increment_position_history(self):
+        """
+        Incrementing the position should record who incremented it in the
+        tracker's history
+        """
+        pt = PositionTracker.objects.create(label='test', position=1)
+        PositionTracker.objects.filter(pk=pt.pk).update(
+            modified_at=timezone.now() - datetime.timedelta(hours=13))
+        self.normaluser.user_permissions.add(
+            Permission.objects.get(name='Can increment the position'))
+
+        url = reverse('positiontracker-increment-position', args=[str(pt.pk)])
+        response = self.normalclient.post(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['position'], 2)
+
+        history = pt.history.first()
+        self.assertEqual(history.position, 2)
+        self.assertEqual(history.history_type, '~')
+        self.assertEqual(history.history_user, self.normaluser)
+        self.assertEqual(pt.history.count(), 2)
@@ -25,9 +25,11 @@ from requests_testadapter import TestAdapter, TestSession
 
 from .models import PositionTracker, Source, Registration, SubscriptionRequest
 from .signals import psh_validate_subscribe, psh_fire_created_metric
+from . import sources
 from .tasks import (
-    validate_subscribe, get_risk_status, remove_personally_identifiable_fields,
-    add_personally_identifiable_fields, push_nurse_registration_to_jembi)
+    validate_subscribe, get_risk_status, get_risk_statuses,
+    remove_personally_identifiable_fields, add_personally_identifiable_fields,
+    push_nurse_registration_to_jembi)
 from .tasks import PushRegistrationToJembi
 from ndoh_hub import utils, utils_tests
 
@@ -135,6 +137,97 @@ class TestUtils(TestCase):
         self.assertEqual(utils.get_baby_age(t, "2015-12-26"), 0)
         self.assertEqual(utils.get_baby_age(t, "2015-12-25"), 1)
 
+    def test_batch_dates(self):
+        """
+        The batch date calculations should give the same results as the
+        scalar functions, and None for dates that aren't valid
+        """
+        t = override_get_today()
+        dates = [
+            (t + timedelta(days=days)).strftime("%Y-%m-%d")
+            for days in range(-800, 400, 3)]
+        dates += dates[:10]
+
+        self.assertEqual(
+            utils.get_pregnancy_weeks(t, dates),
+            [utils.get_pregnancy_week(t, d) for d in dates])
+        self.assertEqual(
+            utils.get_baby_ages(t, dates),
+            [utils.get_baby_age(t, d) for d in dates])
+        self.assertEqual(
+            utils.get_mom_ages(t, dates),
+            [utils.get_mom_age(t, d) for d in dates])
+
+        self.assertEqual(
+            utils.get_pregnancy_weeks(t, ["2016-02-30", None, "2016-1-8"]),
+            [None, None, 39])
+        self.assertEqual(utils.get_baby_ages(t, ["1234"]), [None])
+        self.assertEqual(utils.get_mom_ages(t, [""]), [None])
+
+    def test_get_risk_statuses(self):
+        """
+        The batch risk statuses should be the same as get_risk_status
+        """
+        t = override_get_today()
+        rows = [
+            (reg_type, mom_dob, edd)
+            for reg_type in ("pmtct_prebirth", "whatsapp_pmtct_postbirth")
+            for mom_dob in ("1997-12-31", "1998-01-01", "1998-01-02")
+            for edd in ("2016-05-20", "2016-05-21", "2016-08-01")]
+        with mock.patch('ndoh_hub.utils.get_today', override_get_today):
+            expected = [get_risk_status(*row) for row in rows]
+        self.assertEqual(get_risk_statuses(t, *zip(*rows)), expected)
+        self.assertEqual(
+            get_risk_statuses(
+                t, ["pmtct_prebirth", "pmtct_postbirth"], [None, None],
+                ["2016-05-20", None]),
+            [None, "high"])
+
+    def test_get_messageset_short_names(self):
+        """
+        The batch short names should be the same as
+        get_messageset_short_name
+        """
+        rows = [
+            (reg_type, authority, weeks)
+            for reg_type in (
+                "pmtct_prebirth", "pmtct_postbirth", "momconnect_prebirth",
+                "whatsapp_prebirth", "nurseconnect", "loss_general")
+            for authority in ("hw_full", "hw_partial", "patient")
+            for weeks in range(-1, 45)]
+        self.assertEqual(
+            utils.get_messageset_short_names(*zip(*rows)),
+            [utils.get_messageset_short_name(*row) for row in rows])
+
+    @responses.activate
+    def test_get_messageset_schedule_sequences(self):
+        """
+        The batch sequence numbers should be the same as
+        get_messageset_schedule_sequence, looking up each messageset once
+        """
+        short_names = [
+            "pmtct_prebirth.patient.1", "pmtct_prebirth.patient.2",
+            "pmtct_prebirth.patient.3", "pmtct_postbirth.patient.1",
+            "pmtct_postbirth.patient.2", "momconnect_prebirth.hw_full.1",
+            "momconnect_prebirth.hw_full.2", "nurseconnect.hw_full.1"]
+        for short_name in short_names:
+            schedule_id = utils_tests.mock_get_messageset_by_shortname(
+                short_name)
+            utils_tests.mock_get_schedule(schedule_id)
+        rows = [
+            (short_name, weeks)
+            for short_name in short_names for weeks in range(0, 55)]
+
+        expected = [
+            utils.get_messageset_schedule_sequence(*row) for row in rows]
+        calls = len(responses.calls)
+        self.assertEqual(
+            utils.get_messageset_schedule_sequences(*zip(*rows)), expected)
+        self.assertEqual(
+            len(responses.calls) - calls,
+            len(short_names) + sum(
+                "prebirth" in short_name for short_name in short_names))
+
     def test_get_messageset_short_name(self):
         # any reg_type non-prebirth and non-postbirth
         self.assertEqual(
@@ -435,6 +528,7 @@ class APITestCase(TestCase):
         self.otherclient = APIClient()
         self.session = TestSession()
         utils.get_today = override_get_today
+        sources.clear_cache()
 
 
 class AuthenticatedAPITestCase(APITestCase):
@@ -2629,6 +2723,7 @@ class TestRegistrationCreation(AuthenticatedAPITestCase):
         # . check registration validated
         registration.refresh_from_db()
         self.assertEqual(registration.validated, True)
+        self.assertEqual(registration.data['risk_status'], 'high')
 
         # . check subscriptionrequest object
         sr = SubscriptionRequest.objects.last()
@@ -4083,25 +4178,31 @@ class TestMetricsAPI(AuthenticatedAPITestCase):
     def test_metrics_read(self):
         # Setup
         self.make_source_normaluser()
-        self.make_source_adminuser()
+        source = self.make_source_adminuser()
         # Execute
         response = self.adminclient.get(
             '/api/metrics/', content_type='application/json')
         # Check
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(
-            sorted(response.data["metrics_available"]), sorted([
-                'registrations.created.sum',
-            ])
-        )
+        metrics = response.data["metrics_available"]
+        self.assertIn('registrations.created.sum', metrics)
+        self.assertIn(
+            'registrations.type.momconnect_prebirth.total.last', metrics)
+        self.assertIn(
+            'registrations.source.%s.total.last' % source.pk, metrics)
+        self.assertIn('registrations.validation_failure_rate.last', metrics)
+        self.assertIn('changes.pending.last', metrics)
+        self.assertIn('jembi.backlog.last', metrics)
+        self.assertIn(
+            'scheduled_metrics.jembi_backlog.compute_time.last', metrics)
 
     @responses.activate
-    def test_post_metrics(self):
+    @mock.patch('ndoh_hub.scheduled_metrics.get_queue_length')
+    def test_post_metrics(self, get_queue_length):
         # Setup
-        # deactivate Testsession for this test
-        self.session = None
+        get_queue_length.return_value = 3
         responses.add(responses.POST,
-                      "http://metrics-url/metrics/",
+                      "http://metrics/api/v1/metrics/",
                       json={"foo": "bar"},
                       status=200, content_type='application/json')
         # Execute
@@ -4110,6 +4211,11 @@ class TestMetricsAPI(AuthenticatedAPITestCase):
         # Check
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(response.data["scheduled_metrics_initiated"], True)
+        # All the scheduled metrics are fired in a single request
+        [call] = responses.calls
+        metrics = json.loads(call.request.body)
+        self.assertEqual(metrics['jembi.backlog.last'], 3)
+        self.assertEqual(metrics['changes.pending.last'], 0)
 
 
 class TestMetrics(AuthenticatedAPITestCase):
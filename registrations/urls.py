@@ -14,14 +14,23 @@ router.register(r'position_tracker', views.PositionTrackerViewset)
 # Additionally, we include login URLs for the browseable API.
 urlpatterns = [
     url(r'^api/v1/registration/', views.RegistrationPost.as_view()),
+    url(r'^api/v1/extregistration/(?P<registration_id>[^/]+)/$',
+        views.ThirdPartyRegistrationStatus.as_view(),
+        name='extregistration-status'),
     url(r'^api/v1/extregistration/', views.ThirdPartyRegistration.as_view()),
     url(r'^api/v1/jembiregistration/$', views.JembiAppRegistration.as_view()),
+    url(r'^api/v1/jembiregistration/status/$',
+        views.JembiAppRegistrationBatchStatus.as_view(),
+        name='jembiregistration-batch-status'),
     url(r'^api/v1/jembiregistration/(?P<registration_id>[^/]+)/$',
         views.JembiAppRegistrationStatus.as_view()),
     url(r'^api/v1/jembi/helpdesk/outgoing/$',
         views.JembiHelpdeskOutgoingView.as_view(),
         name='jembi-helpdesk-outgoing'),
+    url(r'^api/v1/feed/$', views.FeedView.as_view(), name='feed'),
     url(r'^api/v1/user/token/$', views.UserView.as_view(),
         name='create-user-token'),
+    url(r'^api/v1/registrations/export/$', views.RegistrationExport.as_view(),
+        name='registrations-export'),
     url(r'^api/v1/', include(router.urls)),
 ]
@@ -0,0 +1,98 @@
+"""
+The validation schema of the registration data, for each reg_type
+"""
+from ndoh_hub import utils
+from ndoh_hub.validation import (
+    Attribute, Invalid, Required, Schema, When, check, is_date,
+    is_not_future_date, is_valid_edd)
+
+LANGUAGE = Required(
+    'language', "Language is missing from data",
+    (check(utils.is_valid_lang), "Language not a valid option"))
+MOM_DOB = Required(
+    'mom_dob', "Mother DOB missing", (is_date, "Mother DOB invalid"))
+EDD = Required(
+    'edd', "Estimated Due Date missing",
+    (is_valid_edd, "Estimated Due Date invalid"))
+BABY_DOB = Required(
+    'baby_dob', "Baby Date of Birth missing",
+    (is_date, "Baby Date of Birth invalid"),
+    (is_not_future_date, "Baby Date of Birth cannot be in the future"))
+OPERATOR_ID = Required(
+    'operator_id', "Operator ID missing",
+    (check(utils.is_valid_uuid), "Operator ID invalid"))
+MSISDN_REGISTRANT = Required(
+    'msisdn_registrant', "MSISDN of Registrant missing",
+    (check(utils.is_valid_msisdn), "MSISDN of Registrant invalid"))
+MSISDN_DEVICE = Required(
+    'msisdn_device', "MSISDN of device missing",
+    (check(utils.is_valid_msisdn), "MSISDN of device invalid"))
+FACCODE = Required(
+    'faccode', "Facility (clinic) code missing",
+    (check(utils.is_valid_faccode), "Facility code invalid"))
+CONSENT = Required(
+    'consent', "Consent is missing",
+    (lambda value, today: value is True, "Cannot continue without consent"))
+ID = Required(
+    'id_type', "ID type missing",
+    (check(utils.is_valid_id_type),
+     "ID type should be one of {}".format(utils.ID_TYPES)),
+    cases={
+        'sa_id': [
+            Required(
+                'sa_id_no', "SA ID number missing",
+                (check(utils.is_valid_sa_id_no), "SA ID number invalid")),
+            MOM_DOB,
+        ],
+        'passport': [
+            Required(
+                'passport_no', "Passport number missing",
+                (check(utils.is_valid_passport_no),
+                 "Passport number invalid")),
+            Required(
+                'passport_origin', "Passport origin missing",
+                (check(utils.is_valid_passport_origin),
+                 "Passport origin invalid")),
+        ],
+        'none': [MOM_DOB],
+    })
+
+
+def has_authority(*authorities):
+    return lambda registration: registration.source.authority in authorities
+
+
+PMTCT_PREBIRTH = [LANGUAGE, MOM_DOB, EDD, OPERATOR_ID]
+PMTCT_POSTBIRTH = [LANGUAGE, MOM_DOB, BABY_DOB, OPERATOR_ID]
+NURSECONNECT = [
+    FACCODE, OPERATOR_ID, MSISDN_REGISTRANT, MSISDN_DEVICE, LANGUAGE]
+MOMCONNECT_PREBIRTH = [
+    # Checks that apply to clinic, chw, public
+    OPERATOR_ID, MSISDN_REGISTRANT, MSISDN_DEVICE, LANGUAGE, CONSENT,
+    # Checks that apply to clinic, chw
+    When(has_authority('hw_full', 'hw_partial'), ID),
+    # Checks that apply to clinic only
+    When(has_authority('hw_full'), EDD, FACCODE),
+]
+
+schema = Schema(
+    'reg_type',
+    common=[
+        Attribute(
+            'registrant_id', utils.is_valid_uuid,
+            "Invalid UUID registrant_id"),
+    ],
+    types={
+        'pmtct_prebirth': PMTCT_PREBIRTH,
+        'whatsapp_pmtct_prebirth': PMTCT_PREBIRTH,
+        'pmtct_postbirth': PMTCT_POSTBIRTH,
+        'whatsapp_pmtct_postbirth': PMTCT_POSTBIRTH,
+        'nurseconnect': NURSECONNECT,
+        'whatsapp_nurseconnect': NURSECONNECT,
+        'momconnect_prebirth': MOMCONNECT_PREBIRTH,
+        'whatsapp_prebirth': MOMCONNECT_PREBIRTH,
+        'momconnect_postbirth': [
+            Invalid('reg_type', "Momconnect postbirth not yet supported")],
+        'loss_general': [
+            Invalid('reg_type', "Loss general not yet supported")],
+    })
@@ -4,6 +4,7 @@ import django_filters.rest_framework as filters
 import json
 import requests
 import logging
+import uuid
 try:
     from urlparse import urljoin
 except ImportError:
@@ -12,13 +13,15 @@ except ImportError:
 from django.conf import settings
 from django.contrib.auth.models import User, Group
 from django.core.exceptions import PermissionDenied, ValidationError
+from django.db.models import Q
 from django.http import Http404
 from django.shortcuts import get_object_or_404
-from django.utils import timezone
+from django.urls import reverse
 
 from rest_hooks.models import Hook
 from rest_framework import viewsets, mixins, generics, status
 from rest_framework.decorators import detail_route
+from rest_framework.exceptions import ValidationError as DRFValidationError
 from rest_framework.pagination import CursorPagination
 from rest_framework.permissions import (
     IsAuthenticated, IsAdminUser, DjangoModelPermissions)
@@ -27,17 +30,26 @@ from rest_framework.authtoken.models import Token
 from rest_framework.response import Response
 from rest_framework.request import Request
 from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.urls import replace_query_param
 
-from seed_services_client.identity_store import IdentityStoreApiClient
+from . import feed, positions
 from .models import Source, Registration, PositionTracker
+from .sources import get_source
 from .serializers import (UserSerializer, GroupSerializer,
                           SourceSerializer, RegistrationSerializer,
                           HookSerializer, CreateUserSerializer,
                           JembiHelpdeskOutgoingSerializer,
                           ThirdPartyRegistrationSerializer,
                           JembiAppRegistrationSerializer,
-                          PositionTrackerSerializer)
-from .tasks import validate_subscribe_jembi_app_registration
+                          PositionTrackerSerializer, FeedEventSerializer,
+                          FeedQuerySerializer)
+from .tasks import (validate_subscribe_jembi_app_registration,
+                    resolve_third_party_registration_identities,
+                    resolve_third_party_identities)
+from ndoh_hub.clients import get_client
+from ndoh_hub.export import StreamingExportView
+from ndoh_hub.health import get_health
+from ndoh_hub.scheduled_metrics import scheduled_metrics
 from ndoh_hub.utils import get_available_metrics
 
 
@@ -158,7 +170,7 @@ class RegistrationPost(mixins.CreateModelMixin, generics.GenericAPIView):
 
     def post(self, request, *args, **kwargs):
         # load the users sources - posting users should only have one source
-        source = Source.objects.get(user=self.request.user)
+        source = get_source(self.request.user.id)
         request.data["source"] = source.id
         return self.create(request, *args, **kwargs)
 
@@ -194,6 +206,15 @@ class RegistrationGetViewSet(viewsets.ReadOnlyModelViewSet):
     pagination_class = CreatedAtCursorPagination
 
 
+class RegistrationExport(StreamingExportView):
+    """ API endpoint that streams all of the Registrations matching the
+    filters, as NDJSON or CSV.
+    """
+    queryset = Registration.objects.all()
+    filter_class = RegistrationFilter
+    export_fields = RegistrationSerializer.Meta.fields
+
+
 class JembiHelpdeskOutgoingView(APIView):
     """ API endpoint that allows the helpdesk to post messages to Jembi
     """
@@ -265,7 +286,7 @@ class JembiHelpdeskOutgoingView(APIView):
         post_data = self.build_jembi_helpdesk_json(serializer.validated_data)
         try:
 
-            source = Source.objects.get(user=self.request.user.id)
+            source = get_source(self.request.user.id)
 
             endpoint = 'helpdesk'
             if source.name == 'NURSE Helpdesk App':
@@ -298,171 +319,119 @@ class JembiHelpdeskOutgoingView(APIView):
 class HealthcheckView(APIView):
 
     """ Healthcheck Interaction
-        GET - returns service up - getting auth'd requires DB
+        GET - returns the health of the service and of each of its
+        dependencies, with a 503 status if the service is unhealthy
     """
     permission_classes = (IsAuthenticated,)
 
     def get(self, request, *args, **kwargs):
-        status = 200
-        resp = {
-            "up": True,
-            "result": {
-                "database": "Accessible"
-            }
-        }
-        return Response(resp, status=status)
+        health = get_health()
+        status = 200 if health["up"] else 503
+        return Response(health, status=status)
 
 
 class ThirdPartyRegistration(APIView):
+    """
+    MomConnect prebirth registrations from third parties.
+
+    By default the identities are resolved on the Identity Store before
+    responding. If the request has a `Prefer: respond-async` header, then the
+    registration is accepted straight away, the identities are resolved in the
+    background, and the status can be fetched from the returned Location.
+    """
     permission_classes = (IsAuthenticated,)
 
+    @staticmethod
+    def get_source_authority(authority):
+        # load the users sources with authority mapping
+        if authority == 'chw':
+            return 'hw_partial'
+        elif authority == 'clinic':
+            return 'hw_full'
+        return 'patient'
+
+    @staticmethod
+    def get_registration_data(validated_data):
+        id_type = validated_data['mom_id_type']
+        reg_data = {
+            'operator_id': None,
+            'msisdn_registrant': validated_data['mom_msisdn'],
+            'msisdn_device': validated_data['hcw_msisdn'],
+            'id_type': id_type,
+            'language': transform_language_code(validated_data['mom_lang']),
+            'mom_dob': validated_data['mom_dob'],
+            'edd': validated_data['mom_edd'],
+            'faccode': validated_data['clinic_code'],
+            'consent': validated_data['consent'],
+            'mha': validated_data.get('mha', 1),
+            'swt': validated_data.get('swt', 1),
+        }
+        if 'encdate' in validated_data:
+            reg_data['encdate'] = validated_data['encdate']
+        if id_type == 'sa_id':
+            reg_data['sa_id_no'] = validated_data['mom_id_no']
+        elif id_type == 'passport':
+            reg_data['passport_origin'] = (
+                validated_data['mom_passport_origin'])
+            reg_data['passport_no'] = validated_data['mom_id_no']
+        return reg_data
+
+    @staticmethod
+    def prefers_async(request):
+        preferences = request.META.get('HTTP_PREFER', '').split(',')
+        return 'respond-async' in (p.strip() for p in preferences)
+
     def post(self, request):
-        is_client = IdentityStoreApiClient(
-            api_url=settings.IDENTITY_STORE_URL,
-            auth_token=settings.IDENTITY_STORE_TOKEN
-        )
         serializer = ThirdPartyRegistrationSerializer(data=request.data)
-        if serializer.is_valid():
-            mom_msisdn = serializer.validated_data['mom_msisdn']
-            hcw_msisdn = serializer.validated_data['hcw_msisdn']
-            lang_code = serializer.validated_data['mom_lang']
-            lang_code = transform_language_code(lang_code)
-            authority = serializer.validated_data['authority']
-            # load the users sources with authority mapping
-            if authority == 'chw':
-                source_auth = 'hw_partial'
-            elif authority == 'clinic':
-                source_auth = 'hw_full'
-            else:
-                source_auth = 'patient'
-            source = Source.objects.get(user=self.request.user,
-                                        authority=source_auth)
-            if mom_msisdn != hcw_msisdn:
-                # Get or create HCW Identity
-                result = list(is_client.get_identity_by_address(
-                        'msisdn', hcw_msisdn)['results'])
-                if len(result) < 1:
-                    identity = {
-                        'details': {
-                            'default_addr_type': 'msisdn',
-                            'addresses': {
-                                'msisdn': {
-                                    hcw_msisdn: {'default': True}
-                                }
-                            }
-                        }
-                    }
-                    hcw_identity = is_client.create_identity(identity)
-                else:
-                    hcw_identity = result[0]
-            else:
-                hcw_identity = None
-
-            id_type = serializer.validated_data['mom_id_type']
-            if hcw_identity is not None:
-                operator = hcw_identity['id']
-                device = hcw_msisdn
-            else:
-                operator = None
-                device = mom_msisdn
-
-            # auth: chw, clinic,
-            # Get or create Mom Identity
-            result = list(is_client.get_identity_by_address(
-                    'msisdn', mom_msisdn)['results'])
-            if len(result) < 1:
-                identity = {
-                    'details': {
-                        'default_addr_type': 'msisdn',
-                        'addresses': {
-                            'msisdn': {
-                                mom_msisdn: {'default': True}
-                            }
-                        },
-                        'operator_id': operator,
-                        'lang_code': lang_code,
-                        'id_type': id_type,
-                        'mom_dob': serializer.validated_data['mom_dob'],
-                        'last_edd': serializer.validated_data['mom_edd'],
-                        'faccode': serializer.validated_data['clinic_code'],
-                        'consent': serializer.validated_data['consent'],
-                        'last_mc_reg_on': authority,
-                        'source': 'external',
-                    },
-                }
-                if id_type == 'sa_id':
-                    identity['details']['sa_id_no'] = (
-                        serializer.validated_data['mom_id_no'])
-                elif id_type == 'passport':
-                    identity['details']['passport_origin'] = (
-                        serializer.validated_data['mom_passport_origin'])
-                    identity['details']['passport_no'] = (
-                        serializer.validated_data['mom_id_no'])
-                mom_identity = is_client.create_identity(identity)
-            else:
-                mom_identity = result[0]
-                # Update Seed Identity record
-                details = mom_identity['details']
-                details['operator_id'] = operator
-                details['lang_code'] = lang_code
-                details['id_type'] = id_type
-                details['mom_dob'] = serializer.validated_data['mom_dob']
-                details['last_edd'] = serializer.validated_data['mom_edd']
-                details['faccode'] = serializer.validated_data['clinic_code']
-                details['consent'] = serializer.validated_data['consent']
-                details['last_mc_reg_on'] = authority
-                details['source'] = 'external'
-                if id_type == 'sa_id':
-                    details['sa_id_no'] = (
-                        serializer.validated_data['mom_id_no'])
-                elif id_type == 'passport':
-                    details['passport_origin'] = (
-                        serializer.validated_data['mom_passport_origin'])
-                    details['passport_no'] = (
-                        serializer.validated_data['mom_id_no'])
-                mom_identity['details'] = details
-                result = is_client.update_identity(mom_identity['id'],
-                                                   data=mom_identity)
-                # update_identity returns the object directly as JSON
-                mom_identity = result
-
-            # Create registration
-            reg_data = {
-                'operator_id': operator,
-                'msisdn_registrant': mom_msisdn,
-                'msisdn_device': device,
-                'id_type': id_type,
-                'language': lang_code,
-                'mom_dob': serializer.validated_data['mom_dob'],
-                'edd': serializer.validated_data['mom_edd'],
-                'faccode': serializer.validated_data['clinic_code'],
-                'consent': serializer.validated_data['consent'],
-                'mha': serializer.validated_data.get('mha', 1),
-                'swt': serializer.validated_data.get('swt', 1),
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        authority = serializer.validated_data['authority']
+        source = get_source(
+            self.request.user.id,
+            authority=self.get_source_authority(authority))
+        reg_data = self.get_registration_data(serializer.validated_data)
+
+        if self.prefers_async(request):
+            reg_data['identity_resolution'] = {
+                'status': 'pending',
+                'authority': authority,
             }
-            if 'encdate' in serializer.validated_data:
-                reg_data['encdate'] = serializer.validated_data['encdate']
-            if id_type == 'sa_id':
-                reg_data['sa_id_no'] = (
-                    serializer.validated_data['mom_id_no'])
-            elif id_type == 'passport':
-                reg_data['passport_origin'] = (
-                    serializer.validated_data['mom_passport_origin'])
-                reg_data['passport_no'] = (
-                    serializer.validated_data['mom_id_no'])
             reg = Registration.objects.create(
                 reg_type='momconnect_prebirth',
-                registrant_id=mom_identity['id'],
+                registrant_id=None,
                 source=source,
                 data=reg_data,
                 created_by=self.request.user,
                 updated_by=self.request.user
             )
-            reg_serializer = RegistrationSerializer(instance=reg)
+            resolve_third_party_registration_identities.delay(
+                registration_id=str(reg.pk))
+            location = request.build_absolute_uri(reverse(
+                'extregistration-status', args=[str(reg.pk)]))
             return Response(
-                reg_serializer.data, status=status.HTTP_201_CREATED)
-
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+                reg.status, status=status.HTTP_202_ACCEPTED, headers={
+                    'Location': location,
+                    'Preference-Applied': 'respond-async',
+                })
+
+        is_client = get_client('identity_store')
+        operator, mom_identity = resolve_third_party_identities(
+            is_client, reg_data, authority)
+        reg_data['operator_id'] = operator
+
+        reg = Registration.objects.create(
+            reg_type='momconnect_prebirth',
+            registrant_id=mom_identity['id'],
+            source=source,
+            data=reg_data,
+            created_by=self.request.user,
+            updated_by=self.request.user
+        )
+        reg_serializer = RegistrationSerializer(instance=reg)
+        return Response(
+            reg_serializer.data, status=status.HTTP_201_CREATED)
 
 
 class JembiAppRegistration(APIView):
@@ -474,7 +443,7 @@ class JembiAppRegistration(APIView):
 
     @classmethod
     def create_registration(cls, user: User, data: dict) -> Registration:
-        source = Source.objects.get(user=user)
+        source = get_source(user.id)
         serializer = cls.serializer_class(data=data)
         serializer.is_valid(raise_exception=True)
 
@@ -527,12 +496,80 @@ class JembiAppRegistrationStatus(APIView):
             raise PermissionDenied()
         return reg
 
+    @classmethod
+    def get_registrations(cls, reg_ids: list) -> dict:
+        """
+        Looks up multiple registrations by either their external or internal
+        ID in a single query. Returns a dict of the given ID to the
+        registration, for the registrations that were found. Permissions are
+        left to the caller to check.
+        """
+        external_ids = set(reg_ids)
+        uuids = {}
+        for reg_id in external_ids:
+            try:
+                uuids[uuid.UUID(reg_id)] = reg_id
+            except (TypeError, ValueError, AttributeError):
+                pass
+
+        query = Q(external_id__in=external_ids)
+        if uuids:
+            query |= Q(id__in=uuids)
+
+        found = {}
+        by_id = {}
+        for reg in Registration.objects.filter(query):
+            if reg.external_id in external_ids:
+                found[reg.external_id] = reg
+            if reg.id in uuids:
+                by_id[uuids[reg.id]] = reg
+        # Like get_registration, external IDs take precedence
+        for reg_id, reg in by_id.items():
+            found.setdefault(reg_id, reg)
+        return found
+
     def get(self, request: Request, registration_id: str) -> Response:
         registration = self.get_registration(
             request.user, registration_id)
         return Response(registration.status, status=status.HTTP_200_OK)
 
 
+class JembiAppRegistrationBatchStatus(generics.GenericAPIView):
+    """
+    Status of multiple registrations, given by their external IDs in the
+    `external_id` query parameter, either repeated or comma separated.
+    Registrations that don't exist, or that were created by another user, are
+    left out of the results.
+    """
+    permission_classes = (IsAuthenticated,)
+    pagination_class = CreatedAtCursorPagination
+
+    def get_external_ids(self) -> list:
+        external_ids = [
+            external_id
+            for value in self.request.query_params.getlist('external_id')
+            for external_id in value.split(',') if external_id]
+        if not external_ids:
+            raise DRFValidationError({
+                'external_id': ["This field is required."]})
+        return external_ids
+
+    def get_queryset(self):
+        return Registration.objects.filter(
+            created_by=self.request.user,
+            external_id__in=self.get_external_ids())
+
+    def get(self, request: Request) -> Response:
+        page = self.paginate_queryset(self.get_queryset())
+        return self.get_paginated_response(Registration.get_statuses(page))
+
+
+class ThirdPartyRegistrationStatus(JembiAppRegistrationStatus):
+    """
+    Status of asynchronously accepted third party registrations
+    """
+
+
 class MetricsView(APIView):
 
     """ Metrics Interaction
@@ -550,8 +587,7 @@ class MetricsView(APIView):
 
     def post(self, request, *args, **kwargs):
         status = 201
-        # Uncomment line below if scheduled metrics are added
-        # scheduled_metrics.apply_async()
+        scheduled_metrics.apply_async()
         resp = {"scheduled_metrics_initiated": True}
         return Response(resp, status=status)
 
@@ -583,17 +619,46 @@ class PositionTrackerViewset(
         an update once every 12 hours to avoid retried HTTP requests
         incrementing the position more than once
         """
-        position_tracker = self.get_object()
-
-        time_difference = timezone.now() - position_tracker.modified_at
-        if time_difference < datetime.timedelta(hours=12):
+        position_tracker = positions.increment_position(
+            self.get_object().label, datetime.timedelta(hours=12),
+            user=request.user)
+        if position_tracker is None:
             return Response({
                 "error": "The position may only be incremented once every 12 "
                          "hours",
                 }, status=status.HTTP_400_BAD_REQUEST)
 
-        position_tracker.position += 1
-        position_tracker.save(update_fields=('position',))
-
         serializer = self.get_serializer(instance=position_tracker)
         return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class FeedView(APIView):
+    """
+    API endpoint for the change feed of registrations, changes, and
+    subscription requests.
+
+    Returns up to `limit` events after the sequence `after`, optionally only
+    for the models given by `model`. If there are no new events, waits for up
+    to `timeout` seconds for some, so that consumers can long poll. `next` is
+    the URL for the events after these.
+    """
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request: Request) -> Response:
+        query = FeedQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        limit = min(
+            params.get('limit', settings.FEED_PAGE_SIZE),
+            settings.FEED_PAGE_SIZE)
+        timeout = min(params['timeout'], settings.FEED_LONG_POLL_TIMEOUT)
+        events = feed.wait_for_events(
+            params['after'], limit, params.get('model'), timeout)
+
+        after = events[-1].sequence if events else params['after']
+        return Response({
+            'next': replace_query_param(
+                request.build_absolute_uri(), 'after', after),
+            'results': FeedEventSerializer(events, many=True).data,
+        })
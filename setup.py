@@ -32,6 +32,8 @@ setup(
         'channels==2.0.2',
         'channels_redis==2.1.0',
         'django-simple-history==2.0',
+        'gevent==1.2.2',
+        'psycogreen==1.0',
     ],
     classifiers=[
         'Development Status :: 4 - Beta',